@@ -0,0 +1,23 @@
+"""
+Gunicorn hooks (picked up automatically from the working directory).
+
+With PROMETHEUS_MULTIPROC_DIR set, every worker writes its metrics to files
+in that directory (see queueing/metrics.py). Start each run with an empty
+directory, and drop a dead worker's live gauges so they stop counting.
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,20 @@
+"""
+Settings for ``manage.py test``: the base settings plus a stand-in read
+replica for ReplicaRoutingTests, a separate un-replicated database (in
+memory, like every SQLite test database). Reads only go to it while a test
+lists it in DATABASE_REPLICAS. Log records still go through the JSON-lines
+pipeline but are written to the null device, not the test runner's stderr.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    **DATABASES,
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+    },
+}
+
+LOGGING['handlers']['jsonlines']['path'] = os.devnull
@@ -2,7 +2,6 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
-from rest_framework_simplejwt.views import TokenRefreshView
 
 from queueing.auth_views import (
     LoginView, LogoutView, ProfileView, RegisterView,
@@ -15,16 +14,20 @@ from queueing.patient_views import (
 )
 from queueing.payment_views import (
     InitiatePaymentView, VerifyPaymentView, PaymentStatusView,
-    PaymentHistoryView
+    PaymentHistoryView, PaymentWebhookView
 )
 from queueing.admin_views import (
     AdminAppointmentsListView, AdminAppointmentDetailView,
     AdminUpdateAppointmentStatusView, AdminDashboardStatsView,
-    AdminPatientsListView, AdminRegisterPatientView, AdminPatientDetailView
+    AdminPatientsListView, AdminRegisterPatientView, AdminPatientDetailView,
+    AdminExportView
 )
+from queueing.metrics import metrics_view
+from queueing.token_blacklist import TokenRefreshView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
 
     # ─── Auth endpoints (Original - for hospital admin) ───
     path('api/auth/register/', RegisterView.as_view(), name='auth-register'),
@@ -51,6 +54,7 @@ urlpatterns = [
     path('api/patient/payment/verify/', VerifyPaymentView.as_view(), name='payment-verify'),
     path('api/patient/payment/status/<str:transaction_id>/', PaymentStatusView.as_view(), name='payment-status'),
     path('api/patient/payment/history/', PaymentHistoryView.as_view(), name='payment-history'),
+    path('api/payment/webhook/<str:gateway>/', PaymentWebhookView.as_view(), name='payment-webhook'),
     
     # ─── Admin endpoints ───
     path('api/admin/appointments/', AdminAppointmentsListView.as_view(), name='admin-appointments'),
@@ -60,6 +64,7 @@ urlpatterns = [
     path('api/admin/patients/', AdminPatientsListView.as_view(), name='admin-patients'),
     path('api/admin/patients/register/', AdminRegisterPatientView.as_view(), name='admin-register-patient'),
     path('api/admin/patients/<int:patient_id>/', AdminPatientDetailView.as_view(), name='admin-patient-detail'),
+    path('api/admin/export/<str:dataset>/', AdminExportView.as_view(), name='admin-export'),
 
     # ─── App API ───
     path('api/', include('queueing.urls')),
@@ -4,7 +4,9 @@ import sys
 
 
 def main():
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_queue.settings')
+    # Tests add a stand-in read replica (hospital_queue/settings_test.py)
+    default_settings = 'hospital_queue.settings_test' if sys.argv[1:2] == ['test'] else 'hospital_queue.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     from django.core.management import execute_from_command_line
     execute_from_command_line(sys.argv)
 
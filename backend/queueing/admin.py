@@ -1,9 +1,10 @@
 from django.contrib import admin
 
-from .models import AppointmentSlot, Bed, Department, Hospital, QueueEntry
+from .models import AppointmentSlot, Bed, Department, Hospital, QueueEntry, QueueEntryArchive
 
 admin.site.register(Hospital)
 admin.site.register(Department)
 admin.site.register(Bed)
 admin.site.register(QueueEntry)
+admin.site.register(QueueEntryArchive)
 admin.site.register(AppointmentSlot)
@@ -5,8 +5,13 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Q, Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 
+from . import exports
+from .hashing import HashingBusy, make_password
 from .models import Appointment, User
 from .serializers import AppointmentSerializer, AppointmentDetailSerializer
 
@@ -27,9 +32,7 @@ class AdminAppointmentsListView(APIView):
         hospital_id = request.query_params.get('hospital_id')
         date_str = request.query_params.get('date')
         
-        appointments = Appointment.objects.select_related(
-            'patient', 'hospital', 'department', 'appointment_slot'
-        ).all()
+        appointments = AppointmentDetailSerializer.setup_eager_loading(Appointment.objects.all(), request)
         
         if status_filter:
             appointments = appointments.filter(status=status_filter)
@@ -47,7 +50,7 @@ class AdminAppointmentsListView(APIView):
         
         appointments = appointments.order_by('-created_at')
         
-        serializer = AppointmentDetailSerializer(appointments, many=True)
+        serializer = AppointmentDetailSerializer(appointments, many=True, context={'request': request})
         return Response(serializer.data)
 
 
@@ -57,15 +60,15 @@ class AdminAppointmentDetailView(APIView):
     
     def get(self, request, appointment_id):
         try:
-            appointment = Appointment.objects.select_related(
-                'patient', 'hospital', 'department', 'appointment_slot'
+            appointment = AppointmentDetailSerializer.setup_eager_loading(
+                Appointment.objects.all(), request
             ).get(id=appointment_id)
         except Appointment.DoesNotExist:
             return Response({
                 'error': 'Appointment not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = AppointmentDetailSerializer(appointment)
+        serializer = AppointmentDetailSerializer(appointment, context={'request': request})
         return Response(serializer.data)
 
 
@@ -75,7 +78,9 @@ class AdminUpdateAppointmentStatusView(APIView):
     
     def patch(self, request, appointment_id):
         try:
-            appointment = Appointment.objects.get(id=appointment_id)
+            appointment = AppointmentDetailSerializer.setup_eager_loading(
+                Appointment.objects.all()
+            ).get(id=appointment_id)
         except Appointment.DoesNotExist:
             return Response({
                 'error': 'Appointment not found'
@@ -187,7 +192,10 @@ class AdminPatientsListView(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        patients = User.objects.filter(role='patient').order_by('-date_joined')
+        patients = User.objects.filter(role='patient').annotate(
+            total_appointments=Count('appointments'),
+            completed_appointments=Count('appointments', filter=Q(appointments__status='completed')),
+        ).order_by('-date_joined')
         
         return Response([
             {
@@ -196,8 +204,8 @@ class AdminPatientsListView(APIView):
                 'email': p.email,
                 'role': p.role,
                 'date_joined': p.date_joined,
-                'total_appointments': p.appointments.count() if hasattr(p, 'appointments') else 0,
-                'completed_appointments': p.appointments.filter(status='completed').count() if hasattr(p, 'appointments') else 0,
+                'total_appointments': p.total_appointments,
+                'completed_appointments': p.completed_appointments,
             }
             for p in patients
         ])
@@ -242,10 +250,9 @@ class AdminRegisterPatientView(APIView):
             user = User.objects.create(
                 username=username,
                 email=email,
-                role='patient'
+                role='patient',
+                password=make_password(password)
             )
-            user.set_password(password)
-            user.save()
             
             # Optionally create an appointment if details are provided
             appointment = None
@@ -284,6 +291,8 @@ class AdminRegisterPatientView(APIView):
                 'appointment': appointment_data
             }, status=status.HTTP_201_CREATED)
             
+        except HashingBusy:
+            raise
         except Exception as e:
             return Response({
                 'error': f'Failed to register patient: {str(e)}'
@@ -303,16 +312,20 @@ class AdminPatientDetailView(APIView):
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Get all appointments for this patient
-        appointments = Appointment.objects.filter(
-            patient=patient
-        ).select_related(
-            'hospital', 'department', 'appointment_slot'
+        appointments = AppointmentDetailSerializer.setup_eager_loading(
+            Appointment.objects.filter(patient=patient)
         ).order_by('-created_at')
         
-        # Calculate statistics
-        total_spent = sum(
-            a.payment_amount for a in appointments.filter(payment_status='paid')
+        # Calculate statistics in one pass over the patient's appointments
+        stats = Appointment.objects.filter(patient=patient).aggregate(
+            total_appointments=Count('pk'),
+            **{
+                state: Count('pk', filter=Q(status=state))
+                for state in ('confirmed', 'in_progress', 'completed', 'cancelled', 'pending_payment')
+            },
+            total_spent=Sum('payment_amount', filter=Q(payment_status='paid')),
         )
+        total_spent = stats.pop('total_spent') or 0
         
         return Response({
             'patient': {
@@ -324,14 +337,58 @@ class AdminPatientDetailView(APIView):
                 'last_login': patient.last_login,
             },
             'statistics': {
-                'total_appointments': appointments.count(),
-                'confirmed': appointments.filter(status='confirmed').count(),
-                'in_progress': appointments.filter(status='in_progress').count(),
-                'completed': appointments.filter(status='completed').count(),
-                'cancelled': appointments.filter(status='cancelled').count(),
-                'pending_payment': appointments.filter(status='pending_payment').count(),
+                **stats,
                 'total_spent': float(total_spent),
             },
             'appointments': AppointmentDetailSerializer(appointments, many=True).data
         })
 
+
+class AdminExportView(APIView):
+    """
+    Stream a dataset (appointments, payments, queue, queue_history) as NDJSON
+    or CSV.
+
+    Query params: output=ndjson|csv, hospital_id, start, end (YYYY-MM-DD or
+    ISO datetime), status, gzip=1. Rows are sent as they are read, so the
+    export can be any size. ``output`` rather than ``format``, which DRF
+    reserves for renderer selection.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, dataset):
+        spec = exports.DATASETS.get(dataset)
+        if spec is None:
+            return Response({
+                'error': f'Unknown dataset. Choose from: {", ".join(exports.DATASETS)}'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        output = request.query_params.get('output', 'ndjson')
+        if output not in exports.FORMATS:
+            return Response({
+                'error': f'output must be one of: {", ".join(exports.FORMATS)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start = request.query_params.get('start')
+            end = request.query_params.get('end')
+            queryset = spec.queryset(
+                hospital=request.query_params.get('hospital_id'),
+                start=start and exports.parse_bound(start),
+                end=end and exports.parse_bound(end, end=True),
+                status=request.query_params.get('status'),
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+        filename = f'{dataset}-{timezone.localdate():%Y%m%d}.{output}' + ('.gz' if gzip else '')
+        chunks = exports.stream(spec, queryset, output=output, gzip=gzip)
+        if isinstance(request._request, ASGIRequest):
+            chunks = exports.aiter_chunks(chunks)
+        response = StreamingHttpResponse(
+            chunks,
+            content_type='application/gzip' if gzip else exports.FORMATS[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -10,3 +10,5 @@ class QueueingConfig(AppConfig):
         from . import signals  # noqa: F401
         # Import MongoDB sync signal handlers
         from . import mongo_sync  # noqa: F401
+        # Register the rate-limit cache system check
+        from . import throttling  # noqa: F401
@@ -0,0 +1,71 @@
+"""
+Hot/cold split of the queue: finished entries move to QueueEntryArchive.
+
+The queue screens, live status and expected-finish updates only ever scan
+waiting and in-progress entries, but done and cancelled ones used to pile up
+in the same table and indexes. ``archive_finished`` copies finished entries
+older than a cutoff into the history table and deletes them from QueueEntry,
+one primary-key batch per transaction, so QueueEntry only holds the last
+couple of days of finished visits. Readers of completed visits (wait
+prediction, dashboard counts, exports) read both tables.
+
+The delete skips QueueEntry's delete signals: archiving changes no live
+count, so there is nothing to broadcast, and the MongoDB mirror keeps its
+copy of the visit as history.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import QueueEntry, QueueEntryArchive
+
+FINISHED = (QueueEntry.Status.DONE, QueueEntry.Status.CANCELLED)
+_COLUMNS = [field.attname for field in QueueEntryArchive._meta.concrete_fields if field.name != 'archived_at']
+
+
+def get_config():
+    return getattr(settings, 'QUEUE_ARCHIVE', {})
+
+
+def default_cutoff():
+    return timezone.now() - timedelta(hours=get_config().get('AFTER_HOURS', 48))
+
+
+def archivable(cutoff):
+    """Finished entries older than ``cutoff``; cancelled entries may never have finished_at."""
+    return QueueEntry.objects.filter(status__in=FINISHED).filter(
+        Q(finished_at__lt=cutoff) | Q(finished_at__isnull=True, arrival_time__lt=cutoff)
+    )
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to ``batch_size`` entries in one transaction; returns how many moved."""
+    with transaction.atomic():
+        # skip_locked: an entry someone is editing right now waits for the next run
+        rows = list(
+            archivable(cutoff).select_for_update(skip_locked=True).order_by('pk').values(*_COLUMNS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        # ignore_conflicts: a row already copied by an earlier, interrupted run is not copied twice
+        QueueEntryArchive.objects.bulk_create([QueueEntryArchive(**row) for row in rows], ignore_conflicts=True)
+        moved = QueueEntry.objects.filter(pk__in=[row['id'] for row in rows])
+        return moved._raw_delete(moved.db)
+
+
+def archive_finished(cutoff=None, batch_size=None, pause=0.0):
+    """Archive everything older than ``cutoff`` (default: QUEUE_ARCHIVE['AFTER_HOURS'] ago)."""
+    cutoff = cutoff or default_cutoff()
+    batch_size = batch_size or get_config().get('BATCH_SIZE', 1000)
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
@@ -7,9 +7,10 @@ from rest_framework import serializers, status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 
+from .hashing import check_password, make_password, set_password
 from .models import User  # Use custom User model
+from .token_blacklist import RefreshToken
 
 
 # ─── Serializers ───
@@ -36,15 +37,11 @@ class RegisterSerializer(serializers.Serializer):
         validated_data.pop('password2')
         password = validated_data.pop('password')
         
-        user = User.objects.create(**validated_data)
-        user.set_password(password)
-        
         # Set is_staff for admin users
-        if user.role == 'admin':
-            user.is_staff = True
+        if validated_data.get('role') == 'admin':
+            validated_data['is_staff'] = True
         
-        user.save()
-        return user
+        return User.objects.create(password=make_password(password), **validated_data)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -97,7 +94,7 @@ class LoginView(APIView):
         
         try:
             user = User.objects.get(username=username)
-            if not user.check_password(password):
+            if not check_password(user, password):
                 return Response(
                     {'detail': 'Invalid credentials.'},
                     status=status.HTTP_401_UNAUTHORIZED
@@ -105,7 +102,7 @@ class LoginView(APIView):
             
             # Update last login (optional tracking)
             user.last_login = timezone.now()
-            user.save()
+            user.save(update_fields=['last_login'])
             
             refresh = RefreshToken.for_user(user)
             return Response(
@@ -209,7 +206,7 @@ class ResetPasswordView(APIView):
         
         try:
             user = User.objects.get(username=username)
-            user.set_password(new_password)
+            set_password(user, new_password)
             user.save(update_fields=['password'])
             
             return Response(
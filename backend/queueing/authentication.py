@@ -1,30 +1,150 @@
 """
 Custom authentication backend for MongoDB-based User model
 """
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken
+from . import caches
+from .db_router import is_user_pinned, reads_from_replica, use_primary
 from .models import User
 
 
+def _auth_version_key(user_id):
+    return f'careflow:auth_version:{user_id}'
+
+
+def get_auth_version(user_id):
+    """Current auth version of a user, shared across workers through the cache."""
+    return cache.get(_auth_version_key(user_id), 0)
+
+
+def bump_auth_version(user_id):
+    """Invalidate every worker's cached copy of this user."""
+    key = _auth_version_key(user_id)
+    # Versions never expire: a dropped key would reset to 0 and could revive stale entries
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+    user_cache.discard(user_id)
+
+
+class UserCache:
+    """
+    In-process LRU of resolved users, keyed by user id and auth version.
+
+    An entry is served only while its version matches the shared auth version
+    and it is younger than ``ttl`` seconds, so deactivation, role or password
+    changes take effect on the next request in every worker. That needs the
+    shared (Redis) cache; without one the TTL is capped at UNSHARED_MAX_TTL.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version or entry[1] < now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            user = entry[2]
+        # Views may mutate request.user; never hand out the shared instance
+        return copy.copy(user)
+
+    def set(self, user_id, version, user):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# Without a shared cache (REDIS_URL) bump_auth_version cannot reach other
+# workers, so their copies may only live for a moment
+UNSHARED_MAX_TTL = 1
+
+
+def user_cache_ttl():
+    ttl = getattr(settings, 'AUTH_USER_CACHE', {}).get('TTL', 60)
+    return ttl if caches.is_shared() else min(ttl, UNSHARED_MAX_TTL)
+
+
+user_cache = UserCache(
+    max_entries=getattr(settings, 'AUTH_USER_CACHE', {}).get('MAX_ENTRIES', 10000),
+    ttl=user_cache_ttl(),
+)
+
+
 class CustomJWTAuthentication(JWTAuthentication):
     """
     Custom JWT authentication that uses our MongoDB User model
     """
-    
+
     def get_user(self, validated_token):
         """
         Attempts to find and return a user using the given validated token.
+        Resolved users are cached per worker; see UserCache.
         """
         try:
             user_id = validated_token.get('user_id')
             if user_id is None:
                 raise InvalidToken('Token contained no recognizable user identification')
-            
-            user = User.objects.get(id=user_id)
-            
+
+            version = get_auth_version(user_id)
+            user = user_cache.get(user_id, version)
+            if user is None:
+                # Always from the primary: a lagging replica could revive a
+                # deactivated user under the new auth version, or miss a new one
+                user = User.objects.using('default').get(id=user_id)
+                user_cache.set(user_id, version, user)
+
             if not user.is_active:
                 raise InvalidToken('User is inactive')
-                
+
+            # Read-your-writes: this user wrote recently, replicas may lag
+            if reads_from_replica() and is_user_pinned(user_id):
+                use_primary()
+
             return user
         except User.DoesNotExist:
             raise InvalidToken('User not found')
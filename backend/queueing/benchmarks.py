@@ -0,0 +1,1118 @@
+"""
+Benchmarks for hot paths.
+
+Run with ``python manage.py benchmark [scenario ...]``. Every scenario runs
+against a throwaway test database and returns result rows (one per
+variant) that the command prints and can write as JSON so numbers can be
+compared across commits.
+"""
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+SCENARIOS = {}
+
+
+def scenario(name, description):
+    """Register ``func(size)`` as a benchmark scenario."""
+    def register(func):
+        SCENARIOS[name] = (func, description)
+        return func
+    return register
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(q / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(scenario_name, variant, samples, **extra):
+    """Build a result row from per-operation durations in seconds."""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    row = {
+        'scenario': scenario_name,
+        'variant': variant,
+        'ops': len(ordered),
+        'seconds': round(total, 4),
+        'ops_per_sec': round(len(ordered) / total, 1) if total else None,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+    }
+    row.update(extra)
+    return row
+
+
+def time_each(func, items):
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# ─── Fixtures ───
+
+def seed_hospital(name='Bench Hospital'):
+    from .models import Department, Hospital
+
+    hospital = Hospital.objects.create(name=name)
+    department = Department.objects.create(hospital=hospital, name='General')
+    return hospital, department
+
+
+def seed_unpaid_appointments(hospital, department, patient, count, prefix):
+    """Create ``count`` slot + appointment + pending payment triples; return payment ids."""
+    from .models import Appointment, AppointmentSlot, Payment
+
+    start = timezone.now() + timedelta(days=1)
+    slots = AppointmentSlot.objects.bulk_create([
+        AppointmentSlot(
+            hospital=hospital, department=department,
+            start_time=start + timedelta(minutes=30 * i), end_time=start + timedelta(minutes=30 * (i + 1)),
+        )
+        for i in range(count)
+    ])
+    appointments = Appointment.objects.bulk_create([
+        Appointment(
+            patient=patient, hospital=hospital, department=department,
+            appointment_slot=slot, payment_amount=500,
+        )
+        for slot in slots
+    ])
+    payments = Payment.objects.bulk_create([
+        Payment(
+            appointment=appointment, patient=patient, amount=500,
+            transaction_id=f'{prefix}{i:08d}',
+        )
+        for i, appointment in enumerate(appointments)
+    ])
+    return [p.pk for p in payments]
+
+
+def seed_dataset(scale):
+    """
+    A small hospital network whose row counts grow with ``scale``: 2
+    hospitals x 3 departments, with per-department beds, queue history and
+    open slots, and ``5 * scale`` patients with ``scale + 1`` booked
+    appointments (and payments) each, so per-patient lists grow too.
+
+    Returns the objects endpoint requests refer to.
+    """
+    from django.contrib.auth.hashers import make_password
+
+    from .models import (
+        Appointment, AppointmentSlot, Bed, Department, Hospital, Payment, QueueEntry, User,
+    )
+
+    now = timezone.now()
+    password = make_password('bench-password-1')
+    hospitals = Hospital.objects.bulk_create([Hospital(name=f'Hospital {i}') for i in range(2)])
+    departments = Department.objects.bulk_create([
+        Department(hospital=h, name=f'Department {j}') for h in hospitals for j in range(3)
+    ])
+    Bed.objects.bulk_create([
+        Bed(hospital=d.hospital, department=d, label=f'{d.name[-1]}-{i}')
+        for d in departments for i in range(3 * scale)
+    ])
+    statuses = [QueueEntry.Status.WAITING, QueueEntry.Status.IN_PROGRESS, QueueEntry.Status.DONE]
+    # At least five completions per department, as in a live queue: fewer sends wait prediction to the history table
+    QueueEntry.objects.bulk_create([
+        QueueEntry(
+            hospital=d.hospital, department=d, patient_name=f'walk-in {i}', status=statuses[i % 3],
+            started_at=now - timedelta(minutes=30) if i % 3 else None,
+            finished_at=now - timedelta(minutes=10) if i % 3 == 2 else None,
+        )
+        for d in departments for i in range(6 * scale + 12)
+    ])
+    free_slots = AppointmentSlot.objects.bulk_create([
+        AppointmentSlot(
+            hospital=d.hospital, department=d,
+            start_time=now + timedelta(hours=1, minutes=30 * i), end_time=now + timedelta(hours=1, minutes=30 * (i + 1)),
+        )
+        for d in departments for i in range(4 * scale + 4)
+    ])
+    admin = User.objects.create(username='bench-admin', password=password, role='admin', is_staff=True)
+    patients = User.objects.bulk_create([
+        User(username=f'bench-patient-{i}', email=f'patient{i}@example.com', password=password)
+        for i in range(5 * scale)
+    ])
+    bookings = [(p, j) for p in patients for j in range(scale + 1)]
+    booked_slots = AppointmentSlot.objects.bulk_create([
+        AppointmentSlot(
+            hospital=departments[i % 6].hospital, department=departments[i % 6], is_booked=True,
+            start_time=now + timedelta(days=1, minutes=30 * i), end_time=now + timedelta(days=1, minutes=30 * (i + 1)),
+        )
+        for i in range(len(bookings))
+    ])
+    appointments = Appointment.objects.bulk_create([
+        Appointment(
+            patient=p, hospital=slot.hospital, department=slot.department, appointment_slot=slot,
+            payment_amount=500, status='confirmed' if j else 'pending_payment', payment_status='paid' if j else 'pending',
+        )
+        for (p, j), slot in zip(bookings, booked_slots)
+    ])
+    payments = Payment.objects.bulk_create([
+        Payment(
+            appointment=a, patient=a.patient, amount=500, transaction_id=f'BENCH{i:08d}',
+            status='success' if a.payment_status == 'paid' else 'pending',
+        )
+        for i, a in enumerate(appointments)
+    ])
+    patient = patients[0]
+    return {
+        'hospital': hospitals[0],
+        'department': departments[0],
+        'admin': admin,
+        'patient': patient,
+        'appointment': appointments[1],          # confirmed
+        'unpaid_appointment': appointments[0],   # pending payment
+        'pending_payment': payments[0],
+        'free_slot': free_slots[-1],
+        'queue_entry': QueueEntry.objects.filter(status=QueueEntry.Status.WAITING).first(),
+        'bed': Bed.objects.first(),
+    }
+
+
+# ─── Endpoint budgets ───
+
+class Endpoint:
+    """
+    One URL route exercised by the endpoint budget harness.
+
+    ``request(data, n)`` returns ``(method, path, body)`` for the seeded
+    ``data``; ``n`` is unique per call, for usernames and similar. A request
+    must stay within ``max_queries`` SQL queries at every dataset size (the
+    tests check this) and the query count must not grow with the data unless
+    ``scales`` is set. ``budget_ms`` is the latency target reported by
+    ``manage.py benchmark endpoints``; it is not asserted in tests.
+    """
+
+    def __init__(self, route, role, request, max_queries, budget_ms=150, scales=False):
+        self.route = route
+        self.role = role
+        self.request = request
+        self.max_queries = max_queries
+        self.budget_ms = budget_ms
+        self.scales = scales
+
+
+def _new_user(n):
+    return {'username': f'budget-user-{n}', 'email': f'budget{n}@example.com',
+            'password': 'Str0ng-pass-123', 'password2': 'Str0ng-pass-123'}
+
+
+ENDPOINTS = [
+    # hospital_queue/urls.py — auth
+    Endpoint('auth-register', 'anon', lambda d, n: ('post', '/api/auth/register/', _new_user(n)), 3),
+    Endpoint('auth-login', 'anon', lambda d, n: (
+        'post', '/api/auth/login/', {'username': 'bench-admin', 'password': 'bench-password-1'}), 3),
+    # +1 blacklist query without a shared cache (token_blacklist.py)
+    Endpoint('auth-refresh', 'refresh', lambda d, n: ('post', '/api/auth/refresh/', None), 13),
+    Endpoint('auth-logout', 'refresh', lambda d, n: ('post', '/api/auth/logout/', None), 8),
+    Endpoint('auth-profile', 'patient', lambda d, n: ('get', '/api/auth/profile/', None), 1),
+    Endpoint('auth-forgot-password', 'anon', lambda d, n: (
+        'post', '/api/auth/forgot-password/', {'username': 'bench-admin'}), 1),
+    Endpoint('auth-reset-password', 'anon', lambda d, n: (
+        'post', '/api/auth/reset-password/',
+        {'username': 'bench-patient-1', 'new_password': 'N3w-pass-123', 'new_password2': 'N3w-pass-123'}), 2),
+    # patient
+    Endpoint('patient-register', 'anon', lambda d, n: ('post', '/api/patient/register/', _new_user(n)), 4),
+    Endpoint('patient-login', 'anon', lambda d, n: (
+        'post', '/api/patient/login/', {'username': 'bench-patient-0', 'password': 'bench-password-1'}), 3),
+    Endpoint('patient-hospitals', 'anon', lambda d, n: ('get', '/api/patient/hospitals/', None), 1),
+    Endpoint('patient-departments', 'anon', lambda d, n: (
+        'get', f"/api/patient/departments/?hospital_id={d['hospital'].pk}", None), 1),
+    Endpoint('patient-available-slots', 'patient', lambda d, n: (
+        'get', f"/api/patient/available-slots/?hospital_id={d['hospital'].pk}", None), 2),
+    Endpoint('patient-book-appointment', 'patient', lambda d, n: (
+        'post', '/api/patient/book-appointment/',
+        {'hospital_id': d['hospital'].pk, 'department_id': d['department'].pk,
+         'appointment_slot_id': d['free_slot'].pk}), 5),
+    Endpoint('patient-my-appointments', 'patient', lambda d, n: ('get', '/api/patient/my-appointments/', None), 2),
+    Endpoint('patient-cancel-appointment', 'patient', lambda d, n: (
+        'delete', f"/api/patient/appointments/{d['appointment'].pk}/cancel/", None), 5),
+    Endpoint('patient-queue-status', 'patient', lambda d, n: (
+        'get', f"/api/patient/queue-status/{d['hospital'].pk}/", None), 5),
+    # payments
+    Endpoint('payment-initiate', 'patient', lambda d, n: (
+        'post', '/api/patient/payment/initiate/', {'appointment_id': d['unpaid_appointment'].pk}), 3),
+    Endpoint('payment-verify', 'patient', lambda d, n: (
+        'post', '/api/patient/payment/verify/',
+        {'transaction_id': d['pending_payment'].transaction_id, 'test_mode': True}), 10),
+    Endpoint('payment-status', 'patient', lambda d, n: (
+        'get', f"/api/patient/payment/status/{d['pending_payment'].transaction_id}/", None), 3),
+    Endpoint('payment-history', 'patient', lambda d, n: ('get', '/api/patient/payment/history/', None), 2),
+    Endpoint('payment-webhook', 'anon', lambda d, n: ('post', '/api/payment/webhook/test/', {}), 0),
+    # admin
+    Endpoint('admin-appointments', 'admin', lambda d, n: ('get', '/api/admin/appointments/', None), 3, budget_ms=400),
+    Endpoint('admin-appointment-detail', 'admin', lambda d, n: (
+        'get', f"/api/admin/appointments/{d['appointment'].pk}/", None), 3),
+    Endpoint('admin-update-appointment', 'admin', lambda d, n: (
+        'patch', f"/api/admin/appointments/{d['appointment'].pk}/status/", {'status': 'in_progress'}), 4),
+    Endpoint('admin-dashboard-stats', 'admin', lambda d, n: ('get', '/api/admin/dashboard/stats/', None), 18),
+    Endpoint('admin-patients', 'admin', lambda d, n: ('get', '/api/admin/patients/', None), 2),
+    Endpoint('admin-register-patient', 'admin', lambda d, n: (
+        'post', '/api/admin/patients/register/',
+        {'username': f'walk-in-{n}', 'hospital_id': d['hospital'].pk, 'department_id': d['department'].pk}), 6),
+    Endpoint('admin-patient-detail', 'admin', lambda d, n: (
+        'get', f"/api/admin/patients/{d['patient'].pk}/", None), 5),
+    Endpoint('admin-export', 'admin', lambda d, n: ('get', '/api/admin/export/appointments/?output=csv', None), 2,
+             budget_ms=400),
+    # queueing/urls.py
+    Endpoint('api-root', 'patient', lambda d, n: ('get', '/api/', None), 1),
+    Endpoint('hospital-list', 'anon', lambda d, n: ('get', '/api/hospitals/', None), 1),
+    Endpoint('hospital-detail', 'anon', lambda d, n: ('get', f"/api/hospitals/{d['hospital'].pk}/", None), 1),
+    Endpoint('department-list', 'anon', lambda d, n: ('get', '/api/departments/', None), 1),
+    Endpoint('department-detail', 'anon', lambda d, n: ('get', f"/api/departments/{d['department'].pk}/", None), 1),
+    Endpoint('bed-list', 'anon', lambda d, n: ('get', f"/api/beds/?hospital={d['hospital'].pk}", None), 1),
+    Endpoint('bed-detail', 'anon', lambda d, n: ('get', f"/api/beds/{d['bed'].pk}/", None), 1),
+    Endpoint('queueentry-list', 'anon', lambda d, n: ('get', f"/api/queue/?hospital={d['hospital'].pk}", None), 1),
+    Endpoint('queueentry-detail', 'anon', lambda d, n: ('get', f"/api/queue/{d['queue_entry'].pk}/", None), 1),
+    Endpoint('queueentry-start', 'admin', lambda d, n: ('post', f"/api/queue/{d['queue_entry'].pk}/start/", None), 9),
+    Endpoint('queueentry-complete', 'admin', lambda d, n: (
+        'post', f"/api/queue/{d['queue_entry'].pk}/complete/", None), 9),
+    Endpoint('appointmentslot-list', 'anon', lambda d, n: (
+        'get', f"/api/appointments/?hospital={d['hospital'].pk}", None), 1),
+    Endpoint('appointmentslot-detail', 'anon', lambda d, n: ('get', f"/api/appointments/{d['free_slot'].pk}/", None), 1),
+    Endpoint('live-status', 'anon', lambda d, n: ('get', f"/api/status/{d['hospital'].pk}/", None), 3),
+    Endpoint('live-status-stream', 'anon', lambda d, n: (
+        'get', f"/api/status/{d['hospital'].pk}/stream/?departments={d['department'].pk}", None), 5),
+    Endpoint('dashboard', 'anon', lambda d, n: ('get', f"/api/dashboard/{d['hospital'].pk}/", None), 5),
+    Endpoint('patient-queue', 'anon', lambda d, n: ('get', f"/api/patient/queue/{d['queue_entry'].pk}/", None), 2),
+    # hospital_queue/urls.py — operations
+    Endpoint('metrics', 'scraper', lambda d, n: ('get', '/metrics', None), 2),
+]
+
+
+def call_endpoint(client, endpoint, data, n):
+    """
+    Issue one request for ``endpoint``; return ``(response, queries, seconds)``.
+    Per-worker caches are reset first so every call pays the same costs.
+    """
+    import json
+
+    from django.conf import settings
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+    from . import authentication
+
+    caches['throttle'].clear()
+    authentication.user_cache.clear()
+
+    method, path, body = endpoint.request(data, n)
+    headers = {}
+    if endpoint.role in ('patient', 'admin'):
+        headers['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(data[endpoint.role])}'
+    elif endpoint.role == 'scraper':
+        headers['HTTP_AUTHORIZATION'] = f"Bearer {settings.METRICS['TOKEN']}"
+    elif endpoint.role == 'refresh':
+        refresh = RefreshToken.for_user(data['patient'])
+        headers['HTTP_AUTHORIZATION'] = f'Bearer {refresh.access_token}'
+        body = {'refresh': str(refresh)}
+    if body is not None:
+        headers.update(data=json.dumps(body), content_type='application/json')
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, method)(path, secure=True, **headers)
+        if response.streaming:
+            # The rows are read as the body is sent; count those queries too
+            response.streaming_content = [b''.join(response.streaming_content)]
+        elapsed = time.perf_counter() - started
+    return response, len(queries), elapsed
+
+
+def measure_endpoints(sizes, endpoints=None):
+    """
+    Seed a dataset per size (rolled back afterwards) and call every endpoint
+    once on it. Returns ``{route: [(size, status, queries, ms), ...]}``.
+    """
+    from django.db import transaction
+    from django.test import Client, override_settings
+
+    from .token_blacklist import blacklist_filter
+
+    curves = {}
+    n = 0
+    # Cheap hashing: the budgets cover the app, not PBKDF2 (see PASSWORD_HASHING).
+    # No response cache: the budgets are for the uncached path.
+    with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                           ALLOWED_HOSTS=['testserver'], METRICS={'TOKEN': 'budget-scrape'},
+                           RESPONSE_CACHE={'ENABLED': False}):
+        for size in sizes:
+            with transaction.atomic():
+                data = seed_dataset(size)
+                blacklist_filter.rebuild()
+                for endpoint in endpoints or ENDPOINTS:
+                    n += 1
+                    with transaction.atomic():
+                        response, queries, seconds = call_endpoint(Client(), endpoint, data, n)
+                        transaction.set_rollback(True)
+                    curves.setdefault(endpoint.route, []).append(
+                        (size, response.status_code, queries, round(seconds * 1000, 2)),
+                    )
+                transaction.set_rollback(True)
+    return curves
+
+
+# ─── Scenarios ───
+
+def _legacy_mark_success(payment, gateway_payment_id, payment_method):
+    """The pre-service confirmation path: three full-row saves, no transaction."""
+    payment.status = 'success'
+    payment.gateway_payment_id = gateway_payment_id
+    payment.payment_method = payment_method
+    payment.paid_at = timezone.now()
+    payment.save()
+
+    appointment = payment.appointment
+    appointment.payment_status = 'paid'
+    appointment.payment_id = gateway_payment_id
+    appointment.status = 'confirmed'
+    appointment.confirmed_at = timezone.now()
+    if appointment.appointment_slot:
+        appointment.appointment_slot.is_booked = True
+        appointment.appointment_slot.patient_name = appointment.patient.username
+        appointment.appointment_slot.save()
+    appointment.save()
+
+
+@scenario('confirmations', 'Payment confirmations/sec: legacy full-row saves vs single-transaction service')
+def bench_confirmations(size):
+    from .models import Payment, User
+
+    hospital, department = seed_hospital()
+    patient = User.objects.create_user('bench-patient', password='bench-password-1')
+    legacy_ids = seed_unpaid_appointments(hospital, department, patient, size, 'LEG')
+    service_ids = seed_unpaid_appointments(hospital, department, patient, size, 'SVC')
+
+    def legacy(pk):
+        _legacy_mark_success(Payment.objects.get(pk=pk), f'pay_{pk}', 'upi')
+
+    def service(pk):
+        Payment.objects.get(pk=pk).mark_success(f'pay_{pk}', 'upi')
+
+    return [
+        summarize('confirmations', 'legacy', time_each(legacy, legacy_ids)),
+        summarize('confirmations', 'service', time_each(service, service_ids)),
+    ]
+
+
+@scenario('auth', 'JWT authentication overhead per request: uncached vs cached user resolution')
+def bench_auth(size):
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from . import authentication
+    from .models import User
+
+    # A realistic mix: many distinct users, each making several requests
+    users = [User.objects.create_user(f'bench-auth-{i}', password='bench-password-1') for i in range(50)]
+    factory = APIRequestFactory()
+    requests = [
+        factory.get('/api/auth/profile/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(users[i % len(users)])}')
+        for i in range(size)
+    ]
+    auth = authentication.CustomJWTAuthentication()
+
+    def run(request):
+        auth.authenticate(request)
+
+    shared_cache = authentication.user_cache
+    rows = []
+    try:
+        authentication.user_cache = authentication.UserCache(ttl=0)
+        rows.append(summarize('auth', 'uncached', time_each(run, requests)))
+        authentication.user_cache = authentication.UserCache()
+        rows.append(summarize('auth', 'cached', time_each(run, requests), **authentication.user_cache.stats()))
+    finally:
+        authentication.user_cache = shared_cache
+    return rows
+
+
+@scenario('login_storm', 'Read latency during a concurrent login storm: unbounded vs bounded hashing')
+def bench_login_storm(size):
+    import threading
+
+    from django.contrib.auth import hashers
+    from rest_framework.test import APIRequestFactory
+
+    from .hashing import HashingExecutor
+    from .patient_views import HospitalsListView
+
+    seed_hospital()
+    password = 'storm-password-1'
+    encoded = hashers.make_password(password)
+    factory = APIRequestFactory()
+    view = HospitalsListView.as_view(throttle_classes=[])
+
+    def read(_):
+        view(factory.get('/api/patient/hospitals/')).render()
+
+    bounded = HashingExecutor(max_workers=1, max_pending=64)
+    variants = (
+        ('unbounded', lambda: hashers.check_password(password, encoded)),
+        ('bounded', lambda: bounded.run(hashers.check_password, password, encoded)),
+    )
+
+    rows = [summarize('login_storm', 'idle', time_each(read, range(size)))]
+    for variant, login in variants:
+        stop = threading.Event()
+        logins = []
+
+        def storm():
+            count = 0
+            while not stop.is_set():
+                login()
+                count += 1
+            logins.append(count)
+
+        threads = [threading.Thread(target=storm, daemon=True) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        started = time.perf_counter()
+        samples = time_each(read, range(size))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join()
+        rows.append(summarize(
+            'login_storm', variant, samples,
+            logins_per_sec=round(sum(logins) / elapsed, 1),
+        ))
+    return rows
+
+
+@scenario('throttle', 'Per-request throttle check cost: DRF timestamp history vs sliding-window counters')
+def bench_throttle(size):
+    from django.contrib.auth.models import AnonymousUser
+    from django.core.cache import caches
+    from django.test import RequestFactory
+    from rest_framework.throttling import AnonRateThrottle
+
+    from .throttling import SlidingWindowRateThrottle
+
+    # A kiosk-sized limit, so histories grow long enough to matter
+    rate = '2000/minute'
+    request = RequestFactory().get('/api/status/1/', REMOTE_ADDR='10.0.0.1')
+    request.user = AnonymousUser()
+
+    class History(AnonRateThrottle):
+        THROTTLE_RATES = {'anon': rate}
+
+    class Sliding(SlidingWindowRateThrottle):
+        def __init__(self):
+            super().__init__()
+            self.rates = {'anon': rate}
+
+    rows = []
+    for variant, throttle_class in (('drf_history', History), ('sliding_window', Sliding)):
+        caches['default'].clear()
+        caches['throttle'].clear()
+        throttle = throttle_class()
+        samples = time_each(lambda _: throttle.allow_request(request, None), range(size))
+        rows.append(summarize('throttle', variant, samples))
+    return rows
+
+
+@scenario('token_blacklist', 'Refresh-token blacklist check as the tables grow: DB query vs Bloom filter')
+def bench_token_blacklist(size):
+    import uuid
+
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+    from .token_blacklist import BlacklistFilter
+
+    expires_at = timezone.now() + timedelta(days=7)
+    probes = [uuid.uuid4().hex for _ in range(size)]
+    rows = []
+    seeded = 0
+    for table_size in (1_000, 10_000, 100_000):
+        # Grow the tables, blacklisting every token (worst case for the DB check)
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(jti=uuid.uuid4().hex, token='', expires_at=expires_at)
+            for _ in range(table_size - seeded)
+        ], batch_size=5000)
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=t) for t in tokens], batch_size=5000)
+        seeded = table_size
+
+        def query(jti):
+            BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+        blacklist_filter = BlacklistFilter(capacity=10_000, sync_interval=3600, rebuild_interval=3600)
+        build_started = time.perf_counter()
+        blacklist_filter.rebuild()
+        build_seconds = round(time.perf_counter() - build_started, 3)
+
+        rows.append(summarize('token_blacklist', f'db_{table_size}', time_each(query, probes)))
+        rows.append(summarize(
+            'token_blacklist', f'filter_{table_size}', time_each(blacklist_filter.is_blacklisted, probes),
+            build_seconds=build_seconds,
+        ))
+    return rows
+
+
+
+@scenario('profiling', 'Request overhead of the profiling middleware: off, on, slow sampler armed, cProfile on every request')
+def bench_profiling(size):
+    import tempfile
+
+    from django.conf import settings
+    from django.test import Client, override_settings
+
+    from .models import Hospital
+
+    Hospital.objects.bulk_create([Hospital(name=f'Profiled {i}') for i in range(20)])
+    without_logging = [m for m in settings.MIDDLEWARE if m != 'queueing.middleware.RequestLoggingMiddleware']
+    unthrottled = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        variants = [
+            ('no_middleware', {'MIDDLEWARE': without_logging}),
+            ('sampling_off', {'PROFILING': {'SERVER_TIMING': True}}),
+            ('slow_sampler_armed', {'PROFILING': {'SLOW_REQUEST_MS': 1000, 'SAMPLE_INTERVAL_MS': 5}}),
+            ('cprofile_every_request', {'PROFILING': {'SAMPLE_RATE': 1.0, 'DIR': directory}}),
+        ]
+        for variant, overrides in variants:
+            with override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK=unthrottled, **overrides):
+                client = Client()
+                assert client.get('/api/hospitals/', secure=True).status_code == 200  # loads the middleware chain
+                samples = time_each(lambda _: client.get('/api/hospitals/', secure=True), range(size))
+            rows.append(summarize('profiling', variant, samples))
+    return rows
+
+
+@scenario('endpoints', 'Queries and latency per route as the dataset grows (size = largest dataset scale)')
+def bench_endpoints(size):
+    sizes = sorted({1, max(1, size // 4), max(1, size // 2), max(1, size)})
+    curves = measure_endpoints(sizes)
+    rows = []
+    for endpoint in ENDPOINTS:
+        curve = curves[endpoint.route]
+        rows.append(summarize(
+            'endpoints', endpoint.route, [ms / 1000 for _, _, _, ms in curve],
+            sizes=sizes, statuses=[status for _, status, _, _ in curve],
+            queries=[queries for _, _, queries, _ in curve],
+            max_queries=endpoint.max_queries, budget_ms=endpoint.budget_ms,
+        ))
+    return rows
+
+
+@scenario('hospital_day', 'Per-operation latency while replaying a hospital day (size = operations)')
+def bench_hospital_day(size):
+    from .loadgen import Workload, seed
+
+    seed(hospitals=2, departments=4, patients=200, days=14, visits=30)
+    workload = Workload().load()
+    workload.run(size)
+    return workload.report('hospital_day')
+
+
+@scenario('logging', 'Caller-side cost of an audit log call and writer throughput: synchronous handler vs bounded queue')
+def bench_logging(size):
+    import logging
+    import os
+    import tempfile
+
+    from .log_pipeline import BoundedQueueHandler, JsonLinesFormatter
+
+    class SlowSink:
+        """A stream that stalls 1 ms per write, like a slow disk or a blocked stdout pipe."""
+
+        def write(self, data):
+            time.sleep(0.001)
+
+        def flush(self):
+            pass
+
+    extra = {
+        'method': 'GET', 'path': '/api/hospitals/', 'status': 200, 'user': 'anonymous', 'ip': '10.0.0.1',
+        'duration_ms': 3.21, 'db_queries': 2, 'db_ms': 0.4, 'render_ms': 0.3, 'profile': None,
+    }
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        def sync_file():
+            handler = logging.FileHandler(os.path.join(directory, 'sync.jsonl'))
+            handler.setFormatter(JsonLinesFormatter())
+            return handler
+
+        def sync_slow():
+            handler = logging.StreamHandler(SlowSink())
+            handler.setFormatter(JsonLinesFormatter())
+            return handler
+
+        variants = [
+            ('sync_file', sync_file),
+            ('queued_file', lambda: BoundedQueueHandler(path=os.path.join(directory, 'queued.jsonl'),
+                                                        queue_size=size)),
+            ('sync_slow_sink', sync_slow),
+            ('queued_slow_sink', lambda: BoundedQueueHandler(stream=SlowSink(), queue_size=1000)),
+        ]
+        for variant, make_handler in variants:
+            handler = make_handler()
+            logger = logging.getLogger(f'careflow.bench.{variant}')
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            started = time.perf_counter()
+            samples = time_each(
+                lambda i: logger.info('GET /api/hospitals/ → 200 | request %d', i, extra=extra), range(size),
+            )
+            extra_fields = {}
+            if isinstance(handler, BoundedQueueHandler):
+                handler.flush(timeout=60)
+                drained = time.perf_counter() - started
+                stats = handler.stats()
+                extra_fields = {
+                    'written': stats['written'], 'dropped': stats['dropped'], 'batches': stats['batches'],
+                    'written_per_sec': round(stats['written'] / drained, 1),
+                }
+            logger.removeHandler(handler)
+            handler.close()
+            rows.append(summarize('logging', variant, samples, **extra_fields))
+    return rows
+
+
+@scenario('response_cache', 'Reference-data GETs: uncached vs versioned cache hit vs If-None-Match 304 (size = requests)')
+def bench_response_cache(size):
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.test import Client, override_settings
+
+    from .models import Department, Hospital
+
+    hospitals = Hospital.objects.bulk_create([Hospital(name=f'Cached {i}') for i in range(20)])
+    Department.objects.bulk_create([Department(hospital=h, name=f'Department {j}') for h in hospitals for j in range(8)])
+    cache.clear()
+    unthrottled = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+    rows = []
+    for url in ('/api/patient/hospitals/', '/api/patient/departments/'):
+        variants = [
+            ('uncached', {'ENABLED': False}, {}),
+            ('hit', {}, {}),
+            ('not_modified', {}, {'HTTP_IF_NONE_MATCH': 'etag'}),
+        ]
+        for variant, config, headers in variants:
+            with override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK=unthrottled,
+                                   RESPONSE_CACHE={**settings.RESPONSE_CACHE, **config}):
+                client = Client()
+                first = client.get(url, secure=True)
+                assert first.status_code == 200
+                if headers:
+                    headers = {'HTTP_IF_NONE_MATCH': first['ETag']}
+                samples = time_each(lambda _: client.get(url, secure=True, **headers), range(size))
+                status = client.get(url, secure=True, **headers).status_code
+            rows.append(summarize('response_cache', f'{url} {variant}', samples, status=status, bytes=len(first.content)))
+    return rows
+
+
+@scenario('fast_lists', 'Queue and slot lists of `size` rows: serializer + JSONRenderer vs values() projection + orjson')
+def bench_fast_lists(size):
+    from django.conf import settings
+    from django.test import Client, override_settings
+    from rest_framework.renderers import JSONRenderer
+
+    from .models import AppointmentSlot, QueueEntry
+    from .projections import Projection
+    from .renderers import ORJSONRenderer
+    from .serializers import AppointmentSlotSerializer, QueueEntrySerializer
+
+    hospital, department = seed_hospital()
+    now = timezone.now()
+    QueueEntry.objects.bulk_create([
+        QueueEntry(hospital=hospital, department=department if i % 3 else None, patient_name=f'Patient {i}',
+                   symptoms='fever', expected_finish=now + timedelta(minutes=i))
+        for i in range(size)
+    ])
+    AppointmentSlot.objects.bulk_create([
+        AppointmentSlot(hospital=hospital, department=department,
+                        start_time=now + timedelta(minutes=15 * i), end_time=now + timedelta(minutes=15 * (i + 1)))
+        for i in range(size)
+    ])
+    lists = [
+        ('queue', QueueEntrySerializer, QueueEntry.objects.select_related('hospital', 'department'),
+         f'/api/queue/?hospital={hospital.pk}'),
+        ('slots', AppointmentSlotSerializer, AppointmentSlot.objects.select_related('hospital', 'department'),
+         f'/api/appointments/?hospital={hospital.pk}'),
+    ]
+    runs = 5
+    rows = []
+    for name, serializer_class, queryset, url in lists:
+        def serializer_path(_):
+            return JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+
+        def projection_path(_):
+            return ORJSONRenderer().render(Projection.for_serializer(serializer_class).rows(queryset.all()))
+
+        assert serializer_path(0) == projection_path(0)
+        for variant, func in (('serializer', serializer_path), ('projection', projection_path)):
+            samples = time_each(func, range(runs))
+            rows.append(summarize('fast_lists', f'{name} {variant}', samples,
+                                  rows=size, rows_per_sec=round(size * runs / sum(samples))))
+
+        # End to end through the view (projection path only; the endpoint no longer has the other)
+        with override_settings(ALLOWED_HOSTS=['testserver'],
+                               REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+            client = Client()
+            assert client.get(url, secure=True).status_code == 200
+            samples = time_each(lambda _: client.get(url, secure=True), range(runs))
+        rows.append(summarize('fast_lists', f'{name} endpoint', samples,
+                              rows=size, rows_per_sec=round(size * runs / sum(samples))))
+    return rows
+
+
+@scenario('sparse_fields', 'Payload size, queries and latency of list screens: full payload vs ?fields= (size = dataset scale)')
+def bench_sparse_fields(size):
+    import re
+
+    from django.conf import settings
+    from django.test import Client, override_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    data = seed_dataset(size)
+    screens = [
+        ('admin', '/api/admin/appointments/', 'id,status,payment_status,hospital_name,created_at'),
+        ('patient', '/api/patient/my-appointments/', 'id,status,slot_time'),
+        ('admin', f"/api/queue/?hospital={data['hospital'].pk}", 'id,patient_name,status'),
+    ]
+    rows = []
+    with override_settings(ALLOWED_HOSTS=['testserver'],
+                           REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}):
+        client = Client()
+        for role, url, fields in screens:
+            auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(data[role])}'}
+            for variant, variant_url in (('full', url), ('fields', f"{url}{'&' if '?' in url else '?'}fields={fields}")):
+                response = client.get(variant_url, secure=True, **auth)
+                assert response.status_code == 200, (variant_url, response.status_code)
+                queries = int(re.search(r'(\d+) queries', response['Server-Timing']).group(1))
+                samples = time_each(lambda _: client.get(variant_url, secure=True, **auth), range(20))
+                rows.append(summarize('sparse_fields', f'{url} {variant}', samples,
+                                      bytes=len(response.content), queries=queries))
+    return rows
+
+
+@scenario('exports', 'Exporting `size` queue entries: buffered serializer JSON vs streamed NDJSON / CSV / gzip')
+def bench_exports(size):
+    import tracemalloc
+
+    from rest_framework.renderers import JSONRenderer
+
+    from . import exports
+    from .models import QueueEntry
+    from .serializers import QueueEntrySerializer
+
+    hospital, department = seed_hospital()
+    QueueEntry.objects.bulk_create([
+        QueueEntry(hospital=hospital, department=department, patient_name=f'Patient {i}', symptoms='fever')
+        for i in range(size)
+    ])
+    dataset = exports.DATASETS['queue']
+
+    def buffered():
+        queryset = QueueEntry.objects.select_related('hospital', 'department')
+        yield JSONRenderer().render(QueueEntrySerializer(queryset, many=True).data)
+
+    variants = [
+        ('buffered json', buffered),
+        ('ndjson', lambda: exports.stream(dataset, dataset.queryset())),
+        ('csv', lambda: exports.stream(dataset, dataset.queryset(), output='csv')),
+        ('csv gzip', lambda: exports.stream(dataset, dataset.queryset(), output='csv', gzip=True)),
+    ]
+    rows = []
+    for variant, chunks in variants:
+        tracemalloc.start()
+        started = time.perf_counter()
+        first_byte = None
+        total = 0
+        for chunk in chunks():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            total += len(chunk)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rows.append(summarize('exports', variant, [elapsed], rows=size, rows_per_sec=round(size / elapsed),
+                              first_byte_ms=round(first_byte * 1000, 2), bytes=total,
+                              peak_kb=round(peak / 1024)))
+    return rows
+
+
+@scenario('queue_archive', 'Live queue reads with `size` finished entries in the live table vs after archive_queue')
+def bench_queue_archive(size):
+    from . import archive
+    from .models import QueueEntry
+    from .services import PredictionService, dashboard_metrics, live_status_snapshot
+
+    hospital, department = seed_hospital()
+    old = timezone.now() - timedelta(days=7)
+    QueueEntry.objects.bulk_create([
+        QueueEntry(hospital=hospital, department=department, patient_name=f'Patient {i}',
+                   status=QueueEntry.Status.DONE if i % 10 else QueueEntry.Status.CANCELLED,
+                   started_at=old, finished_at=old + timedelta(minutes=10))
+        for i in range(size)
+    ])
+    QueueEntry.objects.bulk_create([
+        QueueEntry(hospital=hospital, department=department, patient_name=f'Waiting {i}')
+        for i in range(50)
+    ])
+    service = PredictionService()
+    reads = [
+        ('live status', lambda _: live_status_snapshot(hospital.pk)),
+        ('dashboard', lambda _: dashboard_metrics(hospital.pk)),
+        ('expected finish update', lambda _: service.update_expected_finish_times(hospital.pk, department.pk)),
+        ('waiting list', lambda _: list(QueueEntry.objects.filter(
+            hospital=hospital, status=QueueEntry.Status.WAITING).order_by('arrival_time'))),
+    ]
+    rows = []
+    for phase in ('before', 'after'):
+        if phase == 'after':
+            started = time.perf_counter()
+            moved = archive.archive_finished(batch_size=1000)
+            elapsed = time.perf_counter() - started
+            rows.append(summarize('queue_archive', 'archive_queue', [elapsed], rows=moved,
+                                  rows_per_sec=round(moved / elapsed)))
+        for name, func in reads:
+            rows.append(summarize('queue_archive', f'{name} {phase}', time_each(func, range(30)),
+                                  live_rows=QueueEntry.objects.count()))
+    return rows
+
+
+@scenario('snapshots', 'Mean wait per department over `size` visits: SQL aggregate vs numpy on memory-mapped snapshots')
+def bench_snapshots(size):
+    import os
+    import tempfile
+
+    import numpy as np
+    from django.db.models import Avg, F
+
+    from . import snapshots
+    from .loadgen import _explicit_timestamps
+    from .models import Department, QueueEntry
+
+    hospital, _ = seed_hospital()
+    departments = Department.objects.bulk_create([
+        Department(hospital=hospital, name=f'Dept {i}') for i in range(10)
+    ])
+    month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    with _explicit_timestamps(QueueEntry._meta.get_field('arrival_time')):
+        QueueEntry.objects.bulk_create([
+            QueueEntry(hospital=hospital, department=departments[i % 10], patient_name=f'Patient {i}',
+                       status=QueueEntry.Status.DONE, arrival_time=month_start + timedelta(seconds=i),
+                       started_at=month_start + timedelta(seconds=i + 60 * (i % 30)),
+                       finished_at=month_start + timedelta(seconds=i + 60 * (i % 30) + 600))
+            for i in range(size)
+        ], batch_size=5000)
+    month = f'{month_start:%Y-%m}'
+
+    def sql(_):
+        return dict(QueueEntry.objects.filter(
+            status=QueueEntry.Status.DONE, arrival_time__gte=month_start,
+        ).values_list('department_id').annotate(wait=Avg(F('started_at') - F('arrival_time'))).order_by())
+
+    with tempfile.TemporaryDirectory() as root:
+        started = time.perf_counter()
+        snapshots.write_partition(snapshots.DATASETS['queue'], month, root=root)
+        export_seconds = time.perf_counter() - started
+        on_disk = sum(os.path.getsize(os.path.join(root, 'queue', month, name))
+                      for name in os.listdir(os.path.join(root, 'queue', month)))
+
+        def columnar(_):
+            part = snapshots.open_partition('queue', month, root=root)
+            done = part.where('status', 'done')
+            waits = (part['started_at'] - part['arrival_time'])[done].astype(np.int64)
+            department = part['department_id'][done]
+            totals = np.bincount(department, weights=waits)
+            counts = np.bincount(department)
+            present = np.nonzero(counts)[0]
+            return dict(zip(present.tolist(), (totals[present] / counts[present]).tolist()))
+
+        sql_result, numpy_result = sql(0), columnar(0)
+        assert {k: round(v.total_seconds()) for k, v in sql_result.items()} == \
+            {k: round(v / 1e6) for k, v in numpy_result.items()}
+        rows = [
+            summarize('snapshots', 'export month', [export_seconds], rows=size,
+                      rows_per_sec=round(size / export_seconds), bytes_per_row=round(on_disk / size, 1)),
+            summarize('snapshots', 'sql aggregate', time_each(sql, range(10)), rows=size),
+            summarize('snapshots', 'numpy memmap', time_each(columnar, range(10)), rows=size),
+        ]
+    return rows
+
+
+@scenario('ws_fanout', 'Messages per queue change for `size` department boards in 10 departments: hospital group vs department groups')
+def bench_ws_fanout(size):
+    from asgiref.sync import async_to_sync
+    from channels.layers import InMemoryChannelLayer
+    from django.core.cache import cache
+
+    from . import live_groups, signals
+    from .models import Department, QueueEntry
+
+    hospital, _ = seed_hospital()
+    departments = Department.objects.bulk_create([
+        Department(hospital=hospital, name=f'Dept {i}') for i in range(10)
+    ])
+    class CountingLayer(InMemoryChannelLayer):
+        # Count what would be delivered instead of queueing it
+        async def send(self, channel, message):
+            self.delivered += 1
+            self.bytes += len(message['text'])
+
+    changes = 20
+    layer = CountingLayer()
+    boards = [f'board-{i}!' for i in range(size)]
+    lobby = [f'lobby-{i}!' for i in range(2)]  # hospital-wide screens
+    saved_layer = signals.channel_layer
+    signals.channel_layer = layer
+    rows = []
+    try:
+        for variant in ('hospital group', 'department groups'):
+            async_to_sync(layer.flush)()
+            layer.delivered = layer.bytes = 0
+            cache.clear()
+            for channel in lobby:
+                async_to_sync(layer.group_add)(live_groups.hospital_group(hospital.pk), channel)
+            for i, channel in enumerate(boards):
+                department = departments[i % 10]
+                if variant == 'hospital group':
+                    group = live_groups.hospital_group(hospital.pk)
+                else:
+                    group = live_groups.department_group(hospital.pk, department.pk)
+                    live_groups.watch(hospital.pk, department.pk)
+                async_to_sync(layer.group_add)(group, channel)
+
+            entries = QueueEntry.objects.bulk_create([
+                QueueEntry(hospital=hospital, department=departments[i % 10], patient_name=f'Patient {i}')
+                for i in range(changes)
+            ])
+            samples = time_each(lambda entry: signals._broadcast(hospital.pk, entry.department_id), entries)
+            rows.append(summarize('ws_fanout', variant, samples, sockets=size + len(lobby),
+                                  messages_per_change=round(layer.delivered / changes, 1),
+                                  kb_per_change=round(layer.bytes / changes / 1024, 1)))
+    finally:
+        signals.channel_layer = saved_layer
+    return rows
+
+
+@scenario('eta_push', 'A queue of `size` patients watching their ETA: polling /api/patient/queue/<pk>/ vs pushes on change')
+def bench_eta_push(size):
+    from channels.layers import InMemoryChannelLayer
+    from django.core.cache import cache
+    from django.test import Client
+
+    from . import eta, live_groups
+    from .models import Department, QueueEntry
+    from .services import PredictionService
+
+    hospital, _ = seed_hospital()
+    department = Department.objects.create(hospital=hospital, name='ETA')
+    entries = QueueEntry.objects.bulk_create([
+        QueueEntry(hospital=hospital, department=department, patient_name=f'Patient {i}') for i in range(size)
+    ])
+    service = PredictionService()
+    service.update_expected_finish_times(hospital.pk, department.pk)
+
+    # Every phone polls every 5 s: one round is `size` requests
+    client = Client()
+    poll = time_each(lambda entry: client.get(f'/api/patient/queue/{entry.pk}/', secure=True), entries)
+    rows = [summarize('eta_push', 'polling (per request)', poll, requests_per_min=size * 12)]
+
+    class CountingLayer(InMemoryChannelLayer):
+        async def group_send(self, group, message):
+            self.delivered += 1
+
+    layer = CountingLayer()
+    layer.delivered = 0
+    cache.clear()
+    for entry in entries:
+        live_groups.watch_entry(hospital.pk, entry.pk)
+        eta.remember([eta.state(entry, eta.position(entry))])
+    saved = eta.get_channel_layer
+    eta.get_channel_layer = lambda: layer
+    changes = min(20, size)
+    try:
+        def next_patient(entry):
+            entry.mark_started()
+            service.update_expected_finish_times(hospital.pk, department.pk)
+        samples = time_each(next_patient, entries[:changes])
+        # A recompute with nothing changed (e.g. a new arrival at the back) pushes to nobody ahead
+        delivered = layer.delivered
+        idle = time_each(lambda _: service.update_expected_finish_times(hospital.pk, department.pk), range(changes))
+    finally:
+        eta.get_channel_layer = saved
+    rows.append(summarize('eta_push', 'push (per queue change)', samples,
+                          messages_per_change=round(delivered / changes, 1)))
+    rows.append(summarize('eta_push', 'push (unchanged recompute)', idle,
+                          messages_per_change=round((layer.delivered - delivered) / changes, 1)))
+    return rows
+
+
+@scenario('sse_streams', '`size` live-status displays: polling /api/status/<id>/ vs SSE streams held in one event loop')
+def bench_sse_streams(size):
+    import asyncio
+    import threading
+    import tracemalloc
+
+    from asgiref.sync import async_to_sync, sync_to_async
+    from channels.layers import InMemoryChannelLayer
+    from django.test import Client
+
+    from . import signals, sse
+
+    hospital, department = seed_hospital()
+    client = Client()
+    # A display polls every 5 s
+    poll = time_each(lambda _: client.get(f'/api/status/{hospital.pk}/', secure=True), range(min(size, 200)))
+    rows = [summarize('sse_streams', 'polling (per request)', poll, requests_per_min=size * 12)]
+
+    class UnsweptLayer(InMemoryChannelLayer):
+        # InMemoryChannelLayer sweeps every channel for expired messages on each receive,
+        # O(streams) per event; channels_redis has no such sweep
+        def _clean_expired(self):
+            pass
+
+    changes = 20
+
+    async def run():
+        threads = threading.active_count()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        streams = [sse.status_events(hospital.pk) for _ in range(size)]
+        for stream in streams:
+            await anext(stream)  # retry
+            await anext(stream)  # snapshot
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        samples = []
+        try:
+            for _ in range(changes):
+                started = time.perf_counter()
+                await sync_to_async(signals._broadcast)(hospital.pk, department.pk)
+                await asyncio.gather(*(anext(stream) for stream in streams))
+                samples.append(time.perf_counter() - started)
+        finally:
+            extra_threads = max(threading.active_count() - threads, 0)
+            for stream in streams:
+                await stream.aclose()
+        return samples, held, extra_threads
+
+    saved = signals.channel_layer, sse.get_channel_layer
+    try:
+        for variant, layer in (('sse, InMemoryChannelLayer', InMemoryChannelLayer()),
+                               ('sse, layer without expiry sweep', UnsweptLayer())):
+            signals.channel_layer = layer
+            sse.get_channel_layer = lambda: layer
+            samples, held, extra_threads = async_to_sync(run)()
+            rows.append(summarize('sse_streams', f'{variant} (broadcast to all)', samples, streams=size,
+                                  kb_per_stream=round(held / size / 1024, 1), extra_threads=extra_threads))
+    finally:
+        signals.channel_layer, sse.get_channel_layer = saved
+    return rows
@@ -0,0 +1,16 @@
+"""
+Whether a configured cache is shared between worker processes.
+
+Without REDIS_URL the caches are LocMemCache, private to each process.
+Anything that relies on the cache to reach other workers (invalidations,
+blacklist entries, rate-limit counters) has to check this and fall back to
+the database or a shorter lifetime.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(alias='default'):
+    """True if every worker process sees the same entries in cache ``alias``."""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
@@ -1,31 +1,186 @@
 import json
+from urllib.parse import parse_qs
 
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.core.serializers.json import DjangoJSONEncoder
 
+from . import eta, live_groups, metrics
+from .models import Department, QueueEntry
 from .services import live_status_snapshot
 
 
 class HospitalStatusConsumer(AsyncJsonWebsocketConsumer):
-    """Broadcast live bed/queue status for a hospital."""
+    """
+    Broadcast live bed/queue status for a hospital.
+
+    By default a socket gets hospital-wide snapshots. A department board
+    connects with ``?departments=3`` (comma-separated for several) to get
+    only those departments' own snapshots, or changes its subscriptions
+    with messages:
+
+    * ``{"type": "subscribe", "department_id": 3}`` / ``unsubscribe``;
+    * the same without ``department_id`` for the hospital-wide snapshot;
+    * ``{"type": "refresh"}`` re-sends every subscribed snapshot.
+    """
+
+    @classmethod
+    async def encode_json(cls, content):
+        # Snapshots carry datetimes (last_updated)
+        return json.dumps(content, cls=DjangoJSONEncoder)
 
     async def connect(self):
         self.hospital_id = self.scope['url_route']['kwargs']['hospital_id']
-        self.group_name = f"hospital_{self.hospital_id}"
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self.hospital_wide = False
+        self.departments = set()
         await self.accept()
-        await self.send_status()
+        metrics.WS_CONNECTIONS.inc()
+        metrics.WS_ACTIVE.inc()
+        self.counted = True
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        if 'departments' in query:
+            requested = live_groups.department_ids(','.join(query['departments']).split(','))
+            await self.subscribe_departments(requested)
+        else:
+            await self.subscribe_hospital()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, 'counted', False):
+            metrics.WS_ACTIVE.dec()
+        if getattr(self, 'hospital_wide', False):
+            await self.channel_layer.group_discard(live_groups.hospital_group(self.hospital_id), self.channel_name)
+        for department_id in getattr(self, 'departments', ()):
+            await self.leave_department(department_id)
 
     async def receive_json(self, content, **kwargs):
-        # Client can request a refresh explicitly
-        if content.get('type') == 'refresh':
-            await self.send_status()
+        kind = content.get('type')
+        if kind == 'refresh':
+            # Client can request a refresh explicitly
+            if self.hospital_wide:
+                await self.send_status()
+            for department_id in sorted(self.departments):
+                await self.send_status(department_id)
+        elif kind == 'subscribe':
+            if 'department_id' in content:
+                await self.subscribe_departments(live_groups.department_ids([content['department_id']]))
+            else:
+                await self.subscribe_hospital()
+        elif kind == 'unsubscribe':
+            if 'department_id' in content:
+                for department_id in live_groups.department_ids([content['department_id']]) or ():
+                    if department_id in self.departments:
+                        await self.leave_department(department_id)
+                        self.departments.discard(department_id)
+            elif self.hospital_wide:
+                await self.channel_layer.group_discard(live_groups.hospital_group(self.hospital_id), self.channel_name)
+                self.hospital_wide = False
 
-    async def send_status(self):
-        snapshot = live_status_snapshot(self.hospital_id)
+    async def subscribe_hospital(self):
+        if not self.hospital_wide:
+            await self.channel_layer.group_add(live_groups.hospital_group(self.hospital_id), self.channel_name)
+            self.hospital_wide = True
+        await self.send_status()
+
+    async def subscribe_departments(self, department_ids):
+        if not department_ids:
+            await self.send_json({'type': 'error', 'error': 'department_id must be an integer'})
+            return
+        new = department_ids - self.departments
+        if len(self.departments) + len(new) > live_groups.MAX_DEPARTMENTS:
+            await self.send_json({
+                'type': 'error', 'error': f'At most {live_groups.MAX_DEPARTMENTS} departments per connection',
+            })
+            return
+        found = await database_sync_to_async(self.hospital_departments)(new)
+        if found != new:
+            missing = ', '.join(map(str, sorted(new - found)))
+            await self.send_json({'type': 'error', 'error': f'No department {missing} in this hospital'})
+            return
+        for department_id in sorted(new):
+            await self.channel_layer.group_add(
+                live_groups.department_group(self.hospital_id, department_id), self.channel_name,
+            )
+            await database_sync_to_async(live_groups.watch)(self.hospital_id, department_id)
+            self.departments.add(department_id)
+        for department_id in sorted(department_ids):
+            await self.send_status(department_id)
+
+    def hospital_departments(self, department_ids):
+        departments = Department.objects.filter(hospital_id=self.hospital_id, pk__in=department_ids)
+        return set(departments.values_list('pk', flat=True))
+
+    async def leave_department(self, department_id):
+        await self.channel_layer.group_discard(
+            live_groups.department_group(self.hospital_id, department_id), self.channel_name,
+        )
+        await database_sync_to_async(live_groups.unwatch)(self.hospital_id, department_id)
+
+    async def send_status(self, department_id=None):
+        # The ORM is sync-only: run the snapshot queries in the DB thread pool
+        snapshot = await database_sync_to_async(live_status_snapshot)(self.hospital_id, department_id)
         await self.send_json({'type': 'status', **snapshot})
+        metrics.WS_MESSAGES.labels('snapshot').inc()
 
     async def broadcast_status(self, event):
-        await self.send_json({'type': 'status', **event['payload']})
+        # Encoded once by the sender for the whole group
+        await self.send(text_data=event['text'])
+        metrics.WS_MESSAGES.labels('broadcast').inc()
+
+
+class QueueEntryETAConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Push one patient's queue position and expected finish time (eta.py).
+
+    Sends the current state on connect, then an ``eta`` message only when
+    the status or position changes or the ETA moves; ``{"type": "refresh"}``
+    re-sends the current state.
+    """
+
+    @classmethod
+    async def encode_json(cls, content):
+        return eta.encode(content)
+
+    async def connect(self):
+        self.entry_id = self.scope['url_route']['kwargs']['pk']
+        message = await database_sync_to_async(self.current_state)()
+        if message is None:
+            await self.close()
+            return
+        self.hospital_id = message.pop('hospital_id')
+        await self.channel_layer.group_add(live_groups.entry_group(self.entry_id), self.channel_name)
+        await database_sync_to_async(live_groups.watch_entry)(self.hospital_id, self.entry_id)
+        self.watching = True
+        await self.accept()
+        metrics.WS_CONNECTIONS.inc()
+        metrics.WS_ACTIVE.inc()
+        self.counted = True
+        await self.send_json(message)
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'counted', False):
+            metrics.WS_ACTIVE.dec()
+        if getattr(self, 'watching', False):
+            await self.channel_layer.group_discard(live_groups.entry_group(self.entry_id), self.channel_name)
+            await database_sync_to_async(live_groups.unwatch_entry)(self.hospital_id, self.entry_id)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get('type') == 'refresh':
+            message = await database_sync_to_async(self.current_state)()
+            if message is not None:
+                message.pop('hospital_id')
+                await self.send_json(message)
+
+    def current_state(self):
+        try:
+            entry = QueueEntry.objects.get(pk=self.entry_id)
+        except QueueEntry.DoesNotExist:
+            return None
+        message = eta.state(entry, eta.position(entry))
+        eta.remember([message])
+        return {**message, 'hospital_id': entry.hospital_id}
+
+    async def eta_update(self, event):
+        # Encoded once by the sender
+        await self.send(text_data=event['text'])
+        metrics.WS_MESSAGES.labels('eta').inc()
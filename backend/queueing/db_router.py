@@ -0,0 +1,75 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary ('default'). Reads go to a replica from
+settings.DATABASE_REPLICAS only while ReplicaRoutingMiddleware has marked
+the current request as a safe read (GET/HEAD/OPTIONS); management commands,
+workers, websocket consumers and unsafe requests read from the primary.
+
+Read-your-writes: after a user's successful write, the user is pinned to
+the primary for REPLICA_PIN_SECONDS (in the shared cache, so every worker
+sees it). CustomJWTAuthentication checks the pin once it knows who is
+asking, before the view runs any queries.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+DEFAULT_DB_ALIAS = 'default'
+
+# Alias safe reads in the current request go to; None means the primary
+_read_alias = ContextVar('careflow_read_alias', default=None)
+
+
+def _pin_key(user_id):
+    return f'careflow:db_pin:{user_id}'
+
+
+def route_reads_to_replica():
+    """Send this request's reads to a random replica; returns a reset token."""
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    return _read_alias.set(random.choice(replicas) if replicas else None)
+
+
+def reset_read_routing(token):
+    _read_alias.reset(token)
+
+
+def reads_from_replica():
+    return _read_alias.get() is not None
+
+
+def use_primary():
+    """Read from the primary for the rest of this request."""
+    _read_alias.set(None)
+
+
+def pin_user(user_id):
+    """Keep the user's reads on the primary until replicas have caught up."""
+    cache.set(_pin_key(user_id), 1, timeout=getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def is_user_pinned(user_id):
+    return cache.get(_pin_key(user_id)) is not None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        # Reads inside a transaction must see its writes (and may lock rows)
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,118 @@
+"""
+Personal ETA push for single queue entries (QueueEntryETAConsumer,
+``ws/queue/<pk>/``), replacing a poll of ``/api/patient/queue/<pk>/``
+every few seconds per phone.
+
+A waiting entry's position is its rank among the waiting entries of its
+queue — its department, or the whole hospital for entries without one — in
+arrival order, the order update_expected_finish_times hands out ETAs in.
+That function already loads the queue in this order, so it pushes the new
+positions and ETAs itself, without another query; ``position`` counts the
+entries ahead through the (hospital, department, status, arrival_time)
+index for a single entry.
+
+Only entries somebody is subscribed to are considered (live_groups), and an
+update goes out only when the entry's status or position changed, or its
+ETA moved by ETA_TOLERANCE or more since the last push: the last pushed
+state of each entry is kept in the shared cache.
+"""
+import json
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from . import live_groups
+from .models import QueueEntry
+
+ETA_TOLERANCE = timedelta(minutes=1)
+REMOVED = 'removed'
+_SENT_TTL = 24 * 60 * 60
+
+
+def queue_scope(hospital_id, department_id):
+    """Filters selecting the waiting entries of a queue."""
+    scope = {'hospital_id': hospital_id, 'status': QueueEntry.Status.WAITING}
+    if department_id:
+        scope['department_id'] = department_id
+    return scope
+
+
+def position(entry):
+    """1-based place of ``entry`` in its queue, or None if it is not waiting."""
+    if entry.status != QueueEntry.Status.WAITING:
+        return None
+    ahead = QueueEntry.objects.filter(**queue_scope(entry.hospital_id, entry.department_id)).filter(
+        Q(arrival_time__lt=entry.arrival_time) | Q(arrival_time=entry.arrival_time, pk__lt=entry.pk)
+    )
+    return ahead.count() + 1
+
+
+def state(entry, position, status=None):
+    """The ``eta`` message for an entry."""
+    return {
+        'type': 'eta',
+        'entry_id': entry.pk,
+        'status': status or entry.status,
+        'position': position,
+        'expected_finish': entry.expected_finish,
+    }
+
+
+def encode(message):
+    return json.dumps(message, cls=DjangoJSONEncoder)
+
+
+def _sent_key(entry_id):
+    return f'careflow:eta_sent:{entry_id}'
+
+
+def _changed(last, message):
+    if last is None:
+        return True
+    status, position, expected_finish = last
+    if (status, position) != (message['status'], message['position']):
+        return True
+    new = message['expected_finish']
+    if (expected_finish is None) != (new is None):
+        return True
+    return new is not None and abs(new - expected_finish) >= ETA_TOLERANCE
+
+
+def push(hospital_id, messages):
+    """Send each watched entry's message to its group if it changed; returns how many were sent."""
+    channel_layer = get_channel_layer()
+    if not channel_layer or not messages:
+        return 0
+    watched = live_groups.watched_entries(hospital_id, [m['entry_id'] for m in messages])
+    if not watched:
+        return 0
+    messages = [m for m in messages if m['entry_id'] in watched]
+    last = cache.get_many([_sent_key(m['entry_id']) for m in messages])
+    changed = [m for m in messages if _changed(last.get(_sent_key(m['entry_id'])), m)]
+    if not changed:
+        return 0
+
+    async def send_all():
+        for message in changed:
+            await channel_layer.group_send(
+                live_groups.entry_group(message['entry_id']), {'type': 'eta_update', 'text': encode(message)},
+            )
+    async_to_sync(send_all)()
+    remember(changed)
+    return len(changed)
+
+
+def remember(messages):
+    """Record ``messages`` as the last state their entries' subscribers have seen."""
+    cache.set_many({
+        _sent_key(m['entry_id']): (m['status'], m['position'], m['expected_finish']) for m in messages
+    }, timeout=_SENT_TTL)
+
+
+def push_queue(hospital_id, ordered_entries):
+    """Push positions and ETAs of a queue's waiting entries, given in queue order."""
+    return push(hospital_id, [state(entry, index + 1) for index, entry in enumerate(ordered_entries)])
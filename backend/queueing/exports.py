@@ -0,0 +1,173 @@
+"""
+Streaming exports of appointments, payments and queue history.
+
+Rows are read with ``QuerySet.iterator()`` — a server-side cursor on
+PostgreSQL, incremental fetches on SQLite — as ``values_list()`` tuples,
+and encoded a batch at a time as NDJSON or CSV, optionally through a
+streaming gzip compressor. Memory stays flat however many rows match, and
+the first bytes go out as soon as the first batch is read. Under ASGI the
+view wraps the stream in ``aiter_chunks``: Django 4.2 would read a sync
+iterator into a list before sending any of it.
+
+CSV text cells that a spreadsheet would run as a formula (patient names,
+failure reasons...) are prefixed with ``'``.
+
+Used by AdminExportView (``/api/admin/export/<dataset>/``) and the
+``export_data`` management command.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime, time, timedelta
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Appointment, Payment, QueueEntry, QueueEntryArchive
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class Dataset:
+    """An exportable model: its columns as (header, lookup) and how filters map onto it."""
+
+    def __init__(self, model, columns, date_field, hospital_field='hospital_id', status_field='status'):
+        self.model = model
+        self.headers = [header for header, _ in columns]
+        self.lookups = [lookup for _, lookup in columns]
+        self.date_field = date_field
+        self.hospital_field = hospital_field
+        self.status_field = status_field
+
+    def queryset(self, hospital=None, start=None, end=None, status=None):
+        """Matching rows as tuples in primary-key order; ``start``/``end`` bound ``date_field``."""
+        filters = {}
+        if hospital:
+            filters[self.hospital_field] = hospital
+        if start:
+            filters[f'{self.date_field}__gte'] = start
+        if end:
+            filters[f'{self.date_field}__lt'] = end
+        if status:
+            filters[self.status_field] = status
+        queryset = self.model.objects.filter(**filters).order_by('pk').values_list(*self.lookups)
+        # Bind the read database now: the rows are fetched after the view has returned
+        return queryset.using(queryset.db)
+
+
+DATASETS = {
+    'appointments': Dataset(Appointment, [
+        ('id', 'id'), ('patient_id', 'patient_id'), ('patient', 'patient__username'),
+        ('hospital_id', 'hospital_id'), ('hospital', 'hospital__name'), ('department', 'department__name'),
+        ('status', 'status'), ('payment_status', 'payment_status'), ('payment_amount', 'payment_amount'),
+        ('payment_id', 'payment_id'), ('slot_start', 'appointment_slot__start_time'),
+        ('created_at', 'created_at'), ('confirmed_at', 'confirmed_at'), ('completed_at', 'completed_at'),
+    ], date_field='created_at'),
+    'payments': Dataset(Payment, [
+        ('id', 'id'), ('transaction_id', 'transaction_id'), ('appointment_id', 'appointment_id'),
+        ('patient', 'patient__username'), ('hospital_id', 'appointment__hospital_id'),
+        ('amount', 'amount'), ('currency', 'currency'), ('gateway', 'payment_gateway'),
+        ('gateway_payment_id', 'gateway_payment_id'), ('status', 'status'), ('payment_method', 'payment_method'),
+        ('failure_reason', 'failure_reason'), ('created_at', 'created_at'), ('paid_at', 'paid_at'),
+    ], date_field='created_at', hospital_field='appointment__hospital_id'),
+    'queue': Dataset(QueueEntry, [
+        ('id', 'id'), ('hospital_id', 'hospital_id'), ('department', 'department__name'),
+        ('patient_name', 'patient_name'), ('status', 'status'), ('arrival_time', 'arrival_time'),
+        ('started_at', 'started_at'), ('finished_at', 'finished_at'), ('expected_finish', 'expected_finish'),
+    ], date_field='arrival_time'),
+    # Finished entries moved out of the live queue by archive_queue; same columns plus archived_at
+    'queue_history': Dataset(QueueEntryArchive, [
+        ('id', 'id'), ('hospital_id', 'hospital_id'), ('department', 'department__name'),
+        ('patient_name', 'patient_name'), ('status', 'status'), ('arrival_time', 'arrival_time'),
+        ('started_at', 'started_at'), ('finished_at', 'finished_at'), ('expected_finish', 'expected_finish'),
+        ('archived_at', 'archived_at'),
+    ], date_field='arrival_time'),
+}
+
+
+def parse_bound(value, end=False):
+    """
+    A ``start``/``end`` filter value as an aware datetime. ``YYYY-MM-DD``
+    means that whole day (so an ``end`` date is inclusive); ISO datetimes are
+    taken as given. Raises ValueError for anything else.
+    """
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f'{value!r} is not a date (YYYY-MM-DD) or ISO 8601 datetime')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+# Leading characters that make Excel / LibreOffice / Sheets evaluate a cell
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _ndjson_batch(headers, rows):
+    return b''.join(
+        orjson.dumps(dict(zip(headers, row)), default=str, option=orjson.OPT_APPEND_NEWLINE) for row in rows
+    )
+
+
+def _csv_batch(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([[_cell(value) for value in row] for row in rows])
+    return buffer.getvalue().encode()
+
+
+def stream(dataset, queryset, output='ndjson', gzip=False, batch_size=1000):
+    """Yield the export as byte chunks, one per ``batch_size`` rows."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits 31: gzip container
+
+    def emit(data):
+        if compressor is None:
+            return data
+        # Sync flush, so each batch leaves the compressor instead of waiting for the end
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    if output == 'csv':
+        yield emit(_csv_batch([dataset.headers]))
+
+    batch = []
+    for row in queryset.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield emit(_csv_batch(batch) if output == 'csv' else _ndjson_batch(dataset.headers, batch))
+            batch = []
+    if batch:
+        yield emit(_csv_batch(batch) if output == 'csv' else _ndjson_batch(dataset.headers, batch))
+    if compressor is not None:
+        yield compressor.flush()
+
+
+async def aiter_chunks(chunks):
+    """
+    A sync ``stream()`` as an async iterator, for StreamingHttpResponse under
+    ASGI: each chunk is read through sync_to_async (in the one sync thread,
+    where the cursor lives) and sent before the next is read.
+    """
+    read = sync_to_async(next)
+    try:
+        while (chunk := await read(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,187 @@
+"""
+Local fake of the Razorpay REST API for tests and benchmarks.
+
+Usage:
+    with FakeGatewayServer() as server:
+        gateway = RazorpayGateway('key', 'secret', base_url=server.url)
+        ...
+
+The server speaks HTTP/1.1 with keep-alive, records how many TCP
+connections it accepted, and can inject latency or error responses.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.fake.connection_opened()
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        body = self._read_json() if method == 'POST' else None
+        fake.before_request()
+        failure = fake.pop_failure()
+        if failure == 'garbled':
+            payload = b'<html>Bad gateway</html>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        if failure:
+            self._send(failure, {'error': {'code': 'SERVER_ERROR', 'description': 'Injected failure'}})
+            return
+        status, payload = fake.handle(method, self.path, body)
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that hit their read timeout hang up mid-response; that is expected.
+        pass
+
+
+class FakeGatewayServer:
+    """In-process Razorpay-compatible server bound to an ephemeral port."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.orders = {}
+        self.payments = {}
+        self.connections = 0
+        self.requests = 0
+        self._failures = []
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    # ─── lifecycle ───
+
+    def start(self):
+        self._httpd = _Server(('127.0.0.1', 0), _Handler)
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f'http://{host}:{port}'
+
+    # ─── fault injection ───
+
+    def fail_next(self, count=1, status=503):
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def garble_next(self, count=1):
+        """Answer the next ``count`` requests with 200 and a body that is not JSON."""
+        with self._lock:
+            self._failures.extend(['garbled'] * count)
+
+    def pop_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections += 1
+
+    def before_request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # ─── gateway state ───
+
+    def capture(self, order_id, method='upi', status='captured'):
+        """Simulate the customer paying ``order_id``; return the payment."""
+        payment = {
+            'id': f'pay_{uuid.uuid4().hex[:14]}',
+            'entity': 'payment',
+            'order_id': order_id,
+            'amount': self.orders[order_id]['amount'],
+            'status': status,
+            'method': method,
+        }
+        with self._lock:
+            self.payments[payment['id']] = payment
+            if status == 'captured':
+                self.orders[order_id]['status'] = 'paid'
+        return payment
+
+    def handle(self, method, path, body):
+        parts = [p for p in path.split('?')[0].split('/') if p]
+        if parts[:1] != ['v1']:
+            return 404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}}
+        parts = parts[1:]
+
+        if method == 'POST' and parts == ['orders']:
+            order = {
+                'id': f'order_{uuid.uuid4().hex[:14]}',
+                'entity': 'order',
+                'amount': body.get('amount'),
+                'currency': body.get('currency', 'INR'),
+                'receipt': body.get('receipt'),
+                'status': 'created',
+            }
+            with self._lock:
+                self.orders[order['id']] = order
+            return 200, order
+
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'orders' and parts[1] in self.orders:
+            return 200, self.orders[parts[1]]
+
+        if method == 'GET' and len(parts) == 3 and parts[0] == 'orders' and parts[2] == 'payments':
+            items = [p for p in self.payments.values() if p['order_id'] == parts[1]]
+            return 200, {'entity': 'collection', 'count': len(items), 'items': items}
+
+        if method == 'GET' and len(parts) == 2 and parts[0] == 'payments' and parts[1] in self.payments:
+            return 200, self.payments[parts[1]]
+
+        return 400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}}
@@ -0,0 +1,126 @@
+"""
+Bounded executor for password hashing.
+
+PBKDF2 is deliberately expensive CPU work (hashlib releases the GIL while
+it runs). Routing every hash and check through one small per-process pool
+caps how many cores a login or registration burst can take, so cheap read
+requests keep getting CPU. When the pool and its queue are full, requests
+fail fast with 503 + Retry-After instead of stacking up in every worker
+thread.
+
+This bounds how much CPU hashing can use; it does not free the request
+thread. The calling view blocks on the result (``run``), so each login
+occupies its own request thread (ASGI, where Django gives every request
+its own sync thread) or worker thread (WSGI) while it waits. Under WSGI
+that wait is what still competes with reads: a burst of logins can hold
+every worker thread even though only MAX_WORKERS of them are hashing.
+
+Hashes created with outdated parameters (e.g. fewer PBKDF2 iterations
+than the configured hasher) are upgraded after a successful check, in the
+background, so the login response does not pay for a second hash.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import connection
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is busy, please retry shortly.'
+    default_code = 'hashing_busy'
+    wait = 1  # rendered as Retry-After by DRF's exception handler
+
+
+class HashingExecutor:
+    """Thread pool with a hard cap on running + queued hashing jobs."""
+
+    def __init__(self, max_workers=2, max_pending=32, timeout=10):
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pwhash')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        # Blocks the calling thread until the hash is done (see the module docstring)
+        try:
+            return self.submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy()
+
+
+_settings = getattr(settings, 'PASSWORD_HASHING', {})
+executor = HashingExecutor(
+    max_workers=_settings.get('MAX_WORKERS', 2),
+    max_pending=_settings.get('MAX_PENDING', 32),
+    timeout=_settings.get('TIMEOUT', 10),
+)
+
+
+def make_password(raw_password):
+    """Hash ``raw_password`` on the bounded executor."""
+    return executor.run(hashers.make_password, raw_password)
+
+
+def set_password(user, raw_password):
+    """Drop-in for ``user.set_password`` that hashes on the bounded executor."""
+    user.password = make_password(raw_password)
+    user._password = raw_password
+
+
+def _upgrade_hash(user_id, old_encoded, raw_password):
+    try:
+        from .models import User
+
+        new_encoded = hashers.make_password(raw_password)
+        # Only replace the exact hash we checked; a concurrent password change wins
+        User.objects.filter(pk=user_id, password=old_encoded).update(password=new_encoded)
+    except Exception:
+        logger.exception('Password hash upgrade failed for user %s', user_id)
+    finally:
+        connection.close()  # pool threads are long-lived; don't hold a connection open
+
+
+def check_password(user, raw_password):
+    """
+    Drop-in for ``user.check_password`` that verifies on the bounded executor
+    and upgrades outdated hashes in the background.
+    """
+    encoded = user.password
+    if not encoded or not hashers.is_password_usable(encoded):
+        return False
+    if not executor.run(hashers.check_password, raw_password, encoded):
+        return False
+
+    try:
+        hasher = hashers.identify_hasher(encoded)
+        must_update = (
+            hasher.algorithm != hashers.get_hasher('default').algorithm
+            or hasher.must_update(encoded)
+        )
+    except ValueError:
+        must_update = False
+    if must_update:
+        try:
+            executor.submit(_upgrade_hash, user.pk, encoded, raw_password)
+        except HashingBusy:
+            pass  # upgrade again on a later login
+    return True
@@ -0,0 +1,128 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+Decorate an APIView handler with ``@idempotent``. When the client sends an
+``Idempotency-Key`` header, the first request with that key runs the view
+and its response is stored; any repeat within IDEMPOTENCY_KEY_TTL replays
+the stored response without running the view again. Concurrent duplicates
+are collapsed by the (user, key) unique constraint: only the request that
+inserts the record executes, the others get 409 with Retry-After at once.
+
+A claim is a lease of IDEMPOTENCY_LEASE_SECONDS from ``started_at``: if the
+owner died mid-request (worker killed), a retry after the lease takes the
+record over and runs the view, instead of getting 409 until the key expires.
+A takeover moves ``started_at``, so an owner that was only slow finds its
+claim gone and leaves the record to the request that took it over.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def _conflict(message, retry_after=None):
+    response = Response({'error': message}, status=status.HTTP_409_CONFLICT)
+    if retry_after is not None:
+        response['Retry-After'] = str(retry_after)
+    return response
+
+
+def _take_over(record, now, lease):
+    """Claim an in-progress record whose owner's lease ran out; False if another request holds it."""
+    claimed = IdempotencyRecord.objects.filter(
+        pk=record.pk, state='in_progress', started_at__lte=now - lease,
+    ).update(started_at=now)
+    if claimed:
+        record.started_at = now
+    return claimed == 1
+
+
+def _owned(record):
+    """The record, if this request's claim on it has not been taken over."""
+    return IdempotencyRecord.objects.filter(pk=record.pk, started_at=record.started_at)
+
+
+def idempotent(handler):
+    """Make an APIView POST handler replay its response for repeated keys."""
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({
+                'error': f'{HEADER} must be at most 255 characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        fingerprint = _fingerprint(request)
+        now = timezone.now()
+        ttl = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+        lease = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 60))
+
+        # Expired keys may be reused
+        IdempotencyRecord.objects.filter(user=user, key=key, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, expires_at=now + ttl,
+                )
+        except IntegrityError:
+            record = IdempotencyRecord.objects.filter(user=user, key=key).first()
+            if record is None:
+                # The owner failed and released the key; let the client retry
+                return _conflict('The original request failed. Please retry.')
+            if record.fingerprint != fingerprint:
+                return Response({
+                    'error': f'{HEADER} was already used with a different request'
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record.state == 'completed':
+                return _replay(record)
+            if not _take_over(record, now, lease):
+                remaining = (record.started_at + lease - now).total_seconds()
+                return _conflict(
+                    'A request with this Idempotency-Key is still in progress', max(1, min(int(remaining), 5)),
+                )
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except Exception:
+            _owned(record).delete()
+            raise
+
+        if response.status_code >= 500 or getattr(response, 'data', None) is None:
+            # Server errors are not final; release the key so a retry runs again
+            _owned(record).delete()
+            return response
+
+        _owned(record).update(
+            state='completed', response_status=response.status_code,
+            response_body=json.loads(json.dumps(response.data, cls=JSONEncoder)),
+        )
+        return response
+
+    return wrapper
@@ -0,0 +1,133 @@
+"""
+Channel-layer groups for live bed/queue status.
+
+A HospitalStatusConsumer sits in its hospital's group, for hospital-wide
+snapshots, and/or in one group per department it subscribed to, for that
+department's own snapshot. signals.py sends each Bed/QueueEntry change to
+the hospital group and to the group of the changed row's department only.
+A QueueEntryETAConsumer sits in its entry's group (eta.py). SSE streams
+(sse.py) join the hospital and department groups like a consumer does.
+
+Department snapshots and ETA updates cost queries or cache reads, so they
+are only built for what someone is watching: consumers count their
+subscriptions in the shared cache (Redis when configured, so across
+workers). A worker that dies without unsubscribing leaves its count behind;
+that costs updates nobody reads, never a missed one.
+
+Payloads are JSON-encoded once per group send, not once per socket, and go
+through the channel layer as text — msgpack (channels_redis) cannot carry
+the snapshot's datetimes.
+"""
+import json
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+MAX_DEPARTMENTS = 20
+
+
+def department_ids(values):
+    """Department ids from ?departments=1,2 / a message; None if any is not an integer."""
+    try:
+        return {int(value) for value in values if str(value).strip()}
+    except (TypeError, ValueError):
+        return None
+
+
+def hospital_group(hospital_id):
+    return f'hospital_{hospital_id}'
+
+
+def department_group(hospital_id, department_id):
+    return f'hospital_{hospital_id}_department_{department_id}'
+
+
+def entry_group(entry_id):
+    return f'queue_entry_{entry_id}'
+
+
+def _watch_key(hospital_id, department_id):
+    return f'careflow:ws_watchers:{hospital_id}:{department_id}'
+
+
+def _entry_watch_key(entry_id):
+    return f'careflow:ws_watchers:entry:{entry_id}'
+
+
+def _hospital_entries_watch_key(hospital_id):
+    return f'careflow:ws_watchers:{hospital_id}:entries'
+
+
+def _incr(key):
+    # No expiry: a board can stay subscribed for weeks
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def _decr(key):
+    try:
+        # Left at 0 rather than deleted, so a concurrent _incr() is never lost
+        if cache.decr(key) < 0:
+            cache.set(key, 0, timeout=None)
+    except ValueError:
+        pass
+
+
+def watch(hospital_id, department_id):
+    _incr(_watch_key(hospital_id, department_id))
+
+
+def unwatch(hospital_id, department_id):
+    _decr(_watch_key(hospital_id, department_id))
+
+
+def is_watched(hospital_id, department_id):
+    return (cache.get(_watch_key(hospital_id, department_id)) or 0) > 0
+
+
+def watch_entry(hospital_id, entry_id):
+    _incr(_entry_watch_key(entry_id))
+    _incr(_hospital_entries_watch_key(hospital_id))
+
+
+def unwatch_entry(hospital_id, entry_id):
+    _decr(_entry_watch_key(entry_id))
+    _decr(_hospital_entries_watch_key(hospital_id))
+
+
+def watched_entries(hospital_id, entry_ids):
+    """The ids among ``entry_ids`` with an ETA subscriber; one cache read when the hospital has none."""
+    if not (cache.get(_hospital_entries_watch_key(hospital_id)) or 0) > 0:
+        return set()
+    counts = cache.get_many([_entry_watch_key(entry_id) for entry_id in entry_ids])
+    return {entry_id for entry_id in entry_ids if (counts.get(_entry_watch_key(entry_id)) or 0) > 0}
+
+
+def _version_key(hospital_id):
+    return f'careflow:live_version:{hospital_id}'
+
+
+def bump_version(hospital_id):
+    """Number the hospital's next broadcast (the SSE event id, sse.py)."""
+    key = _version_key(hospital_id)
+    # Start from the clock, so numbers keep rising if the cache loses the counter
+    start = int(time.time() * 1000)
+    if cache.add(key, start, timeout=None):
+        return start
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return bump_version(hospital_id)
+
+
+def current_version(hospital_id):
+    return cache.get(_version_key(hospital_id)) or 0
+
+
+def encode_status(snapshot):
+    """The ``status`` message for a snapshot, as sent to clients."""
+    return json.dumps({'type': 'status', **snapshot}, cls=DjangoJSONEncoder)
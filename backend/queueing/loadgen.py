@@ -0,0 +1,398 @@
+"""
+Synthetic hospital-day data and workload.
+
+seed() fills the database with a hospital network at a configurable scale
+(millions of rows at the top end) in batched bulk inserts: hospitals,
+departments, beds, patients, a history of queue visits and booked, paid
+appointments, today's live queue and open slots for the coming days.
+
+Workload replays a day's operation mix against that data in-process: the
+HTTP operations go through the full Django stack with the test client and
+the WebSocket operation through the ASGI application, so the numbers
+include middleware, authentication, serializers and signals but no network.
+Every operation is timed; report() turns the samples into benchmark rows
+(see benchmarks.summarize) so runs can be compared across commits.
+
+Used by the ``seed_hospital_day`` and ``run_workload`` commands and by the
+``hospital_day`` benchmark scenario.
+"""
+import itertools
+import json
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Appointment, AppointmentSlot, Bed, Department, Hospital, Payment, QueueEntry, User
+from .response_cache import bump_model_version
+
+# Relative weights of the operations in a replayed day
+DEFAULT_MIX = {'arrival': 15, 'start': 10, 'complete': 10, 'book': 10, 'pay': 5, 'poll': 45, 'ws': 5}
+
+DEFAULT_PASSWORD = 'loadtest-pass-1'
+
+
+def parse_mix(text):
+    """'arrival=15,poll=40' → {'arrival': 15, 'poll': 40}."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Unknown operation: {name}')
+        mix[name] = int(weight)
+    return mix
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def _explicit_timestamps(*fields):
+    """Let bulk_create keep the historical values set on auto_now_add fields."""
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now_add in saved:
+            field.auto_now_add = auto_now_add
+
+
+# ─── Seeding ───
+
+def seed(hospitals=3, departments=5, beds=20, patients=1000, days=30, visits=40, slots=16,
+         booked=0.7, prefix='load', batch_size=5000, random_seed=0, log=None):
+    """
+    Seed a hospital network and return the number of rows created per model.
+
+    Per department: ``beds`` beds, and for each of the last ``days`` days
+    ``visits`` finished queue visits and ``slots`` appointment slots, of
+    which ``booked`` are booked by a random patient as completed, paid
+    appointments. Today has ``visits`` arrivals so far (some finished, some
+    in progress, the rest waiting) and the next two days have open slots.
+
+    Rows are created without model signals, so nothing is broadcast or
+    mirrored to MongoDB (run ``sync_mongo`` afterwards if that is wanted).
+    """
+    from django.contrib.auth.hashers import make_password
+
+    rng = random.Random(random_seed)
+    log = log or (lambda message: None)
+    counts = dict.fromkeys(['hospitals', 'departments', 'beds', 'patients', 'queue_entries',
+                            'slots', 'appointments', 'payments'], 0)
+    now = timezone.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    hospital_rows = Hospital.objects.bulk_create([
+        Hospital(name=f'{prefix} Hospital {i}', address=f'{i} Load Street') for i in range(hospitals)
+    ])
+    department_rows = Department.objects.bulk_create([
+        Department(hospital=h, name=f'Department {j}') for h in hospital_rows for j in range(departments)
+    ])
+    counts['hospitals'], counts['departments'] = len(hospital_rows), len(department_rows)
+    # bulk_create sends no signals
+    bump_model_version('hospital')
+    bump_model_version('department')
+
+    bed_statuses = [Bed.Status.AVAILABLE] * 5 + [Bed.Status.OCCUPIED] * 4 + [Bed.Status.CLEANING]
+    for batch in _batches((
+        Bed(hospital_id=d.hospital_id, department=d, label=f'{d.pk}-{i}', status=rng.choice(bed_statuses))
+        for d in department_rows for i in range(beds)
+    ), batch_size):
+        counts['beds'] += len(Bed.objects.bulk_create(batch))
+
+    password = make_password(DEFAULT_PASSWORD)
+    User.objects.get_or_create(username=f'{prefix}-admin', defaults={
+        'password': password, 'role': 'admin', 'is_staff': True,
+    })
+    patient_ids = []
+    for batch in _batches((
+        User(username=f'{prefix}-patient-{i}', email=f'{prefix}-patient-{i}@example.com', password=password)
+        for i in range(patients)
+    ), batch_size):
+        patient_ids.extend(u.pk for u in User.objects.bulk_create(batch))
+    counts['patients'] = len(patient_ids)
+    log(f'Seeded {len(hospital_rows)} hospitals, {counts["beds"]} beds, {counts["patients"]} patients')
+
+    with _explicit_timestamps(QueueEntry._meta.get_field('arrival_time'),
+                              Appointment._meta.get_field('created_at'),
+                              Payment._meta.get_field('created_at')):
+        for offset in range(-days, 3):
+            day = midnight + timedelta(days=offset)
+            if offset <= 0:
+                counts['queue_entries'] += _seed_visits(rng, department_rows, day, visits, now, batch_size, prefix)
+            created = _seed_slots(rng, department_rows, patient_ids, day, offset, slots, booked, batch_size, prefix)
+            for key, value in created.items():
+                counts[key] += value
+            if offset % 10 == 0:
+                log(f'  {day:%Y-%m-%d}: {counts["queue_entries"]} visits, {counts["appointments"]} appointments')
+    return counts
+
+
+def _seed_visits(rng, departments, day, visits, now, batch_size, prefix):
+    """One day of walk-in visits per department; today's are still in the queue."""
+    today = day.date() == now.date()
+    opening = now - timedelta(hours=8) if today else day + timedelta(hours=8)
+    spacing = (now - opening if today else timedelta(hours=12)) / max(visits, 1)
+
+    def entries():
+        for d in departments:
+            for i in range(visits):
+                arrival = opening + spacing * i
+                entry = QueueEntry(hospital_id=d.hospital_id, department=d, arrival_time=arrival,
+                                   patient_name=f'{prefix} walk-in {d.pk}-{i}')
+                share = i / visits
+                if today and share >= 0.7:
+                    entry.status = QueueEntry.Status.WAITING
+                elif today and share >= 0.6:
+                    entry.status, entry.started_at = QueueEntry.Status.IN_PROGRESS, now - timedelta(minutes=10)
+                elif rng.random() < 0.05:
+                    entry.status = QueueEntry.Status.CANCELLED
+                else:
+                    entry.status = QueueEntry.Status.DONE
+                    entry.started_at = arrival + timedelta(minutes=rng.randint(5, 45))
+                    entry.finished_at = entry.started_at + timedelta(minutes=rng.randint(5, 25))
+                yield entry
+
+    return sum(len(QueueEntry.objects.bulk_create(batch)) for batch in _batches(entries(), batch_size))
+
+
+def _seed_slots(rng, departments, patient_ids, day, offset, slots, booked, batch_size, prefix):
+    """One day of 30-minute slots per department, with appointments for the booked ones."""
+    counts = {'slots': 0, 'appointments': 0, 'payments': 0}
+    # Past slots are booked at the requested rate, upcoming ones at a third of it
+    rate = booked if offset < 0 else booked / 3
+    for batch in _batches((
+        AppointmentSlot(
+            hospital_id=d.hospital_id, department=d,
+            start_time=day + timedelta(hours=9, minutes=30 * i), end_time=day + timedelta(hours=9, minutes=30 * (i + 1)),
+            is_booked=bool(patient_ids) and rng.random() < rate,
+        )
+        for d in departments for i in range(slots)
+    ), batch_size):
+        created = AppointmentSlot.objects.bulk_create(batch)
+        counts['slots'] += len(created)
+        appointments = [
+            Appointment(
+                patient_id=rng.choice(patient_ids), hospital_id=slot.hospital_id, department_id=slot.department_id,
+                appointment_slot=slot, payment_amount=500, payment_status='paid',
+                status='completed' if offset < 0 else 'confirmed',
+                created_at=slot.start_time - timedelta(days=1), confirmed_at=slot.start_time - timedelta(days=1),
+                completed_at=slot.end_time if offset < 0 else None,
+            )
+            for slot in created if slot.is_booked
+        ]
+        if not appointments:
+            continue
+        appointments = Appointment.objects.bulk_create(appointments)
+        payments = Payment.objects.bulk_create([
+            Payment(
+                appointment=a, patient_id=a.patient_id, amount=500, status='success',
+                transaction_id=f'{prefix.upper()}{a.pk:012d}', created_at=a.created_at, paid_at=a.created_at,
+            )
+            for a in appointments
+        ])
+        counts['appointments'] += len(appointments)
+        counts['payments'] += len(payments)
+    return counts
+
+
+def flush(prefix='load'):
+    """Delete everything seed() created with this prefix."""
+    hospitals = Hospital.objects.filter(name__startswith=f'{prefix} Hospital ')
+    deleted = hospitals.delete()[0]
+    deleted += User.objects.filter(username__startswith=f'{prefix}-').delete()[0]
+    return deleted
+
+
+# ─── Workload ───
+
+class Workload:
+    """
+    Replays the operation mix against data seeded with ``prefix``:
+
+    * arrival  — admin adds a walk-in to a department queue
+    * start / complete — admin moves a queued patient through the visit
+    * book     — patient books an open slot
+    * pay      — patient initiates and verifies a test-mode payment for a booking
+    * poll     — anonymous live-status poll, as a ward display does
+    * ws       — WebSocket connect, initial snapshot, explicit refresh
+
+    Operations whose pool is empty (nothing waiting, no open slots) are
+    skipped for that draw. Throttling is off unless ``throttle`` is set,
+    since every admin operation runs as the one seeded admin.
+    """
+
+    def __init__(self, prefix='load', mix=None, random_seed=0, throttle=False, pool_size=10_000):
+        self.prefix = prefix
+        self.mix = {name: weight for name, weight in (mix or DEFAULT_MIX).items() if weight > 0}
+        self.rng = random.Random(random_seed)
+        self.throttle = throttle
+        self.pool_size = pool_size
+        self.samples = {name: [] for name in self.mix}
+        self.errors = {name: 0 for name in self.mix}
+
+    def load(self):
+        """Fetch the seeded users and the pools the operations draw from."""
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        hospitals = Hospital.objects.filter(name__startswith=f'{self.prefix} Hospital ')
+        self.departments = list(Department.objects.filter(hospital__in=hospitals).values_list('hospital_id', 'pk'))
+        if not self.departments:
+            raise LookupError(f"No seeded data with prefix '{self.prefix}'; run seed_hospital_day first")
+        self.hospital_ids = sorted({hospital_id for hospital_id, _ in self.departments})
+
+        admin = User.objects.get(username=f'{self.prefix}-admin')
+        self.admin_token = str(AccessToken.for_user(admin))
+        patients = User.objects.filter(username__startswith=f'{self.prefix}-patient-')[:1000]
+        self.patient_tokens = {p.pk: str(AccessToken.for_user(p)) for p in patients}
+
+        queue = QueueEntry.objects.filter(hospital_id__in=self.hospital_ids)
+        self.waiting = list(queue.filter(status=QueueEntry.Status.WAITING).values_list('pk', flat=True)[:self.pool_size])
+        self.in_progress = list(
+            queue.filter(status=QueueEntry.Status.IN_PROGRESS).values_list('pk', flat=True)[:self.pool_size]
+        )
+        self.open_slots = list(AppointmentSlot.objects.filter(
+            hospital_id__in=self.hospital_ids, is_booked=False, start_time__gte=timezone.now(),
+        ).values_list('pk', 'hospital_id', 'department_id')[:self.pool_size])
+        self.rng.shuffle(self.open_slots)
+        self.unpaid = []  # (patient_id, appointment_id) booked during the run
+        return self
+
+    # HTTP plumbing
+
+    def _request(self, method, path, token=None, body=None):
+        from django.test import Client
+
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        if body is not None:
+            headers.update(data=json.dumps(body), content_type='application/json')
+        return getattr(Client(), method)(path, secure=True, **headers)
+
+    def _take(self, pool):
+        """Remove and return a random item (order does not matter, so swap-remove)."""
+        index = self.rng.randrange(len(pool))
+        pool[index], pool[-1] = pool[-1], pool[index]
+        return pool.pop()
+
+    # Operations: each returns the HTTP status, or None when its pool is empty
+
+    def op_arrival(self):
+        hospital_id, department_id = self.rng.choice(self.departments)
+        response = self._request('post', '/api/queue/', self.admin_token, {
+            'hospital': hospital_id, 'department': department_id,
+            'patient_name': f'{self.prefix} arrival {self.rng.getrandbits(32):08x}',
+        })
+        if response.status_code == 201:
+            self.waiting.append(response.json()['id'])
+        return response.status_code
+
+    def op_start(self):
+        if not self.waiting:
+            return None
+        pk = self._take(self.waiting)
+        response = self._request('post', f'/api/queue/{pk}/start/', self.admin_token)
+        if response.status_code == 200:
+            self.in_progress.append(pk)
+        return response.status_code
+
+    def op_complete(self):
+        if not self.in_progress:
+            return None
+        pk = self._take(self.in_progress)
+        return self._request('post', f'/api/queue/{pk}/complete/', self.admin_token).status_code
+
+    def op_book(self):
+        if not self.open_slots or not self.patient_tokens:
+            return None
+        slot_id, hospital_id, department_id = self.open_slots.pop()
+        patient_id = self.rng.choice(list(self.patient_tokens))
+        response = self._request('post', '/api/patient/book-appointment/', self.patient_tokens[patient_id], {
+            'hospital_id': hospital_id, 'department_id': department_id, 'appointment_slot_id': slot_id,
+        })
+        if response.status_code == 201:
+            self.unpaid.append((patient_id, response.json()['appointment']['id']))
+        return response.status_code
+
+    def op_pay(self):
+        if not self.unpaid:
+            return None
+        patient_id, appointment_id = self._take(self.unpaid)
+        token = self.patient_tokens[patient_id]
+        response = self._request('post', '/api/patient/payment/initiate/', token, {'appointment_id': appointment_id})
+        if response.status_code != 201:
+            return response.status_code
+        return self._request('post', '/api/patient/payment/verify/', token, {
+            'transaction_id': response.json()['transaction_id'], 'test_mode': True,
+        }).status_code
+
+    def op_poll(self):
+        return self._request('get', f'/api/status/{self.rng.choice(self.hospital_ids)}/').status_code
+
+    def op_ws(self):
+        from asgiref.sync import async_to_sync
+
+        return async_to_sync(self._ws_session)(self.rng.choice(self.hospital_ids))
+
+    async def _ws_session(self, hospital_id):
+        # asgiref's communicator rather than channels.testing, which needs daphne
+        from asgiref.testing import ApplicationCommunicator
+
+        from hospital_queue.asgi import application
+
+        path = f'/ws/hospitals/{hospital_id}/'
+        communicator = ApplicationCommunicator(application, {
+            'type': 'websocket', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'headers': [], 'subprotocols': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        if (await communicator.receive_output(timeout=5))['type'] != 'websocket.accept':
+            return 403
+        try:
+            json.loads((await communicator.receive_output(timeout=5))['text'])
+            await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'refresh'})})
+            json.loads((await communicator.receive_output(timeout=5))['text'])
+        finally:
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(timeout=5)
+        return 200
+
+    # Driver
+
+    def run(self, operations):
+        """Run ``operations`` draws from the mix; return the wall-clock seconds."""
+        from django.conf import settings
+        from django.test import override_settings
+
+        rest_framework = dict(settings.REST_FRAMEWORK)
+        if not self.throttle:
+            rest_framework['DEFAULT_THROTTLE_RATES'] = {}
+        names, weights = zip(*self.mix.items())
+        started = time.perf_counter()
+        with override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK=rest_framework):
+            for name in self.rng.choices(names, weights, k=operations):
+                op_started = time.perf_counter()
+                try:
+                    status_code = getattr(self, f'op_{name}')()
+                except Exception:
+                    status_code = 599
+                if status_code is None:
+                    continue
+                self.samples[name].append(time.perf_counter() - op_started)
+                if status_code >= 400:
+                    self.errors[name] += 1
+        return time.perf_counter() - started
+
+    def report(self, scenario_name='workload'):
+        from .benchmarks import summarize
+
+        return [
+            summarize(scenario_name, name, samples, errors=self.errors[name])
+            for name, samples in self.samples.items() if samples
+        ]
@@ -0,0 +1,193 @@
+"""
+Non-blocking JSON-lines logging (settings.LOGGING routes the ``careflow``
+and ``queueing`` loggers here).
+
+A logging call on the request thread only turns its record into a small
+dict — message, level, logger, ``extra=`` fields and any traceback — and
+puts it on a bounded in-memory queue. One background thread per process
+drains the queue in batches, serializes them to JSON lines and writes each
+batch with a single write + flush, to a file rotated by size or to a stream.
+
+When the writer falls behind and the queue is full, records are dropped
+instead of blocking the caller: ``drop='newest'`` discards the incoming
+record, ``drop='oldest'`` evicts the oldest queued one to make room. Either
+way memory stays bounded by ``queue_size`` records, and the handler counts
+what it enqueued, dropped and wrote (``stats()``, and careflow_log_records_total
+at /metrics).
+"""
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import weakref
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+DROP_NEWEST = 'newest'
+DROP_OLDEST = 'oldest'
+
+# Attributes every LogRecord has; anything else on a record came from ``extra=``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_exception_formatter = logging.Formatter()
+_STOP = object()
+_handlers = weakref.WeakSet()
+
+
+def compact(record):
+    """The fields of a record worth keeping, as a JSON-ready dict."""
+    entry = {
+        'ts': round(record.created, 6),
+        'level': record.levelname,
+        'logger': record.name,
+        'msg': record.getMessage(),
+    }
+    for key, value in record.__dict__.items():
+        if key not in _RECORD_ATTRS:
+            entry[key] = value
+    if record.exc_info:
+        entry['exc'] = _exception_formatter.formatException(record.exc_info)
+    return entry
+
+
+def dumps(entry):
+    return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Same line format, for handlers that write synchronously."""
+
+    def format(self, record):
+        return dumps(compact(record))
+
+
+class JsonLinesWriter:
+    """Writes batches of entries as JSON lines to a size-rotated file, or to a stream."""
+
+    def __init__(self, path='', max_bytes=0, backup_count=0, stream=None):
+        self.file = None
+        self.stream = stream or sys.stderr
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+            self.stream = self.file.stream
+
+    def write(self, entries):
+        self.stream.write(''.join(dumps(entry) + '\n' for entry in entries))
+        self.stream.flush()
+        # Rotate between batches, so a file can overshoot max_bytes by at most one batch
+        if self.file and self.file.maxBytes and self.stream.tell() >= self.file.maxBytes:
+            self.file.doRollover()
+            self.stream = self.file.stream
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Queue records for a background writer thread; never block the caller."""
+
+    def __init__(self, path='', max_bytes=0, backup_count=0, stream=None,
+                 queue_size=10000, batch_size=500, drop=DROP_NEWEST):
+        if drop not in (DROP_NEWEST, DROP_OLDEST):
+            raise ValueError(f'drop must be {DROP_NEWEST!r} or {DROP_OLDEST!r}, not {drop!r}')
+        super().__init__(queue.Queue(queue_size))
+        self.writer_options = {'path': path, 'max_bytes': max_bytes, 'backup_count': backup_count, 'stream': stream}
+        self.batch_size = batch_size
+        self.drop = drop
+        self.enqueued = self.dropped = self.written = self.batches = self.write_errors = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        _handlers.add(self)
+
+    def prepare(self, record):
+        return compact(record)
+
+    def enqueue(self, entry):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            if self.drop == DROP_NEWEST:
+                return
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.queue.put_nowait(entry)
+            except (queue.Empty, queue.Full):
+                return
+        self.enqueued += 1
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the parent's writer thread did not come along, and neither should its backlog
+                self.queue = queue.Queue(self.queue.maxsize)
+            self._thread = threading.Thread(target=self._drain, daemon=True, name='log-writer')
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _drain(self):
+        writer = JsonLinesWriter(**self.writer_options)
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [entry for entry in batch if entry is not _STOP]
+            try:
+                if batch:
+                    writer.write(batch)
+                    self.written += len(batch)
+                    self.batches += 1
+            except Exception:
+                self.write_errors += 1
+            finally:
+                for _ in range(len(batch) + stopping):
+                    self.queue.task_done()
+        writer.close()
+
+    def flush(self, timeout=5.0):
+        """Wait (up to ``timeout`` seconds) until everything queued so far is written."""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def close(self):
+        # logging.shutdown() calls this at exit: write what is left, then stop the thread
+        if self._pid == os.getpid() and self._thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=1)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=5)
+        super().close()
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'written': self.written,
+            'batches': self.batches,
+            'write_errors': self.write_errors,
+        }
+
+
+def pipelines():
+    """The BoundedQueueHandlers alive in this process."""
+    return list(_handlers)
@@ -0,0 +1,42 @@
+"""
+Management command to move finished queue entries into the history table.
+
+Done and cancelled entries older than --older-than-hours (default:
+QUEUE_ARCHIVE_AFTER_HOURS) are copied to QueueEntryArchive and deleted from
+QueueEntry in primary-key batches, one short transaction each. Safe to run
+from cron while the queue is live.
+
+Usage: python manage.py archive_queue --older-than-hours 48 --batch-size 1000
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ... import archive
+
+
+class Command(BaseCommand):
+    help = 'Move done and cancelled queue entries older than a cutoff into the queue history table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=float,
+                            help='Archive entries finished before this many hours ago (default: QUEUE_ARCHIVE_AFTER_HOURS)')
+        parser.add_argument('--batch-size', type=int, help='Entries moved per transaction (default: QUEUE_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches, to leave room for live traffic (default: 0)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['older_than_hours'] is None:
+            cutoff = archive.default_cutoff()
+        else:
+            cutoff = timezone.now() - timedelta(hours=options['older_than_hours'])
+
+        if options['dry_run']:
+            count = archive.archivable(cutoff).count()
+            self.stdout.write(f'{count} queue entries finished before {cutoff:%Y-%m-%d %H:%M} would be archived')
+            return
+
+        moved = archive.archive_finished(cutoff, batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} queue entries finished before {cutoff:%Y-%m-%d %H:%M}'))
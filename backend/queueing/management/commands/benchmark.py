@@ -0,0 +1,54 @@
+"""
+Management command to run the hot-path benchmarks in queueing/benchmarks.py.
+Usage:
+    python manage.py benchmark --list
+    python manage.py benchmark confirmations --size 2000 --json bench.json
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from queueing.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Run hot-path benchmarks against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run (default: all)')
+        parser.add_argument('--size', type=int, default=500, help='Operations per variant (default: 500)')
+        parser.add_argument('--json', help='Write result rows to this path')
+        parser.add_argument('--list', action='store_true', help='List available scenarios')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, (_, description) in SCENARIOS.items():
+                self.stdout.write(f'{name:16} {description}')
+            return
+
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [n for n in names if n not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        # Never touch real data: every run gets a fresh test database
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        rows = []
+        try:
+            for name in names:
+                func, description = SCENARIOS[name]
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {description}'))
+                for row in func(options['size']):
+                    rows.append(row)
+                    self.stdout.write('  ' + '  '.join(
+                        f'{key}={value}' for key, value in row.items() if key != 'scenario'
+                    ))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json']:
+            with open(options['json'], 'w') as fh:
+                json.dump(rows, fh, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(rows)} rows to {options['json']}"))
@@ -0,0 +1,59 @@
+"""
+Management command to export appointments, payments or queue history as
+NDJSON or CSV.
+
+Rows are streamed from a server-side cursor and written a batch at a time,
+so memory stays flat for exports of any size (see queueing/exports.py).
+
+Usage: python manage.py export_data appointments --output csv --start 2026-01-01 --end 2026-01-31 --file jan.csv
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream appointments, payments or queue entries to a file (or stdout) as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--output', choices=sorted(exports.FORMATS), default='ndjson',
+                            help='Row format (default: ndjson)')
+        parser.add_argument('--hospital', type=int, help='Only rows of this hospital id')
+        parser.add_argument('--start', help='From this date (YYYY-MM-DD) or ISO datetime, inclusive')
+        parser.add_argument('--end', help='Until this date (inclusive) or ISO datetime (exclusive)')
+        parser.add_argument('--status', help='Only rows with this status')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--file', help='Write here instead of stdout')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows fetched and written at a time (default: 1000)')
+
+    def handle(self, *args, **options):
+        spec = exports.DATASETS[options['dataset']]
+        try:
+            queryset = spec.queryset(
+                hospital=options['hospital'],
+                start=options['start'] and exports.parse_bound(options['start']),
+                end=options['end'] and exports.parse_bound(options['end'], end=True),
+                status=options['status'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = exports.stream(spec, queryset, output=options['output'], gzip=options['gzip'],
+                                batch_size=options['batch_size'])
+        target = open(options['file'], 'wb') if options['file'] else None
+        out = target or sys.stdout.buffer  # bytes, so not self.stdout
+        written = 0
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+            out.flush()
+        finally:
+            if target:
+                target.close()
+
+        if target:
+            self.stderr.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['file']}"))
@@ -0,0 +1,47 @@
+"""
+Management command that applies stored payment webhook events.
+Usage:
+    python manage.py process_payment_webhooks          # run forever
+    python manage.py process_payment_webhooks --once   # drain and exit
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from queueing.payment_webhooks import process_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Apply received payment webhook events to payments, in order per gateway order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process until the backlog is empty, then exit')
+        parser.add_argument('--batch-size', type=int, default=100, help='Events per batch (default: 100)')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when idle (default: 2)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = {}
+
+        while True:
+            close_old_connections()
+            counts = process_pending_events(batch_size=batch_size)
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+
+            handled = counts['processed'] + counts['ignored'] + counts['failed']
+            if handled:
+                self.stdout.write(
+                    f"processed={counts['processed']} ignored={counts['ignored']} "
+                    f"retry={counts['retry']} failed={counts['failed']}"
+                )
+            if handled < batch_size:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {totals.get('processed', 0)} processed, {totals.get('ignored', 0)} ignored, "
+            f"{totals.get('failed', 0)} failed"
+        ))
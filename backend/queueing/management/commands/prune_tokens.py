@@ -0,0 +1,46 @@
+"""
+Management command to delete expired outstanding and blacklisted JWT refresh tokens.
+
+An expired refresh token is rejected by its signature check, so neither its
+outstanding row nor its blacklist row is needed any more. Rows are deleted
+in primary-key batches to keep each transaction and lock short, unlike
+simplejwt's flushexpiredtokens, which deletes everything in one statement.
+
+Usage: python manage.py prune_tokens --batch-size 5000
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted refresh tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tokens deleted per transaction (default: 5000)')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches, to leave room for live traffic (default: 0)')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('id')
+        last_id = 0
+        outstanding = blacklisted = 0
+        while True:
+            # Tokens expire roughly in id order, so this walks the primary key from the oldest
+            ids = list(expired.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {outstanding} expired outstanding tokens and {blacklisted} blacklisted tokens'
+        ))
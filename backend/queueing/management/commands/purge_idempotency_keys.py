@@ -0,0 +1,30 @@
+"""
+Management command to delete expired Idempotency-Key records.
+Usage: python manage.py purge_idempotency_keys
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from queueing.models import IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency records whose TTL has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per statement (default: 5000)')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+        while True:
+            ids = list(
+                IdempotencyRecord.objects.filter(expires_at__lte=now)
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            deleted, _ = IdempotencyRecord.objects.filter(id__in=ids).delete()
+            total += deleted
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} expired idempotency records'))
@@ -0,0 +1,160 @@
+"""
+Management command to reconcile unsettled payments with the gateway.
+
+Pages through payments stuck in pending/processing, asks the gateway for
+their real status with bounded concurrency and applies mark_success /
+mark_failed in batched transactions.
+
+Usage:
+    python manage.py reconcile_payments --concurrency 32 --report report.json
+    python manage.py reconcile_payments --base-url http://127.0.0.1:9000   # local fake gateway
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from queueing.models import Payment
+from queueing.payment_gateway import (
+    GatewayError, GatewayNotConfigured, RazorpayGateway, TestGateway, build_session,
+)
+
+UNSETTLED = ('pending', 'processing')
+
+
+class Command(BaseCommand):
+    help = 'Reconcile pending/processing payments against the payment gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gateway', default='razorpay', choices=['razorpay', 'test'],
+                            help='Gateway whose payments to reconcile (default: razorpay)')
+        parser.add_argument('--base-url', help='Override the gateway base URL (e.g. a local fake gateway)')
+        parser.add_argument('--min-age-minutes', type=int, default=15,
+                            help='Skip payments younger than this; the customer may still be paying (default: 15)')
+        parser.add_argument('--page-size', type=int, default=1000, help='Payments fetched per page (default: 1000)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Updates per transaction (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent gateway requests (default: 16)')
+        parser.add_argument('--limit', type=int, help='Stop after this many payments')
+        parser.add_argument('--dry-run', action='store_true', help='Query the gateway but do not update payments')
+        parser.add_argument('--report', help='Write a JSON report to this path')
+
+    def get_gateway(self, options):
+        if options['gateway'] == 'test':
+            return TestGateway()
+        key_id = getattr(settings, 'RAZORPAY_KEY_ID', None)
+        key_secret = getattr(settings, 'RAZORPAY_KEY_SECRET', None)
+        if not key_id or not key_secret:
+            raise GatewayNotConfigured('Razorpay keys are not configured')
+        # A dedicated pool sized to the worker count, so threads never queue for a connection
+        return RazorpayGateway(
+            key_id, key_secret, base_url=options['base_url'],
+            session=build_session(pool_maxsize=options['concurrency']),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            gateway = self.get_gateway(options)
+        except GatewayNotConfigured as exc:
+            raise CommandError(str(exc))
+
+        cutoff = timezone.now() - timezone.timedelta(minutes=options['min_age_minutes'])
+        base_qs = Payment.objects.filter(
+            payment_gateway=options['gateway'],
+            status__in=UNSETTLED,
+            created_at__lt=cutoff,
+        ).only('id', 'status', 'gateway_order_id', 'transaction_id').order_by('id')
+
+        report = {'checked': 0, 'success': 0, 'failed': 0, 'pending': 0, 'errors': 0, 'error_samples': []}
+        started = time.monotonic()
+        last_id = 0
+        limit = options['limit']
+
+        def fetch(payment):
+            try:
+                return payment, gateway.fetch_status(payment)
+            except GatewayError as exc:
+                return payment, {'status': 'error', 'reason': str(exc)}
+            except Exception as exc:
+                # Anything unexpected counts against this payment instead of aborting the run
+                return payment, {'status': 'error', 'reason': f'{type(exc).__name__}: {exc}'}
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            while limit is None or report['checked'] < limit:
+                page_size = options['page_size']
+                if limit is not None:
+                    page_size = min(page_size, limit - report['checked'])
+                # Keyset pagination: stable and index-backed even as rows settle under us
+                page = list(base_qs.filter(id__gt=last_id)[:page_size])
+                if not page:
+                    break
+                last_id = page[-1].id
+
+                results = list(pool.map(fetch, page))
+                report['checked'] += len(results)
+
+                settled = []
+                for payment, result in results:
+                    outcome = result['status']
+                    if outcome == 'error':
+                        report['errors'] += 1
+                        if len(report['error_samples']) < 20:
+                            report['error_samples'].append(
+                                {'transaction_id': payment.transaction_id, 'reason': result['reason']}
+                            )
+                    elif outcome == 'pending':
+                        report['pending'] += 1
+                    else:
+                        settled.append((payment.id, result))
+
+                if not options['dry_run']:
+                    for i in range(0, len(settled), options['batch_size']):
+                        applied = self.apply_batch(settled[i:i + options['batch_size']])
+                        for outcome, count in applied.items():
+                            report[outcome] += count
+                else:
+                    for _, result in settled:
+                        report[result['status']] += 1
+
+                self.stdout.write(
+                    f"checked={report['checked']} success={report['success']} failed={report['failed']} "
+                    f"pending={report['pending']} errors={report['errors']}"
+                )
+
+        elapsed = time.monotonic() - started
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['payments_per_second'] = round(report['checked'] / elapsed, 1) if elapsed else None
+        report['dry_run'] = options['dry_run']
+
+        if options['report']:
+            with open(options['report'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {report['checked']} payments in {elapsed:.1f}s: "
+            f"{report['success']} succeeded, {report['failed']} failed, "
+            f"{report['pending']} still pending, {report['errors']} errors"
+        ))
+
+    def apply_batch(self, batch):
+        """Apply settled results in one transaction; skip rows settled meanwhile."""
+        applied = {'success': 0, 'failed': 0}
+        results = dict(batch)
+        with transaction.atomic():
+            locked = Payment.objects.select_for_update().filter(
+                id__in=results.keys(), status__in=UNSETTLED,
+            )
+            for payment in locked:
+                result = results[payment.id]
+                if result['status'] == 'success':
+                    payment.mark_success(
+                        gateway_payment_id=result['gateway_payment_id'],
+                        payment_method=result.get('payment_method', ''),
+                    )
+                else:
+                    payment.mark_failed(result.get('reason', ''))
+                applied[result['status']] += 1
+        return applied
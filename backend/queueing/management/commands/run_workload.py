@@ -0,0 +1,51 @@
+"""
+Management command to replay a hospital day's operation mix in-process and
+report throughput and latency percentiles per operation.
+
+Runs against the configured database, on data from seed_hospital_day (the
+operations write to it: arrivals, bookings, payments). For a throwaway
+database use ``python manage.py benchmark hospital_day`` instead.
+
+Usage:
+    python manage.py run_workload --operations 5000 --json day.json
+    python manage.py run_workload --mix arrival=20,poll=60,ws=20
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from queueing import loadgen
+
+
+class Command(BaseCommand):
+    help = 'Replay arrival/start/complete/book/pay/poll/ws operations and report per-operation latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=1000, help='Operations to run (default: 1000)')
+        parser.add_argument('--mix', help='Operation weights, e.g. arrival=15,poll=45 (default: '
+                            + ','.join(f'{name}={weight}' for name, weight in loadgen.DEFAULT_MIX.items()) + ')')
+        parser.add_argument('--prefix', default='load', help='Prefix the data was seeded with (default: load)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--throttle', action='store_true', help='Keep API rate limits on')
+        parser.add_argument('--json', help='Write result rows to this path')
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadgen.parse_mix(options['mix']) if options['mix'] else None
+            workload = loadgen.Workload(
+                prefix=options['prefix'], mix=mix, random_seed=options['seed'], throttle=options['throttle'],
+            ).load()
+        except (ValueError, LookupError) as exc:
+            raise CommandError(str(exc))
+
+        seconds = workload.run(options['operations'])
+        rows = workload.report()
+        for row in rows:
+            self.stdout.write('  ' + '  '.join(f'{key}={value}' for key, value in row.items() if key != 'scenario'))
+        ops = sum(row['ops'] for row in rows)
+        self.stdout.write(self.style.SUCCESS(f'{ops} operations in {seconds:.2f}s ({ops / seconds:.1f} ops/s)'))
+
+        if options['json']:
+            with open(options['json'], 'w') as fh:
+                json.dump(rows, fh, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(rows)} rows to {options['json']}"))
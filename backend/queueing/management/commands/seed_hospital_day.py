@@ -0,0 +1,62 @@
+"""
+Management command to seed a synthetic hospital network for load testing.
+
+Row counts per department: --beds beds, and per day of --days history
+--visits queue visits and --slots appointment slots (--booked of them booked
+and paid). 10 hospitals x 8 departments x 365 days x 100 visits is ~3M
+queue entries. All names carry --prefix, so run_workload can find the data
+and --flush can remove it.
+
+Usage:
+    python manage.py seed_hospital_day --hospitals 10 --departments 8 --days 365 --visits 100
+    python manage.py seed_hospital_day --flush
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from queueing import loadgen
+from queueing.models import Hospital
+
+
+class Command(BaseCommand):
+    help = 'Seed hospitals, departments, beds, patients, slots and queue/appointment history for load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospitals', type=int, default=3, help='Hospitals (default: 3)')
+        parser.add_argument('--departments', type=int, default=5, help='Departments per hospital (default: 5)')
+        parser.add_argument('--beds', type=int, default=20, help='Beds per department (default: 20)')
+        parser.add_argument('--patients', type=int, default=1000, help='Patient accounts (default: 1000)')
+        parser.add_argument('--days', type=int, default=30, help='Days of history (default: 30)')
+        parser.add_argument('--visits', type=int, default=40, help='Queue visits per department per day (default: 40)')
+        parser.add_argument('--slots', type=int, default=16,
+                            help='Appointment slots per department per day (default: 16)')
+        parser.add_argument('--booked', type=float, default=0.7,
+                            help='Share of past slots booked as paid appointments (default: 0.7)')
+        parser.add_argument('--prefix', default='load', help='Name prefix for seeded rows (default: load)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT (default: 5000)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--flush', action='store_true', help='Delete previously seeded rows and exit')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['flush']:
+            deleted = loadgen.flush(prefix)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} rows seeded with prefix '{prefix}'"))
+            return
+        if Hospital.objects.filter(name__startswith=f'{prefix} Hospital ').exists():
+            raise CommandError(f"Data with prefix '{prefix}' already exists; use --flush or another --prefix")
+
+        started = time.perf_counter()
+        counts = loadgen.seed(
+            hospitals=options['hospitals'], departments=options['departments'], beds=options['beds'],
+            patients=options['patients'], days=options['days'], visits=options['visits'],
+            slots=options['slots'], booked=options['booked'], prefix=prefix,
+            batch_size=options['batch_size'], random_seed=options['seed'], log=self.stdout.write,
+        )
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        self.stdout.write(', '.join(f'{name}={count}' for name, count in counts.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)'
+        ))
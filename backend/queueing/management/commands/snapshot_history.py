@@ -0,0 +1,41 @@
+"""
+Management command to export queue and appointment history as columnar
+month partitions (one .npy file per column) for offline analysis.
+
+Runs are incremental: months that have settled (SNAPSHOT_SETTLE_DAYS after
+they end) and were already exported are skipped. Load the result with
+queueing.snapshots.load() / open_partition() instead of querying the
+database.
+
+Usage: python manage.py snapshot_history --dataset queue --since 2026-01
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Export queue and appointment history as monthly columnar .npy partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=sorted(snapshots.DATASETS), action='append',
+                            help='Dataset to export; repeat for several (default: all)')
+        parser.add_argument('--since', help='Skip months before this one (YYYY-MM)')
+        parser.add_argument('--full', action='store_true', help='Rewrite settled months too')
+        parser.add_argument('--dir', help='Output directory (default: SNAPSHOT_DIR)')
+
+    def handle(self, *args, **options):
+        if options['since']:
+            try:
+                snapshots.month_bounds(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a month, YYYY-MM')
+
+        for name in options['dataset'] or sorted(snapshots.DATASETS):
+            written = 0
+            for meta in snapshots.export(snapshots.DATASETS[name], root=options['dir'],
+                                         full=options['full'], since=options['since']):
+                written += 1
+                state = 'complete' if meta['complete'] else 'open'
+                self.stdout.write(f"{name} {meta['month']}: {meta['rows']} rows ({state})")
+            self.stdout.write(self.style.SUCCESS(f'{name}: {written} partitions written'))
@@ -0,0 +1,190 @@
+"""
+Prometheus metrics for hot paths, exposed at /metrics.
+
+Counters and histograms are updated in-process by the code they measure:
+request latency and SQL per view (RequestLoggingMiddleware), WebSocket
+connections and messages (HospitalStatusConsumer), live-status broadcasts
+(signals._broadcast), MongoDB mirroring (mongo_sync) and payment state
+transitions. Queue depth and bed status per hospital are read from the
+database at scrape time, with one grouped query each, so they are exact
+without every worker keeping its own copy. Log pipeline and user cache
+counters come from the process that serves the scrape.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory before the workers start: each process then writes its values to
+memory-mapped files there and a scrape aggregates all of them
+(gunicorn.conf.py clears the directory and cleans up after dead workers).
+Without it, a scrape only sees the process that served it.
+
+Access: with METRICS['TOKEN'] set, scrapes must send
+``Authorization: Bearer <token>``; without one, the endpoint is only served
+when DEBUG is on.
+"""
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseNotFound
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from . import log_pipeline
+
+# ─── HTTP ───
+
+REQUEST_LATENCY = Histogram(
+    'careflow_request_duration_seconds', 'Request latency by view', ['view', 'method', 'status'],
+)
+DB_QUERIES = Counter('careflow_db_queries_total', 'SQL queries run by requests, by view', ['view'])
+DB_QUERY_SECONDS = Counter('careflow_db_query_seconds_total', 'Time requests spent in SQL, by view', ['view'])
+
+RESPONSE_CACHE = Counter(
+    'careflow_response_cache_total', 'Versioned response cache lookups (hit, miss, not_modified)', ['view', 'outcome'],
+)
+
+# ─── Live status ───
+
+WS_CONNECTIONS = Counter('careflow_ws_connections_total', 'WebSocket connections opened')
+WS_ACTIVE = Gauge('careflow_ws_active_connections', 'Open WebSocket connections', multiprocess_mode='livesum')
+WS_MESSAGES = Counter('careflow_ws_messages_total', 'Status messages sent to WebSocket clients', ['kind'])
+SSE_CONNECTIONS = Counter('careflow_sse_connections_total', 'Server-Sent Events live-status streams opened')
+SSE_ACTIVE = Gauge('careflow_sse_active_streams', 'Open Server-Sent Events streams', multiprocess_mode='livesum')
+SSE_EVENTS = Counter('careflow_sse_events_total', 'Events sent on Server-Sent Events streams', ['kind'])
+BROADCAST_SECONDS = Histogram(
+    'careflow_broadcast_duration_seconds', 'Snapshot + group_send time per live-status broadcast',
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+)
+
+# ─── MongoDB mirror ───
+
+MONGO_SYNCS = Counter('careflow_mongo_sync_total', 'MongoDB mirror writes', ['collection', 'outcome'])
+MONGO_SYNC_SECONDS = Histogram('careflow_mongo_sync_duration_seconds', 'MongoDB mirror write time', ['collection'])
+# Lag: time() - careflow_mongo_last_success_timestamp_seconds
+MONGO_LAST_SUCCESS = Gauge(
+    'careflow_mongo_last_success_timestamp_seconds', 'Unix time of the last successful MongoDB mirror write',
+    multiprocess_mode='max',
+)
+
+# ─── Payments ───
+
+PAYMENT_TRANSITIONS = Counter(
+    'careflow_payment_transitions_total', 'Payment status changes (from "new" on creation)', ['from_status', 'to_status'],
+)
+
+
+def observe_request(request, status_code, seconds, timings):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else 'unmatched'
+    REQUEST_LATENCY.labels(view, request.method, status_code).observe(seconds)
+    if timings.queries:
+        DB_QUERIES.labels(view).inc(timings.queries)
+        DB_QUERY_SECONDS.labels(view).inc(timings.db_seconds)
+
+
+def mongo_synced(collection, outcome, started=None):
+    """Record one mirror write: 'success' (timed from ``started``), 'skipped' or 'failure'."""
+    MONGO_SYNCS.labels(collection, outcome).inc()
+    if outcome == 'success':
+        MONGO_SYNC_SECONDS.labels(collection).observe(time.perf_counter() - started)
+        MONGO_LAST_SUCCESS.set(time.time())
+
+
+def payment_transition(from_status, to_status):
+    """Count a payment status change once its transaction commits."""
+    transaction.on_commit(lambda: PAYMENT_TRANSITIONS.labels(from_status, to_status).inc())
+
+
+# ─── Exposition ───
+
+class HospitalStateCollector:
+    """Queue depth and bed status per hospital, queried at scrape time."""
+
+    def collect(self):
+        from .models import Bed, QueueEntry
+
+        queue = GaugeMetricFamily('careflow_queue_entries', 'Active queue entries', labels=['hospital', 'status'])
+        rows = QueueEntry.objects.filter(
+            status__in=[QueueEntry.Status.WAITING, QueueEntry.Status.IN_PROGRESS],
+        ).values_list('hospital_id', 'status').annotate(n=Count('pk')).order_by()
+        for hospital_id, status, count in rows:
+            queue.add_metric([str(hospital_id), status], count)
+        yield queue
+
+        beds = GaugeMetricFamily('careflow_beds', 'Beds by status', labels=['hospital', 'status'])
+        rows = Bed.objects.values_list('hospital_id', 'status').annotate(n=Count('pk')).order_by()
+        for hospital_id, status, count in rows:
+            beds.add_metric([str(hospital_id), status], count)
+        yield beds
+
+
+class LogPipelineCollector:
+    """Records through this process's log pipelines (see log_pipeline.py)."""
+
+    def collect(self):
+        records = CounterMetricFamily('careflow_log_records', 'Log records by outcome', labels=['outcome'])
+        depth = GaugeMetricFamily('careflow_log_queue_depth', 'Log records waiting for the writer thread')
+        totals = {'enqueued': 0, 'dropped': 0, 'written': 0, 'write_errors': 0}
+        queued = 0
+        for handler in log_pipeline.pipelines():
+            stats = handler.stats()
+            queued += stats['queued']
+            for outcome in totals:
+                totals[outcome] += stats[outcome]
+        for outcome, count in totals.items():
+            records.add_metric([outcome], count)
+        depth.add_metric([], queued)
+        yield records
+        yield depth
+
+
+class UserCacheCollector:
+    """Lookups in this process's cache of authenticated users (see authentication.UserCache)."""
+
+    def collect(self):
+        from .authentication import user_cache
+
+        stats = user_cache.stats()
+        lookups = CounterMetricFamily('careflow_user_cache_lookups', 'User cache lookups by result', labels=['result'])
+        lookups.add_metric(['hit'], stats['hits'])
+        lookups.add_metric(['miss'], stats['misses'])
+        yield lookups
+        yield CounterMetricFamily('careflow_user_cache_evictions', 'Users evicted from the cache at capacity',
+                                  value=stats['evictions'])
+        yield GaugeMetricFamily('careflow_user_cache_entries', 'Users in the cache', value=stats['size'])
+        # NaN until the first lookup
+        yield GaugeMetricFamily('careflow_user_cache_hit_ratio', 'Share of user cache lookups that hit',
+                                value=stats['hit_rate'] if stats['hit_rate'] is not None else float('nan'))
+
+
+_state_registry = CollectorRegistry(auto_describe=False)
+_state_registry.register(HospitalStateCollector())
+_state_registry.register(LogPipelineCollector())
+_state_registry.register(UserCacheCollector())
+
+
+def _process_registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def _authorized(request):
+    token = getattr(settings, 'METRICS', {}).get('TOKEN')
+    if not token:
+        return settings.DEBUG
+    header = request.headers.get('Authorization', '')
+    return hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+
+
+def metrics_view(request):
+    if not _authorized(request):
+        return HttpResponseNotFound()
+    output = generate_latest(_process_registry()) + generate_latest(_state_registry)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
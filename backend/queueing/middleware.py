@@ -2,11 +2,18 @@
 Custom security middleware for CareFlow.
 
 SecurityHeadersMiddleware  — adds defence-in-depth response headers.
-RequestLoggingMiddleware   — logs every request (method, path, user, IP, status).
+RequestLoggingMiddleware   — logs every request (method, path, user, IP, status, timings).
+ReplicaRoutingMiddleware   — sends safe reads to read replicas (see db_router.py).
 """
 import logging
+import random
 import time
 
+from django.conf import settings
+
+from . import metrics, profiling
+from .db_router import pin_user, reset_read_routing, route_reads_to_replica
+
 logger = logging.getLogger('careflow.security')
 
 
@@ -40,15 +47,45 @@ class SecurityHeadersMiddleware:
 
 
 class RequestLoggingMiddleware:
-    """Log each HTTP request for audit trail."""
+    """
+    Log each HTTP request for audit trail, with its SQL, render and total
+    time (also sent as a Server-Timing header) and, when sampled, a profile
+    written to disk. See profiling.py.
+    """
 
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        start = time.time()
-        response = self.get_response(request)
-        duration_ms = (time.time() - start) * 1000
+        config = profiling.get_config()
+        timings = request._timings = profiling.RequestTimings()
+        slow_ms = config.get('SLOW_REQUEST_MS')
+        profiler = None
+        if config.get('SAMPLE_RATE') and random.random() < config['SAMPLE_RATE']:
+            profiler = profiling.new_profiler()
+        if slow_ms:
+            profiling.get_sampler().watch(timings, slow_ms / 1000)
+
+        try:
+            with profiling.track_queries(timings):
+                if profiler is not None:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            if slow_ms:
+                profiling.get_sampler().unwatch()
+        total = time.perf_counter() - timings.started
+        duration_ms = total * 1000
+        metrics.observe_request(request, response.status_code, total, timings)
+
+        profile = None
+        if profiler is not None:
+            profile = profiling.write_cprofile(profiler, request, duration_ms)
+        elif timings.stacks:
+            profile = profiling.write_folded(timings.stacks, request, duration_ms)
+        if config.get('SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = timings.server_timing(total)
 
         user = getattr(request, 'user', None)
         user_label = (
@@ -63,13 +100,63 @@ class RequestLoggingMiddleware:
             ip = ip.split(',')[0].strip()
 
         logger.info(
-            '%s %s → %s | user=%s ip=%s %.0fms',
+            '%s %s → %s | user=%s ip=%s %.0fms (db %dq %.0fms, render %.0fms)',
             request.method,
             request.get_full_path(),
             response.status_code,
             user_label,
             ip,
             duration_ms,
+            timings.queries,
+            timings.db_seconds * 1000,
+            timings.render_seconds * 1000,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'user': user_label,
+                'ip': ip,
+                'duration_ms': round(duration_ms, 2),
+                'db_queries': timings.queries,
+                'db_ms': round(timings.db_seconds * 1000, 2),
+                'render_ms': round(timings.render_seconds * 1000, 2),
+                'profile': profile,
+            },
         )
 
         return response
+
+    def process_template_response(self, request, response):
+        # Called just before DRF renders (serializes) the response
+        request._timings.start_render(response)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route reads of safe requests to a replica, and pin a user to the
+    primary after their own successful writes (read-your-writes).
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            return self.get_response(request)
+
+        if request.method not in self.SAFE_METHODS:
+            response = self.get_response(request)
+            # DRF sets the authenticated user on the underlying request
+            user = getattr(request, 'user', None)
+            if response.status_code < 400 and user is not None and user.is_authenticated:
+                pin_user(user.pk)
+            return response
+
+        token = route_reads_to_replica()
+        try:
+            return self.get_response(request)
+        finally:
+            reset_read_routing(token)
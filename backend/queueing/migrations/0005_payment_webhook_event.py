@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queueing', '0004_remove_user_address_remove_user_blood_group_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gateway', models.CharField(choices=[('razorpay', 'Razorpay'), ('stripe', 'Stripe'), ('test', 'Test Mode')], max_length=20)),
+                ('event_id', models.CharField(help_text='Gateway event id, identical across retries', max_length=255)),
+                ('event_type', models.CharField(max_length=100)),
+                ('order_id', models.CharField(blank=True, help_text='Gateway order the event belongs to', max_length=255)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('received', 'Received'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='received', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['received_at', 'id'],
+                'indexes': [models.Index(fields=['status', 'received_at'], name='queueing_pa_status_c6d76a_idx'), models.Index(fields=['order_id'], name='queueing_pa_order_i_71ec8c_idx')],
+                'unique_together': {('gateway', 'event_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.16 on 2026-10-19 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queueing', '0006_idempotency_record'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', '-created_at'], name='queueing_ap_patient_181633_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentslot',
+            index=models.Index(condition=models.Q(('is_booked', False)), fields=['hospital', 'start_time'], name='slot_open_hospital_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentslot',
+            index=models.Index(condition=models.Q(('is_booked', False)), fields=['hospital', 'department', 'start_time'], name='slot_open_department_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['patient', '-created_at'], name='queueing_pa_patient_5ba995_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queueentry',
+            index=models.Index(fields=['hospital', 'status', 'arrival_time'], name='queueing_qu_hospita_fd0aa7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queueentry',
+            index=models.Index(fields=['hospital', 'status', 'finished_at'], name='queueing_qu_hospita_a60b54_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queueentry',
+            index=models.Index(fields=['hospital', 'department', 'status', 'finished_at'], name='queueing_qu_hospita_6d617a_idx'),
+        ),
+    ]
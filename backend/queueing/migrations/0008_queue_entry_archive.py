@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-19 13:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queueing', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueEntryArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('patient_name', models.CharField(max_length=150)),
+                ('symptoms', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('in_progress', 'In progress'), ('done', 'Done'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('arrival_time', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expected_finish', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='queue_history', to='queueing.department')),
+                ('hospital', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queue_history', to='queueing.hospital')),
+            ],
+            options={
+                'ordering': ['arrival_time'],
+                'indexes': [models.Index(fields=['hospital', 'status', 'finished_at'], name='queueing_qu_hospita_9e1385_idx'), models.Index(fields=['hospital', 'department', 'status', 'finished_at'], name='queueing_qu_hospita_64d0ec_idx'), models.Index(fields=['arrival_time'], name='queueing_qu_arrival_bec593_idx')],
+            },
+        ),
+    ]
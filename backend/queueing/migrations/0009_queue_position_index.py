@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queueing', '0008_queue_entry_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='queueentry',
+            index=models.Index(fields=['hospital', 'department', 'status', 'arrival_time'], name='queueing_qu_hospita_10d146_idx'),
+        ),
+    ]
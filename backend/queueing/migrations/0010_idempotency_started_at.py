@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-19 14:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('queueing', '0009_queue_position_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='started_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the current owner claimed the key'),
+        ),
+    ]
@@ -5,6 +5,8 @@ from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
+from . import metrics
+
 
 class UserManager(BaseUserManager):
     """Manager for custom User model"""
@@ -82,7 +84,22 @@ class Department(models.Model):
         return f"{self.name} ({self.hospital.name})"
 
 
-class Bed(models.Model):
+class TracksLoadedDepartment:
+    """
+    Remembers the department_id an instance was loaded with, so signals.py
+    can tell a move to another department from an in-place edit.
+    """
+
+    loaded_department_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_department_id = instance.__dict__.get('department_id')
+        return instance
+
+
+class Bed(TracksLoadedDepartment, models.Model):
     class Status(models.TextChoices):
         AVAILABLE = 'available', 'Available'
         OCCUPIED = 'occupied', 'Occupied'
@@ -104,7 +121,7 @@ class Bed(models.Model):
         return f"{self.label} - {self.hospital.name}"
 
 
-class QueueEntry(models.Model):
+class QueueEntry(TracksLoadedDepartment, models.Model):
     class Status(models.TextChoices):
         WAITING = 'waiting', 'Waiting'
         IN_PROGRESS = 'in_progress', 'In progress'
@@ -123,6 +140,15 @@ class QueueEntry(models.Model):
 
     class Meta:
         ordering = ['arrival_time']
+        indexes = [
+            # Waiting/in-progress lists and counts per hospital, in arrival order
+            models.Index(fields=['hospital', 'status', 'arrival_time']),
+            # Per-department queue order: a waiting entry's position (eta.py) counts the entries ahead
+            models.Index(fields=['hospital', 'department', 'status', 'arrival_time']),
+            # Recent completions for wait prediction and throughput, per hospital / department
+            models.Index(fields=['hospital', 'status', 'finished_at']),
+            models.Index(fields=['hospital', 'department', 'status', 'finished_at']),
+        ]
 
     def __str__(self):
         return f"{self.patient_name} - {self.status}"
@@ -150,6 +176,39 @@ class QueueEntry(models.Model):
         self.save(update_fields=['started_at', 'finished_at', 'status'])
 
 
+class QueueEntryArchive(models.Model):
+    """
+    Finished (done/cancelled) queue entries moved out of QueueEntry by
+    archive_queue, so the live table only holds what the queue screens scan.
+    Rows keep their QueueEntry id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, related_name='queue_history')
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, related_name='queue_history')
+    patient_name = models.CharField(max_length=150)
+    symptoms = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=QueueEntry.Status.choices)
+    arrival_time = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expected_finish = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['arrival_time']
+        indexes = [
+            # The completions the wait prediction and throughput read, as on QueueEntry
+            models.Index(fields=['hospital', 'status', 'finished_at']),
+            models.Index(fields=['hospital', 'department', 'status', 'finished_at']),
+            models.Index(fields=['arrival_time']),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_name} - {self.status} (archived)"
+
+    effective_duration = QueueEntry.effective_duration
+
+
 class AppointmentSlot(models.Model):
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, related_name='appointment_slots')
     department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, related_name='appointment_slots')
@@ -160,6 +219,14 @@ class AppointmentSlot(models.Model):
 
     class Meta:
         ordering = ['start_time']
+        indexes = [
+            # Available-slot search, with and without a department. Partial: only
+            # open slots are searched, and `NOT is_booked` is not sargable on SQLite
+            models.Index(fields=['hospital', 'start_time'], condition=models.Q(is_booked=False),
+                         name='slot_open_hospital_start_idx'),
+            models.Index(fields=['hospital', 'department', 'start_time'], condition=models.Q(is_booked=False),
+                         name='slot_open_department_start_idx'),
+        ]
 
     def __str__(self):
         return f"{self.department or 'General'} @ {self.start_time:%Y-%m-%d %H:%M}"
@@ -210,10 +277,11 @@ class Appointment(models.Model):
             models.Index(fields=['patient', 'status']),
             models.Index(fields=['hospital', 'status']),
             models.Index(fields=['payment_status']),
+            models.Index(fields=['patient', '-created_at']),  # "my appointments", newest first
         ]
     
     def __str__(self):
-        return f"{self.patient.full_name} - {self.hospital.name} ({self.get_status_display()})"
+        return f"{self.patient.username} - {self.hospital.name} ({self.get_status_display()})"
     
     def confirm_payment(self, payment_id):
         """Mark appointment as confirmed after successful payment"""
@@ -225,10 +293,10 @@ class Appointment(models.Model):
         # Mark the appointment slot as booked
         if self.appointment_slot:
             self.appointment_slot.is_booked = True
-            self.appointment_slot.patient_name = self.patient.full_name
-            self.appointment_slot.save()
+            self.appointment_slot.patient_name = self.patient.username
+            self.appointment_slot.save(update_fields=['is_booked', 'patient_name'])
         
-        self.save()
+        self.save(update_fields=['payment_status', 'payment_id', 'status', 'confirmed_at', 'updated_at'])
     
     def cancel(self, refund=False):
         """Cancel the appointment"""
@@ -304,30 +372,45 @@ class Payment(models.Model):
             models.Index(fields=['patient', 'status']),
             models.Index(fields=['transaction_id']),
             models.Index(fields=['status']),
+            models.Index(fields=['patient', '-created_at']),  # payment history, newest first
         ]
     
     def __str__(self):
         return f"Payment {self.transaction_id} - {self.get_status_display()} - ₹{self.amount}"
     
     def mark_success(self, gateway_payment_id, payment_method=''):
-        """Mark payment as successful"""
-        self.status = 'success'
-        self.gateway_payment_id = gateway_payment_id
-        self.payment_method = payment_method
-        self.paid_at = timezone.now()
-        self.save()
+        """Mark payment as successful and confirm the appointment (one transaction)"""
+        from .services import confirm_payment
         
-        # Update appointment
-        self.appointment.confirm_payment(gateway_payment_id)
+        paid_at = confirm_payment(
+            self.pk, gateway_payment_id, payment_method,
+            gateway_order_id=self.gateway_order_id,
+            gateway_signature=self.gateway_signature,
+        )
+        if paid_at is None:
+            # Already confirmed elsewhere; reflect what is stored
+            self.refresh_from_db()
+        else:
+            self.status = 'success'
+            self.gateway_payment_id = gateway_payment_id
+            self.payment_method = payment_method
+            self.paid_at = self.updated_at = paid_at
+        
+        # The appointment was updated in the database; drop any stale cached copy
+        appointment_field = self._meta.get_field('appointment')
+        if appointment_field.is_cached(self):
+            appointment_field.delete_cached_value(self)
     
     def mark_failed(self, reason=''):
         """Mark payment as failed"""
+        metrics.payment_transition(self.status, 'failed')
         self.status = 'failed'
         self.failure_reason = reason
-        self.save()
+        self.save(update_fields=['status', 'failure_reason', 'updated_at'])
     
     def mark_refunded(self):
         """Mark payment as refunded"""
+        metrics.payment_transition(self.status, 'refunded')
         self.status = 'refunded'
         self.save()
         
@@ -335,3 +418,61 @@ class Payment(models.Model):
         self.appointment.payment_status = 'refunded'
         self.appointment.save()
 
+
+
+class PaymentWebhookEvent(models.Model):
+    """Raw gateway webhook deliveries, stored on receipt and applied later"""
+    STATUS_CHOICES = [
+        ('received', 'Received'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    gateway = models.CharField(max_length=20, choices=Payment.GATEWAY_CHOICES)
+    event_id = models.CharField(max_length=255, help_text="Gateway event id, identical across retries")
+    event_type = models.CharField(max_length=100)
+    order_id = models.CharField(max_length=255, blank=True, help_text="Gateway order the event belongs to")
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='received')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['received_at', 'id']
+        unique_together = ('gateway', 'event_id')
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['order_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.gateway} {self.event_type} {self.event_id} ({self.status})"
+
+
+class IdempotencyRecord(models.Model):
+    """Stored outcome of a POST made with an Idempotency-Key header"""
+    STATE_CHOICES = [
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_records')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of method, path and body")
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='in_progress')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(default=timezone.now, help_text="When the current owner claimed the key")
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ('user', 'key')
+    
+    def __str__(self):
+        return f"{self.key} ({self.state})"
@@ -3,11 +3,13 @@ Automatically mirror Django model saves/deletes into MongoDB.
 Each model is stored in a collection named after its lowercase class name + 's'.
 """
 import logging
+import time
 from datetime import datetime
 
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from . import metrics
 from .models import User, Hospital, Department, Bed, QueueEntry, AppointmentSlot
 
 logger = logging.getLogger(__name__)
@@ -41,10 +43,12 @@ def _model_to_doc(instance):
 
 
 def _sync_save(collection_name, instance):
+    started = time.perf_counter()
     try:
         db = _get_db()
         if db is None:
             logger.debug('MongoDB not available, skipping sync for %s #%s', collection_name, instance.pk)
+            metrics.mongo_synced(collection_name, 'skipped')
             return
         doc = _model_to_doc(instance)
         db[collection_name].update_one(
@@ -53,17 +57,49 @@ def _sync_save(collection_name, instance):
             upsert=True,
         )
         logger.debug('MongoDB ↑ %s #%s', collection_name, instance.pk)
+        metrics.mongo_synced(collection_name, 'success', started)
     except Exception as exc:
         logger.warning('MongoDB sync save failed for %s #%s: %s', collection_name, instance.pk, exc)
+        metrics.mongo_synced(collection_name, 'failure')
+
+
+def sync_many(collection_name, instances):
+    """
+    Upsert several instances with one bulk write (used after set-based updates).
+    ``instances`` may be a lazy queryset; it is only evaluated if MongoDB is up.
+    """
+    started = time.perf_counter()
+    try:
+        from pymongo import UpdateOne
+
+        db = _get_db()
+        if db is None:
+            logger.debug('MongoDB not available, skipping bulk sync for %s', collection_name)
+            metrics.mongo_synced(collection_name, 'skipped')
+            return
+        operations = [
+            UpdateOne({'_django_id': instance.pk}, {'$set': _model_to_doc(instance)}, upsert=True)
+            for instance in instances
+        ]
+        if operations:
+            db[collection_name].bulk_write(operations, ordered=False)
+        logger.debug('MongoDB ↑ %s x%d', collection_name, len(operations))
+        metrics.mongo_synced(collection_name, 'success', started)
+    except Exception as exc:
+        logger.warning('MongoDB bulk sync failed for %s: %s', collection_name, exc)
+        metrics.mongo_synced(collection_name, 'failure')
 
 
 def _sync_delete(collection_name, instance):
+    started = time.perf_counter()
     try:
         db = _get_db()
         db[collection_name].delete_one({'_django_id': instance.pk})
         logger.debug('MongoDB ✕ %s #%s', collection_name, instance.pk)
+        metrics.mongo_synced(collection_name, 'success', started)
     except Exception as exc:
         logger.warning('MongoDB sync delete failed for %s #%s: %s', collection_name, instance.pk, exc)
+        metrics.mongo_synced(collection_name, 'failure')
 
 
 # ─── Signal Handlers ───
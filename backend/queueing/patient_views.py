@@ -11,13 +11,19 @@ from django.utils import timezone
 from django.db.models import Q, Count, Avg
 from datetime import datetime, timedelta
 
+from .hashing import check_password
+from .idempotency import idempotent
 from .models import User, Hospital, Department, Appointment, AppointmentSlot, QueueEntry
+from .projections import Projection
+from .renderers import ORJSONRenderer
+from .response_cache import versioned_cache
 from .serializers import (
     PatientRegisterSerializer, 
     AppointmentSerializer, 
     AppointmentSlotSerializer,
     HospitalSerializer,
-    DepartmentSerializer
+    DepartmentSerializer,
+    requested_names,
 )
 
 
@@ -69,7 +75,7 @@ class PatientLoginView(APIView):
             user = User.objects.get(username=username)
             
             # Check password
-            if not user.check_password(password):
+            if not check_password(user, password):
                 return Response({
                     'detail': 'Invalid credentials'
                 }, status=status.HTTP_401_UNAUTHORIZED)
@@ -109,6 +115,7 @@ class PatientLoginView(APIView):
 class AvailableSlotsView(APIView):
     """Get available appointment slots"""
     permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer]
     
     def get(self, request):
         hospital_id = request.query_params.get('hospital_id')
@@ -141,16 +148,22 @@ class AvailableSlotsView(APIView):
                     'error': 'Invalid date format. Use YYYY-MM-DD'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
-        slots = slots.order_by('start_time')[:50]  # Limit to 50 slots
+        if requested_names(request, 'expand'):
+            # Nested objects need model instances; otherwise a values() projection is enough
+            slots = AppointmentSlotSerializer.setup_eager_loading(slots, request)
+            slots = slots.order_by('start_time')[:50]  # Limit to 50 slots
+            return Response(AppointmentSlotSerializer(slots, many=True, context={'request': request}).data)
         
-        serializer = AppointmentSlotSerializer(slots, many=True)
-        return Response(serializer.data)
+        slots = slots.order_by('start_time')[:50]  # Limit to 50 slots
+        projection = Projection.for_serializer(AppointmentSlotSerializer, requested_names(request, 'fields'))
+        return Response(projection.rows(slots))
 
 
 class BookAppointmentView(APIView):
     """Book a new appointment"""
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def post(self, request):
         user = request.user
         
@@ -220,13 +233,11 @@ class MyAppointmentsView(APIView):
                 'error': 'Only patients can view their appointments'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        appointments = Appointment.objects.filter(
-            patient=user
-        ).select_related(
-            'hospital', 'department', 'appointment_slot'
+        appointments = AppointmentSerializer.setup_eager_loading(
+            Appointment.objects.filter(patient=user), request
         ).order_by('-created_at')
         
-        serializer = AppointmentSerializer(appointments, many=True)
+        serializer = AppointmentSerializer(appointments, many=True, context={'request': request})
         return Response(serializer.data)
 
 
@@ -285,13 +296,10 @@ class QueueStatusView(APIView):
             created_at__date=timezone.now().date()
         ).count()
         
-        # Calculate average wait time
-        avg_wait = waiting_entries.filter(
-            status='done',
-            started_at__isnull=False
-        ).annotate(
-            wait_time=(timezone.now() - timezone.now())  # Placeholder
-        ).aggregate(Avg('wait_time'))
+        counts = waiting_entries.aggregate(
+            total_waiting=Count('pk', filter=Q(status='waiting')),
+            in_progress=Count('pk', filter=Q(status='in_progress')),
+        )
         
         return Response({
             'hospital': {
@@ -299,8 +307,8 @@ class QueueStatusView(APIView):
                 'name': hospital.name,
             },
             'queue_status': {
-                'total_waiting': waiting_entries.filter(status='waiting').count(),
-                'in_progress': waiting_entries.filter(status='in_progress').count(),
+                'total_waiting': counts['total_waiting'],
+                'in_progress': counts['in_progress'],
                 'today_appointments': today_appointments,
                 'estimated_wait_minutes': 30,  # Can be calculated based on historical data
             },
@@ -320,9 +328,10 @@ class HospitalsListView(APIView):
     """Get list of hospitals"""
     permission_classes = [AllowAny]
     
+    @versioned_cache(('hospital',))
     def get(self, request):
         hospitals = Hospital.objects.all()
-        serializer = HospitalSerializer(hospitals, many=True)
+        serializer = HospitalSerializer(hospitals, many=True, context={'request': request})
         return Response(serializer.data)
 
 
@@ -330,13 +339,13 @@ class DepartmentsListView(APIView):
     """Get departments for a hospital"""
     permission_classes = [AllowAny]
     
+    @versioned_cache(('hospital', 'department'), query_params=('hospital_id',))
     def get(self, request):
         hospital_id = request.query_params.get('hospital_id')
         
+        departments = DepartmentSerializer.setup_eager_loading(Department.objects.all(), request)
         if hospital_id:
-            departments = Department.objects.filter(hospital_id=hospital_id)
-        else:
-            departments = Department.objects.all()
+            departments = departments.filter(hospital_id=hospital_id)
         
-        serializer = DepartmentSerializer(departments, many=True)
+        serializer = DepartmentSerializer(departments, many=True, context={'request': request})
         return Response(serializer.data)
@@ -0,0 +1,314 @@
+"""
+Payment gateway clients.
+
+Every gateway implements the small PaymentGateway interface used by the
+payment views. Gateway instances are process-wide singletons and the HTTP
+gateways share one pooled ``requests.Session``, so creating orders and
+fetching payments reuses keep-alive connections instead of paying a TCP +
+TLS handshake on every request. All calls carry explicit connect/read
+timeouts; idempotent (GET) calls are retried with jittered backoff.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import uuid
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'RAZORPAY_BASE_URL': 'https://api.razorpay.com',
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'MAX_RETRIES': 3,
+    'BACKOFF_FACTOR': 0.25,
+    'BACKOFF_JITTER': 0.25,
+    'POOL_MAXSIZE': 20,
+}
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or rejected the call."""
+
+
+class GatewayNotConfigured(GatewayError):
+    """The gateway's credentials are missing from settings."""
+
+
+class UnsupportedGateway(GatewayError):
+    """No client is implemented for the requested gateway."""
+
+
+class PaymentDetailsMissing(GatewayError):
+    """The client did not send the fields needed to verify the payment."""
+
+
+class SignatureVerificationError(GatewayError):
+    """The payment signature sent by the client does not match."""
+
+
+def gateway_setting(name):
+    return getattr(settings, 'PAYMENT_GATEWAY', {}).get(name, DEFAULTS[name])
+
+
+# ─── Pooled HTTP session ───
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def build_session(pool_maxsize=None):
+    """Create a keep-alive session whose adapter retries idempotent calls only."""
+    retry = Retry(
+        total=gateway_setting('MAX_RETRIES'),
+        backoff_factor=gateway_setting('BACKOFF_FACTOR'),
+        backoff_jitter=gateway_setting('BACKOFF_JITTER'),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        raise_on_status=False,
+    )
+    pool_size = pool_maxsize or gateway_setting('POOL_MAXSIZE')
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = 'CareFlow/1.0.0'
+    return session
+
+
+def get_session():
+    """Return (or create) the shared gateway session."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+# ─── Gateways ───
+
+class PaymentGateway:
+    """Interface implemented by every payment gateway."""
+    name = ''
+
+    def initiate(self, payment):
+        """Prepare the payment with the gateway; return extra response fields."""
+        raise NotImplementedError
+
+    def verify(self, payment, data):
+        """
+        Check the client's payment confirmation.
+
+        Returns a dict with ``gateway_payment_id`` and ``payment_method`` and
+        optionally ``gateway_order_id`` / ``gateway_signature``.
+        """
+        raise NotImplementedError
+
+    def fetch_status(self, payment):
+        """
+        Ask the gateway what happened to ``payment``.
+
+        Returns a dict with ``status`` ('success', 'failed' or 'pending') and,
+        for successes, ``gateway_payment_id`` / ``payment_method``; failures
+        carry a ``reason``.
+        """
+        raise NotImplementedError
+
+    def parse_webhook(self, body, headers):
+        """
+        Authenticate a raw webhook delivery and normalise it.
+
+        Returns a dict with ``event_id``, ``event_type``, ``order_id`` and the
+        decoded ``payload``.
+        """
+        raise UnsupportedGateway(f'Payment gateway {self.name} does not send webhooks')
+
+
+class TestGateway(PaymentGateway):
+    """Test mode: no external calls, every payment succeeds."""
+    name = 'test'
+
+    def initiate(self, payment):
+        return {
+            'test_mode': True,
+            'message': 'Test mode - use any payment details to complete',
+            'test_payment_url': '/api/patient/payment/verify/',
+        }
+
+    def verify(self, payment, data):
+        return {
+            'gateway_payment_id': f"TEST_{uuid.uuid4().hex[:8].upper()}",
+            'payment_method': data.get('payment_method', 'test'),
+        }
+
+    def fetch_status(self, payment):
+        # Test payments only complete through VerifyPaymentView
+        return {'status': 'pending'}
+
+
+def signatures_match(expected, given):
+    # compare_digest rejects non-ASCII str with TypeError; compare bytes so a bad signature is just a mismatch
+    return hmac.compare_digest(expected.encode(), str(given).encode())
+
+
+class RazorpayGateway(PaymentGateway):
+    """Razorpay REST API client on top of the shared pooled session."""
+    name = 'razorpay'
+
+    def __init__(self, key_id, key_secret, base_url=None, session=None, webhook_secret=''):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.webhook_secret = webhook_secret
+        self.base_url = (base_url or gateway_setting('RAZORPAY_BASE_URL')).rstrip('/')
+        self.session = session or get_session()
+        self.timeout = (gateway_setting('CONNECT_TIMEOUT'), gateway_setting('READ_TIMEOUT'))
+
+    def _request(self, method, path, **kwargs):
+        url = f"{self.base_url}/v1{path}"
+        try:
+            response = self.session.request(
+                method, url, auth=(self.key_id, self.key_secret), timeout=self.timeout, **kwargs
+            )
+        except requests.RequestException as exc:
+            logger.warning('Razorpay %s %s failed: %s', method, path, exc)
+            raise GatewayError(str(exc)) from exc
+
+        if response.status_code >= 400:
+            try:
+                description = response.json().get('error', {}).get('description', '')
+            except ValueError:
+                description = ''
+            raise GatewayError(description or f'HTTP {response.status_code}')
+        try:
+            return response.json()
+        except ValueError as exc:
+            raise GatewayError(f'HTTP {response.status_code} with a body that is not JSON') from exc
+
+    def create_order(self, amount, currency, receipt):
+        return self._request('POST', '/orders', json={
+            'amount': int(amount * 100),  # Convert to paise
+            'currency': currency,
+            'receipt': receipt,
+        })
+
+    def fetch_order(self, order_id):
+        return self._request('GET', f'/orders/{order_id}')
+
+    def fetch_order_payments(self, order_id):
+        return self._request('GET', f'/orders/{order_id}/payments').get('items', [])
+
+    def initiate(self, payment):
+        order = self.create_order(payment.amount, payment.currency, payment.transaction_id)
+        payment.gateway_order_id = order.get('id', '')
+        payment.save(update_fields=['gateway_order_id', 'updated_at'])
+        return {
+            'razorpay_order_id': order.get('id'),
+            'razorpay_key_id': self.key_id,
+        }
+
+    def signature_for(self, order_id, payment_id):
+        message = f'{order_id}|{payment_id}'.encode()
+        return hmac.new(self.key_secret.encode(), message, hashlib.sha256).hexdigest()
+
+    def verify(self, payment, data):
+        order_id = data.get('razorpay_order_id')
+        payment_id = data.get('razorpay_payment_id')
+        signature = data.get('razorpay_signature')
+        if not order_id or not payment_id or not signature:
+            raise PaymentDetailsMissing('Razorpay payment details are required')
+
+        if not signatures_match(self.signature_for(order_id, payment_id), signature):
+            raise SignatureVerificationError('Invalid payment signature')
+
+        return {
+            'gateway_payment_id': payment_id,
+            'payment_method': 'razorpay',
+            'gateway_order_id': order_id,
+            'gateway_signature': signature,
+        }
+
+    def fetch_status(self, payment):
+        if not payment.gateway_order_id:
+            return {'status': 'failed', 'reason': 'Gateway order was never created'}
+
+        attempts = self.fetch_order_payments(payment.gateway_order_id)
+        for attempt in attempts:
+            if attempt.get('status') == 'captured':
+                return {
+                    'status': 'success',
+                    'gateway_payment_id': attempt.get('id', ''),
+                    'payment_method': attempt.get('method', 'razorpay'),
+                }
+        if attempts and all(a.get('status') == 'failed' for a in attempts):
+            return {
+                'status': 'failed',
+                'reason': attempts[-1].get('error_description') or 'Payment failed at gateway',
+            }
+        return {'status': 'pending'}
+
+    def parse_webhook(self, body, headers):
+        if not self.webhook_secret:
+            raise GatewayNotConfigured('Razorpay webhook secret is not configured')
+        expected = hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+        if not signatures_match(expected, headers.get('X-Razorpay-Signature', '')):
+            raise SignatureVerificationError('Invalid webhook signature')
+
+        try:
+            payload = json.loads(body)
+        except ValueError as exc:
+            raise SignatureVerificationError('Webhook body is not valid JSON') from exc
+
+        entity = payload.get('payload', {}).get('payment', {}).get('entity', {})
+        return {
+            # Razorpay sends the same event id on every retry of a delivery
+            'event_id': headers.get('X-Razorpay-Event-Id') or hashlib.sha256(body).hexdigest(),
+            'event_type': payload.get('event', ''),
+            'order_id': entity.get('order_id', ''),
+            'payload': payload,
+        }
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def _build_gateway(name):
+    if name == 'test':
+        return TestGateway()
+    if name == 'razorpay':
+        key_id = getattr(settings, 'RAZORPAY_KEY_ID', None)
+        key_secret = getattr(settings, 'RAZORPAY_KEY_SECRET', None)
+        if not key_id or not key_secret:
+            raise GatewayNotConfigured('Razorpay keys are not configured')
+        return RazorpayGateway(
+            key_id, key_secret, webhook_secret=getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', ''),
+        )
+    raise UnsupportedGateway(f'Payment gateway {name} not yet implemented')
+
+
+def get_gateway(name):
+    """Return the process-wide client for gateway ``name``."""
+    gateway = _gateways.get(name)
+    if gateway is None:
+        with _gateways_lock:
+            gateway = _gateways.get(name)
+            if gateway is None:
+                gateway = _gateways[name] = _build_gateway(name)
+    return gateway
+
+
+def reset_gateways():
+    """Drop cached clients and the shared session (settings changed, tests)."""
+    global _session
+    with _gateways_lock, _session_lock:
+        _gateways.clear()
+        if _session is not None:
+            _session.close()
+        _session = None
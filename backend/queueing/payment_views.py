@@ -4,19 +4,24 @@ Payment processing views for appointment bookings
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.utils import timezone
-from django.conf import settings
+from rest_framework.permissions import AllowAny, IsAuthenticated
 import uuid
-import hashlib
 
-from .models import Appointment, Payment
+from . import metrics
+from .idempotency import idempotent
+from .models import Appointment, Payment, PaymentWebhookEvent
+from .payment_gateway import (
+    GatewayError, GatewayNotConfigured, PaymentDetailsMissing,
+    SignatureVerificationError, UnsupportedGateway, get_gateway,
+)
+from .serializers import PaymentSerializer
 
 
 class InitiatePaymentView(APIView):
     """Initiate payment for an appointment"""
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def post(self, request):
         user = request.user
         appointment_id = request.data.get('appointment_id')
@@ -41,6 +46,17 @@ class InitiatePaymentView(APIView):
                 'error': 'Appointment is already paid'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        try:
+            gateway = get_gateway(payment_gateway)
+        except UnsupportedGateway as exc:
+            return Response({
+                'error': str(exc)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except GatewayNotConfigured as exc:
+            return Response({
+                'error': str(exc)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
         # Generate unique transaction ID
         transaction_id = f"TXN{uuid.uuid4().hex[:12].upper()}"
         
@@ -54,6 +70,7 @@ class InitiatePaymentView(APIView):
             transaction_id=transaction_id,
             status='pending'
         )
+        metrics.payment_transition('new', 'pending')
         
         response_data = {
             'transaction_id': payment.transaction_id,
@@ -62,44 +79,12 @@ class InitiatePaymentView(APIView):
             'appointment_id': appointment.id,
         }
         
-        # If test mode, provide mock payment details
-        if payment_gateway == 'test':
-            response_data['test_mode'] = True
-            response_data['message'] = 'Test mode - use any payment details to complete'
-            response_data['test_payment_url'] = f'/api/patient/payment/verify/'
-        elif payment_gateway == 'razorpay':
-            try:
-                import razorpay
-            except ImportError:
-                return Response({
-                    'error': 'Razorpay SDK is not installed'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            key_id = getattr(settings, 'RAZORPAY_KEY_ID', None)
-            key_secret = getattr(settings, 'RAZORPAY_KEY_SECRET', None)
-            if not key_id or not key_secret:
-                return Response({
-                    'error': 'Razorpay keys are not configured'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            client = razorpay.Client(auth=(key_id, key_secret))
-            # Set app details for Razorpay tracking - must match PAN card or website name
-            client.set_app_details({"title": "CareFlow", "version": "1.0.0"})
-            try:
-                order = client.order.create({
-                    'amount': int(payment.amount * 100),  # Convert to paise
-                    'currency': payment.currency,
-                    'receipt': payment.transaction_id,
-                })
-            except Exception as exc:  # pragma: no cover - network/SDK errors
-                return Response({
-                    'error': f'Failed to create Razorpay order: {exc}'
-                }, status=status.HTTP_502_BAD_GATEWAY)
-            
-            payment.gateway_order_id = order.get('id', '')
-            payment.save(update_fields=['gateway_order_id', 'updated_at'])
-            response_data['razorpay_order_id'] = order.get('id')
-            response_data['razorpay_key_id'] = key_id
+        try:
+            response_data.update(gateway.initiate(payment))
+        except GatewayError as exc:
+            return Response({
+                'error': f'Failed to create {payment_gateway} order: {exc}'
+            }, status=status.HTTP_502_BAD_GATEWAY)
         
         return Response(response_data, status=status.HTTP_201_CREATED)
 
@@ -111,16 +96,10 @@ class VerifyPaymentView(APIView):
     def post(self, request):
         user = request.user
         transaction_id = request.data.get('transaction_id')
-        payment_method = request.data.get('payment_method', 'test')
         
         # For test mode
         test_mode = request.data.get('test_mode', False)
         
-        # For Razorpay
-        razorpay_payment_id = request.data.get('razorpay_payment_id')
-        razorpay_order_id = request.data.get('razorpay_order_id')
-        razorpay_signature = request.data.get('razorpay_signature')
-        
         if not transaction_id:
             return Response({
                 'error': 'transaction_id is required'
@@ -142,65 +121,38 @@ class VerifyPaymentView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Verify payment based on gateway
-        if payment.payment_gateway == 'test' or test_mode:
-            # Test mode - always succeed
-            payment.mark_success(
-                gateway_payment_id=f"TEST_{uuid.uuid4().hex[:8].upper()}",
-                payment_method=payment_method
-            )
-            
-        elif payment.payment_gateway == 'razorpay':
-            # Verify Razorpay signature
-            if not razorpay_payment_id or not razorpay_order_id or not razorpay_signature:
-                return Response({
-                    'error': 'Razorpay payment details are required'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            try:
-                import razorpay
-            except ImportError:
-                return Response({
-                    'error': 'Razorpay SDK is not installed'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            key_id = getattr(settings, 'RAZORPAY_KEY_ID', None)
-            key_secret = getattr(settings, 'RAZORPAY_KEY_SECRET', None)
-            
-            if not key_id or not key_secret:
-                return Response({
-                    'error': 'Razorpay keys are not configured'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            client = razorpay.Client(auth=(key_id, key_secret))
-            # Set app details for Razorpay tracking - must match PAN card or website name
-            client.set_app_details({"title": "CareFlow", "version": "1.0.0"})
-            
-            try:
-                params_dict = {
-                    'razorpay_order_id': razorpay_order_id,
-                    'razorpay_payment_id': razorpay_payment_id,
-                    'razorpay_signature': razorpay_signature
-                }
-                client.utility.verify_payment_signature(params_dict)
-                
-                # Signature verified - mark payment as success
-                payment.gateway_order_id = razorpay_order_id
-                payment.gateway_signature = razorpay_signature
-                payment.mark_success(
-                    gateway_payment_id=razorpay_payment_id,
-                    payment_method='razorpay'
-                )
-            except razorpay.errors.SignatureVerificationError:
-                payment.mark_failed('Invalid payment signature')
-                return Response({
-                    'error': 'Payment verification failed'
-                }, status=status.HTTP_400_BAD_REQUEST)
+        gateway_name = 'test' if test_mode else payment.payment_gateway
+        try:
+            gateway = get_gateway(gateway_name)
+        except UnsupportedGateway as exc:
+            return Response({
+                'error': str(exc)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except GatewayNotConfigured as exc:
+            return Response({
+                'error': str(exc)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        else:
+        try:
+            result = gateway.verify(payment, request.data)
+        except PaymentDetailsMissing as exc:
+            return Response({
+                'error': str(exc)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except SignatureVerificationError as exc:
+            payment.mark_failed(str(exc))
             return Response({
-                'error': f'Payment gateway {payment.payment_gateway} not yet implemented'
+                'error': 'Payment verification failed'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        if result.get('gateway_order_id'):
+            payment.gateway_order_id = result['gateway_order_id']
+            payment.gateway_signature = result['gateway_signature']
+        payment.mark_success(
+            gateway_payment_id=result['gateway_payment_id'],
+            payment_method=result['payment_method']
+        )
+        
         return Response({
             'message': 'Payment successful! Your appointment is confirmed.',
             'payment': {
@@ -259,7 +211,9 @@ class PaymentHistoryView(APIView):
                 'error': 'Only patients can view payment history'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        payments = Payment.objects.filter(patient=user).order_by('-created_at')
+        payments = PaymentSerializer.setup_eager_loading(
+            Payment.objects.filter(patient=user)
+        ).order_by('-created_at')
         
         return Response([
             {
@@ -278,3 +232,40 @@ class PaymentHistoryView(APIView):
             }
             for p in payments
         ])
+
+
+class PaymentWebhookView(APIView):
+    """
+    Receive gateway webhooks.
+
+    The delivery is authenticated and stored, nothing else: state changes are
+    applied by `manage.py process_payment_webhooks`, so gateway retries and
+    post-outage bursts cost one insert each and never double-apply.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = []  # the gateway retries until acknowledged
+    
+    def post(self, request, gateway):
+        body = request.body
+        try:
+            event = get_gateway(gateway).parse_webhook(body, request.headers)
+        except UnsupportedGateway as exc:
+            return Response({
+                'error': str(exc)
+            }, status=status.HTTP_404_NOT_FOUND)
+        except GatewayNotConfigured as exc:
+            return Response({
+                'error': str(exc)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except SignatureVerificationError as exc:
+            return Response({
+                'error': str(exc)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Duplicate deliveries hit the (gateway, event_id) unique constraint and are dropped
+        PaymentWebhookEvent.objects.bulk_create([
+            PaymentWebhookEvent(gateway=gateway, **event)
+        ], ignore_conflicts=True)
+        
+        return Response({'status': 'accepted'}, status=status.HTTP_200_OK)
@@ -0,0 +1,81 @@
+"""
+Background processing of stored payment webhook events.
+
+The webhook view only authenticates and stores each delivery. This module
+applies the stored events to Payment rows: oldest first, strictly in order
+per gateway order, and idempotently — an event is applied at most once and
+payment transitions never move backwards (a late ``payment.failed`` cannot
+undo a captured payment).
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Payment, PaymentWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+SUCCESS_EVENTS = {'payment.captured', 'order.paid'}
+FAILURE_EVENTS = {'payment.failed'}
+
+
+def _payment_entity(event):
+    return event.payload.get('payload', {}).get('payment', {}).get('entity', {})
+
+
+def apply_event(event):
+    """Apply one event to its payment; return the resulting event status."""
+    if event.event_type not in SUCCESS_EVENTS | FAILURE_EVENTS:
+        return 'ignored'
+
+    with transaction.atomic():
+        payment = (
+            Payment.objects.select_for_update()
+            .filter(payment_gateway=event.gateway, gateway_order_id=event.order_id)
+            .first()
+        )
+        if payment is None:
+            return 'ignored'
+
+        entity = _payment_entity(event)
+        if event.event_type in SUCCESS_EVENTS:
+            if payment.status != 'success':
+                payment.mark_success(
+                    gateway_payment_id=entity.get('id', ''),
+                    payment_method=entity.get('method', event.gateway),
+                )
+        elif payment.status in ('pending', 'processing'):
+            payment.mark_failed(entity.get('error_description') or 'Payment failed at gateway')
+    return 'processed'
+
+
+def process_pending_events(batch_size=100):
+    """
+    Apply up to ``batch_size`` received events; return per-status counts.
+
+    If an event fails, later events for the same order in this batch are
+    held back so that an order's events are never applied out of order.
+    """
+    max_attempts = getattr(settings, 'PAYMENT_WEBHOOK_MAX_ATTEMPTS', 5)
+    events = PaymentWebhookEvent.objects.filter(status='received').order_by('received_at', 'id')[:batch_size]
+
+    counts = {'processed': 0, 'ignored': 0, 'retry': 0, 'failed': 0}
+    blocked_orders = set()
+    for event in events:
+        if event.order_id and event.order_id in blocked_orders:
+            continue
+        event.attempts += 1
+        try:
+            event.status = apply_event(event)
+            event.error = ''
+            event.processed_at = timezone.now()
+        except Exception as exc:
+            logger.exception('Payment webhook %s failed', event.event_id)
+            event.error = str(exc)
+            event.status = 'failed' if event.attempts >= max_attempts else 'received'
+            blocked_orders.add(event.order_id)
+        event.save(update_fields=['status', 'attempts', 'error', 'processed_at'])
+        counts['retry' if event.status == 'received' else event.status] += 1
+    return counts
@@ -0,0 +1,177 @@
+"""
+Per-request profiling used by RequestLoggingMiddleware.
+
+Every request records its SQL query count and time (an execute_wrapper on
+each database connection), its response rendering time (DRF serializes to
+JSON in render()) and its total time. These go out as a ``Server-Timing``
+header and as structured fields on the request log record.
+
+Two opt-in samplers write profiles under PROFILING['DIR'] for offline
+flamegraphs:
+
+* PROFILING['SAMPLE_RATE'] — this share of requests runs under cProfile
+  (``.prof``, for snakeviz / ``flameprof`` / pstats).
+* PROFILING['SLOW_REQUEST_MS'] — one background thread samples the stack of
+  any request running longer than this, every SAMPLE_INTERVAL_MS, and writes
+  the samples in folded format (``.folded``, for flamegraph.pl / speedscope).
+  Fast requests never get sampled and cost a dict insert and delete.
+
+With both off, the overhead is the query wrapper and a few perf_counter calls.
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+def get_config():
+    return getattr(settings, 'PROFILING', {})
+
+
+class RequestTimings:
+    """Timings of one request; also the execute_wrapper that counts its queries."""
+
+    __slots__ = ('started', 'queries', 'db_seconds', 'render_started', 'render_seconds', 'stacks', 'deadline')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_started = None
+        self.render_seconds = 0.0
+        self.stacks = None     # Counter of folded stacks, once the slow sampler kicks in
+        self.deadline = None   # perf_counter after which the slow sampler samples this request
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+    def start_render(self, response):
+        self.render_started = time.perf_counter()
+        response.add_post_render_callback(self._end_render)
+
+    def _end_render(self, response):
+        self.render_seconds += time.perf_counter() - self.render_started
+
+    def server_timing(self, total_seconds):
+        """Server-Timing header value; ``app`` is what is left after SQL and rendering."""
+        db_ms = self.db_seconds * 1000
+        render_ms = self.render_seconds * 1000
+        total_ms = total_seconds * 1000
+        return (
+            f'db;dur={db_ms:.1f};desc="{self.queries} queries", render;dur={render_ms:.1f}, '
+            f'app;dur={max(0.0, total_ms - db_ms - render_ms):.1f}, total;dur={total_ms:.1f}'
+        )
+
+
+@contextmanager
+def track_queries(timings):
+    """Count and time every query this thread runs, on every database alias."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings))
+        yield
+
+
+# ─── Slow-request stack sampling ───
+
+def fold_stack(frame):
+    """A frame and its callers as one folded line, outermost first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SlowRequestSampler:
+    """One daemon thread that samples the stacks of requests past their deadline."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}   # thread id → RequestTimings
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def watch(self, timings, threshold_seconds):
+        timings.deadline = timings.started + threshold_seconds
+        self.active[threading.get_ident()] = timings
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True, name='slow-request-sampler')
+                    self._thread.start()
+
+    def unwatch(self):
+        self.active.pop(threading.get_ident(), None)
+
+    def sample(self):
+        now = time.perf_counter()
+        frames = None
+        for ident, timings in list(self.active.items()):
+            if now < timings.deadline:
+                continue
+            if frames is None:
+                frames = sys._current_frames()
+            frame = frames.get(ident)
+            if frame is not None:
+                if timings.stacks is None:
+                    timings.stacks = Counter()
+                timings.stacks[fold_stack(frame)] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if self.active:
+                self.sample()
+
+
+_sampler = None
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        _sampler = SlowRequestSampler(get_config().get('SAMPLE_INTERVAL_MS', 5) / 1000)
+    return _sampler
+
+
+# ─── Profile files ───
+
+def profile_path(request, duration_ms, extension):
+    directory = get_config().get('DIR') or os.path.join(settings.BASE_DIR, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_')[:80] or 'root'
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+    return os.path.join(directory, f'{stamp}-{request.method}-{slug}-{duration_ms:.0f}ms.{extension}')
+
+
+def write_cprofile(profiler, request, duration_ms):
+    path = profile_path(request, duration_ms, 'prof')
+    profiler.dump_stats(path)
+    return path
+
+
+def write_folded(stacks, request, duration_ms):
+    path = profile_path(request, duration_ms, 'folded')
+    with open(path, 'w') as fh:
+        for stack, count in stacks.most_common():
+            fh.write(f'{stack} {count}\n')
+    return path
+
+
+def new_profiler():
+    return cProfile.Profile()
@@ -0,0 +1,158 @@
+"""
+Fast read path for large list endpoints.
+
+``Projection.for_serializer(SerializerClass)`` turns a ModelSerializer's
+read fields into one ``values_list()`` query and a row encoder compiled
+once per serializer: a generated function that builds each output dict
+straight from the row tuple, with no per-row field lookups, attribute
+access or model instances. The output is the same as the serializer's,
+key for key:
+
+* ``source='relation.field'`` columns are read through the JOIN; when a
+  nullable relation is empty the key is left out, as DRF skips it;
+* ISO 8601 datetimes are converted to the current timezone and formatted
+  as DateTimeField does; other dates go through the field's own
+  ``to_representation``;
+* None stays None without calling any field.
+
+Only plain model fields, primary-key relations and one-level
+``relation.field`` sources are supported; anything else raises
+ImproperlyConfigured when the projection is built, so a serializer change
+that the fast path cannot follow fails loudly instead of drifting.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# Fields whose to_representation returns database values unchanged
+_PASSTHROUGH = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField, serializers.ChoiceField,
+    serializers.ReadOnlyField,
+)
+
+
+def _iso_datetime(value, tz):
+    # DateTimeField.to_representation for aware values in ISO 8601, without its per-call checks
+    text = value.astimezone(tz).isoformat()
+    return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+
+def _is_plain_iso_datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    return (
+        settings.USE_TZ and getattr(field, 'timezone', None) is None
+        and isinstance(output_format, str) and output_format.lower() == ISO_8601
+    )
+
+
+class Projection:
+    """
+    A values_list() projection plus a compiled encoder for its rows.
+
+    Full projections are cached per serializer. ``?fields=`` subsets come
+    from clients, and a serializer with N fields has 2^N of them, so only
+    the MAX_SUBSETS most recently used subset projections are kept.
+    """
+
+    MAX_SUBSETS = 64
+
+    _cache = {}
+    _subsets = OrderedDict()
+    _lock = threading.Lock()
+
+    def __init__(self, names, lookups, encode):
+        self.names = names
+        self.lookups = lookups
+        self.encode = encode
+
+    @classmethod
+    def for_serializer(cls, serializer_class, fields=None):
+        """The projection of all the serializer's fields, or of just ``fields`` (as for ?fields=)."""
+        full = cls._cache.get(serializer_class)
+        if full is None:
+            full = cls._cache[serializer_class] = cls._build(serializer_class)
+        if fields is None:
+            return full
+        fields = frozenset(fields) & full.names
+        if fields == full.names:
+            return full
+        key = (serializer_class, fields)
+        with cls._lock:
+            projection = cls._subsets.get(key)
+            if projection is not None:
+                cls._subsets.move_to_end(key)
+                return projection
+        projection = cls._build(serializer_class, fields)
+        with cls._lock:
+            cls._subsets[key] = projection
+            while len(cls._subsets) > cls.MAX_SUBSETS:
+                cls._subsets.popitem(last=False)
+        return projection
+
+    @classmethod
+    def _build(cls, serializer_class, only=None):
+        model = serializer_class.Meta.model
+        fields = (serializer_class(fields=only) if only is not None else serializer_class()).fields
+        lookups = []
+        namespace = {'iso_datetime': _iso_datetime}
+        lines = ['def encode(row, tz):', '    d = {}']
+
+        def column(lookup):
+            if lookup not in lookups:
+                lookups.append(lookup)
+            return f'row[{lookups.index(lookup)}]'
+
+        for name, field in fields.items():
+            if field.write_only:
+                continue
+            path = field.source.split('.')
+            if len(path) > 2:
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name}: source nested too deep for a projection')
+            try:
+                model_field = model._meta.get_field(path[0])
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name}: source is not a model field')
+            guard = None
+            if len(path) == 2:
+                if not model_field.is_relation or model_field.many_to_many or model_field.one_to_many:
+                    raise ImproperlyConfigured(f'{serializer_class.__name__}.{name}: unsupported source {field.source}')
+                if model_field.null:
+                    guard = column(model_field.attname)
+                value = column(f'{path[0]}__{path[1]}')
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                value = column(model_field.attname)
+            elif model_field.is_relation:
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name}: unsupported relation field')
+            else:
+                value = column(path[0])
+
+            if isinstance(field, (serializers.PrimaryKeyRelatedField,) + _PASSTHROUGH):
+                expression = value
+            elif isinstance(field, serializers.DateTimeField) and _is_plain_iso_datetime(field):
+                expression = f'iso_datetime({value}, tz) if {value} is not None else None'
+            elif isinstance(field, (serializers.DateTimeField, serializers.DateField, serializers.DecimalField)):
+                namespace[f'to_{name}'] = field.to_representation
+                expression = f'to_{name}({value}) if {value} is not None else None'
+            else:
+                raise ImproperlyConfigured(
+                    f'{serializer_class.__name__}.{name}: {type(field).__name__} has no fast representation'
+                )
+            if guard:
+                lines.append(f'    if {guard} is not None:')
+                lines.append(f'        d[{name!r}] = {expression}')
+            else:
+                lines.append(f'    d[{name!r}] = {expression}')
+        lines.append('    return d')
+        exec('\n'.join(lines), namespace)
+        return cls(frozenset(fields), tuple(lookups), namespace['encode'])
+
+    def rows(self, queryset):
+        """Encoded rows of ``queryset`` (its filters, ordering and slicing apply)."""
+        encode = self.encode
+        tz = timezone.get_current_timezone()
+        return [encode(row, tz) for row in queryset.values_list(*self.lookups)]
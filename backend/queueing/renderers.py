@@ -0,0 +1,34 @@
+"""
+orjson-backed JSON renderer producing the same bytes as DRF's JSONRenderer
+(compact, unescaped UTF-8, U+2028/U+2029 escaped) for the data the list
+endpoints send: strings, ints, bools, None and pre-formatted dates.
+
+Values orjson would format differently from DRF — datetimes, Decimals,
+lazy strings — are handed to DRF's own encoder. Floats are the exception:
+orjson writes exponents as ``1e16`` where json writes ``1e+16``, so keep
+this renderer to endpoints whose floats (if any) stay in plain notation.
+Indented output, or anything orjson cannot encode, falls back to
+JSONRenderer.
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+_drf_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            output = orjson.dumps(data, default=_drf_default, option=_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer: these are valid JSON but not valid JavaScript
+        if b'\xe2\x80' in output:
+            output = output.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return output
@@ -0,0 +1,112 @@
+"""
+Versioned response cache for near-static reference data (hospitals,
+departments).
+
+Every cached model has a version counter in the shared cache, bumped on
+each save or delete (signals.py). A cached response is stored under a key
+that includes the current versions of the models it was built from, so one
+bump makes every older entry unreachable at once — across all workers, since
+versions and entries both live in the default cache (Redis when configured).
+Stale entries are never read again and simply expire.
+
+Decorate the GET handlers with ``@versioned_cache(models)``. Entries hold the JSON bytes as rendered once on a miss, with their ETag;
+a hit is two cache reads and no queries or serialization, and a request
+whose If-None-Match matches gets an empty 304. Misses are built from the
+primary database, never from a replica that may not have the write yet.
+
+Bulk writes that bypass signals (``QuerySet.update``, ``bulk_create``) must
+call ``bump_model_version`` themselves; otherwise their changes show up
+after RESPONSE_CACHE['TTL'].
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from . import metrics
+from .db_router import use_primary
+
+
+def get_config():
+    return getattr(settings, 'RESPONSE_CACHE', {})
+
+
+def _version_key(label):
+    return f'careflow:model_version:{label}'
+
+
+def model_versions(labels):
+    """Current version of each model label, in one cache round trip."""
+    found = cache.get_many([_version_key(label) for label in labels])
+    return [found.get(_version_key(label), 0) for label in labels]
+
+
+def bump_model_version(label):
+    """Invalidate every cached response built from this model."""
+    key = _version_key(label)
+    # Versions never expire: a dropped key would reset to 0 and could revive stale entries
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def _cache_key(request, models, query_params):
+    match = request.resolver_match
+    args = ':'.join(f'{k}={v}' for k, v in sorted(match.kwargs.items()))
+    # ?fields= / ?expand= (SparseFieldsetMixin) change every response they are given to
+    params = ':'.join(
+        f'{name}={request.query_params.get(name, "")}' for name in (*query_params, 'fields', 'expand')
+    )
+    stamp = '.'.join(map(str, model_versions(models)))
+    return f'careflow:response:{match.view_name}:{args}:{params}:{stamp}'
+
+
+def versioned_cache(models, query_params=()):
+    """
+    Serve a GET handler's 200 responses from the versioned cache.
+
+    ``models`` are the model labels the response is built from, and
+    ``query_params`` the only query parameters that change it.
+    """
+
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            config = get_config()
+            if not config.get('ENABLED', True):
+                return handler(view, request, *args, **kwargs)
+            key = _cache_key(request, models, query_params)
+            entry = cache.get(key)
+            if entry is None:
+                # A lagging replica could fill the new version with pre-write rows
+                use_primary()
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                body = JSONRenderer().render(response.data)
+                entry = (f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', body)
+                cache.set(key, entry, timeout=config.get('TTL', 300))
+                outcome = 'miss'
+            else:
+                outcome = 'hit'
+
+            etag, body = entry
+            client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+            if etag in client_etags or '*' in client_etags:
+                response = HttpResponseNotModified()
+                outcome = 'not_modified' if outcome == 'hit' else outcome
+            else:
+                response = HttpResponse(body, content_type='application/json')
+            metrics.RESPONSE_CACHE.labels(request.resolver_match.view_name, outcome).inc()
+            response['ETag'] = etag
+            patch_cache_control(response, public=True, max_age=config.get('MAX_AGE', 60))
+            return response
+        return wrapper
+    return decorate
@@ -4,4 +4,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     path('ws/hospitals/<int:hospital_id>/', consumers.HospitalStatusConsumer.as_asgi()),
+    path('ws/queue/<int:pk>/', consumers.QueueEntryETAConsumer.as_asgi()),
 ]
@@ -3,10 +3,88 @@ Serializers for patient dashboard and appointment management
 """
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
+from .hashing import make_password
 from .models import User, Appointment, Payment, AppointmentSlot, Hospital, Department
 
 
+def requested_names(request, param):
+    """Comma-separated names from a GET query parameter, or None when it is absent."""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    raw = request.query_params.get(param) if hasattr(request, 'query_params') else request.GET.get(param)
+    if raw is None:
+        return None
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Let GET requests choose what a serializer returns:
+
+    * ``?fields=id,status`` keeps only those fields (unknown names are ignored);
+    * ``?expand=hospital`` replaces a relation's id with the nested object,
+      for the relations in ``Meta.expandable_fields``.
+
+    Without either parameter the output is unchanged. The request comes from
+    the serializer context (or pass ``fields=`` / ``expand=``). Views call
+    ``setup_eager_loading(queryset, request)`` so that only the selected
+    fields' joins, prefetches and annotations (``Meta.eager_loading``) run.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if fields is None:
+            fields = requested_names(request, 'fields')
+        if expand is None:
+            expand = requested_names(request, 'expand')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in expand or ():
+            if name in expandable and name in self.fields:
+                self.fields[name] = expandable[name](read_only=True)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request=None, fields=None, expand=None):
+        """
+        Apply the eager loading of the fields this request selects (all by
+        default). ``Meta.eager_loading`` maps a field to a select_related
+        path, or to a function of the queryset for anything else.
+        """
+        if fields is None:
+            fields = requested_names(request, 'fields')
+        if expand is None:
+            expand = requested_names(request, 'expand') or set()
+        for name, load in getattr(cls.Meta, 'eager_loading', {}).items():
+            if fields is None or name in fields:
+                queryset = queryset.select_related(load) if isinstance(load, str) else load(queryset)
+        for name, nested in getattr(cls.Meta, 'expandable_fields', {}).items():
+            if name in expand and (fields is None or name in fields):
+                paths = [path for path in getattr(nested.Meta, 'eager_loading', {}).values() if isinstance(path, str)]
+                queryset = queryset.select_related(name, *(f'{name}__{path}' for path in paths))
+        return queryset
+
+
+def _with_patient_appointment_counts(queryset):
+    """Annotate the patient's total / completed / cancelled appointment counts as subqueries."""
+    def patient_count(**filters):
+        counts = Appointment.objects.filter(patient=OuterRef('patient'), **filters).order_by().values(
+            'patient'
+        ).annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    return queryset.annotate(
+        patient_total_appointments=patient_count(),
+        patient_completed_appointments=patient_count(status='completed'),
+        patient_cancelled_appointments=patient_count(status='cancelled'),
+    )
+
+
 class PatientRegisterSerializer(serializers.Serializer):
     """Serializer for patient registration"""
     username = serializers.CharField(max_length=150, min_length=3)
@@ -34,33 +112,34 @@ class PatientRegisterSerializer(serializers.Serializer):
         validated_data.pop('password2')
         password = validated_data.pop('password')
         
-        # Create patient user
+        # Create patient user (hashed off the request thread, saved in one INSERT)
         user = User.objects.create(
             role='patient',  # Always create as patient
+            password=make_password(password),
             **validated_data
         )
-        user.set_password(password)
-        user.save()
         return user
 
 
-class HospitalSerializer(serializers.ModelSerializer):
+class HospitalSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Hospital"""
     class Meta:
         model = Hospital
         fields = ['id', 'name', 'address', 'created_at']
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Department"""
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     
     class Meta:
         model = Department
         fields = ['id', 'name', 'description', 'hospital', 'hospital_name']
+        expandable_fields = {'hospital': HospitalSerializer}
+        eager_loading = {'hospital_name': 'hospital'}
 
 
-class AppointmentSlotSerializer(serializers.ModelSerializer):
+class AppointmentSlotSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Appointment Slot"""
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     department_name = serializers.CharField(source='department.name', read_only=True)
@@ -71,9 +150,11 @@ class AppointmentSlotSerializer(serializers.ModelSerializer):
             'id', 'hospital', 'hospital_name', 'department', 'department_name',
             'start_time', 'end_time', 'is_booked', 'patient_name'
         ]
+        expandable_fields = {'hospital': HospitalSerializer, 'department': DepartmentSerializer}
+        eager_loading = {'hospital_name': 'hospital', 'department_name': 'department'}
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Appointment"""
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     department_name = serializers.CharField(source='department.name', read_only=True)
@@ -92,6 +173,11 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'id', 'patient', 'payment_id', 'created_at', 'updated_at',
             'confirmed_at', 'completed_at'
         ]
+        expandable_fields = {'hospital': HospitalSerializer, 'department': DepartmentSerializer}
+        eager_loading = {
+            'patient_name': 'patient', 'hospital_name': 'hospital', 'department_name': 'department',
+            'slot_time': 'appointment_slot',
+        }
     
     def get_slot_time(self, obj):
         if obj.appointment_slot:
@@ -102,7 +188,7 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return None
 
 
-class AppointmentDetailSerializer(serializers.ModelSerializer):
+class AppointmentDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Detailed serializer for Appointment with full patient info"""
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     department_name = serializers.CharField(source='department.name', read_only=True)
@@ -123,18 +209,34 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
             'payment_id', 'payment_details', 'created_at', 'updated_at',
             'confirmed_at', 'completed_at'
         ]
-    
+        expandable_fields = {'hospital': HospitalSerializer, 'department': DepartmentSerializer}
+        # Everything this serializer reads, in a fixed number of queries: related rows by
+        # JOIN, payments by one prefetch and the patient's appointment counts as subqueries
+        eager_loading = {
+            'patient_details': lambda qs: _with_patient_appointment_counts(qs.select_related('patient')),
+            'hospital_name': 'hospital',
+            'department_name': 'department',
+            'slot_details': lambda qs: qs.select_related('appointment_slot__hospital', 'appointment_slot__department'),
+            'payment_details': lambda qs: qs.prefetch_related('payment_transactions'),
+        }
+
     def get_patient_details(self, obj):
         patient = obj.patient
+        if hasattr(obj, 'patient_total_appointments'):
+            counts = (obj.patient_total_appointments, obj.patient_completed_appointments,
+                      obj.patient_cancelled_appointments)
+        else:
+            counts = (patient.appointments.count(), patient.appointments.filter(status='completed').count(),
+                      patient.appointments.filter(status='cancelled').count())
         return {
             'id': patient.id,
             'username': patient.username,
             'email': patient.email,
             'role': patient.role,
             'date_joined': patient.date_joined,
-            'total_appointments': patient.appointments.count(),
-            'completed_appointments': patient.appointments.filter(status='completed').count(),
-            'cancelled_appointments': patient.appointments.filter(status='cancelled').count(),
+            'total_appointments': counts[0],
+            'completed_appointments': counts[1],
+            'cancelled_appointments': counts[2],
         }
     
     def get_payment_details(self, obj):
@@ -152,7 +254,7 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
         return None
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Payment"""
     patient_name = serializers.CharField(source='patient.username', read_only=True)
     appointment_info = serializers.SerializerMethodField()
@@ -168,7 +270,12 @@ class PaymentSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'patient', 'created_at', 'updated_at', 'paid_at'
         ]
-    
+        # JOIN what patient_name and appointment_info read, instead of a query per payment
+        eager_loading = {
+            'patient_name': 'patient',
+            'appointment_info': lambda qs: qs.select_related('appointment__hospital', 'appointment__department'),
+        }
+
     def get_appointment_info(self, obj):
         return {
             'id': obj.appointment.id,
@@ -182,7 +289,7 @@ class PaymentSerializer(serializers.ModelSerializer):
 from .models import Bed, QueueEntry
 
 
-class BedSerializer(serializers.ModelSerializer):
+class BedSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Bed"""
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     department_name = serializers.CharField(source='department.name', read_only=True)
@@ -190,9 +297,11 @@ class BedSerializer(serializers.ModelSerializer):
     class Meta:
         model = Bed
         fields = '__all__'
+        expandable_fields = {'hospital': HospitalSerializer, 'department': DepartmentSerializer}
+        eager_loading = {'hospital_name': 'hospital', 'department_name': 'department'}
 
 
-class QueueEntrySerializer(serializers.ModelSerializer):
+class QueueEntrySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for Queue Entry"""
     hospital_name = serializers.CharField(source='hospital.name', read_only=True)
     department_name = serializers.CharField(source='department.name', read_only=True)
@@ -200,24 +309,26 @@ class QueueEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = QueueEntry
         fields = '__all__'
+        expandable_fields = {'hospital': HospitalSerializer, 'department': DepartmentSerializer}
+        eager_loading = {'hospital_name': 'hospital', 'department_name': 'department'}
 
 
 class LiveStatusSerializer(serializers.Serializer):
-    """Serializer for live status data"""
+    """Serializer for live status data (services.live_status_snapshot)"""
     hospital_id = serializers.IntegerField()
-    hospital_name = serializers.CharField()
-    total_beds = serializers.IntegerField()
     available_beds = serializers.IntegerField()
     occupied_beds = serializers.IntegerField()
-    queue_waiting = serializers.IntegerField()
-    queue_in_progress = serializers.IntegerField()
-    departments = serializers.ListField()
+    waiting_patients = serializers.IntegerField()
+    in_progress = serializers.IntegerField()
+    predicted_wait_minutes = serializers.IntegerField()
+    last_updated = serializers.DateTimeField()
 
 
 class DashboardSerializer(serializers.Serializer):
-    """Serializer for dashboard metrics"""
+    """Serializer for dashboard metrics (services.dashboard_metrics)"""
     hospital_id = serializers.IntegerField()
-    total_patients_today = serializers.IntegerField()
-    average_wait_time = serializers.FloatField()
-    bed_occupancy_rate = serializers.FloatField()
-    departments_stats = serializers.DictField()
+    beds = serializers.DictField(child=serializers.IntegerField())
+    queue = serializers.DictField(child=serializers.IntegerField())
+    predicted_wait_minutes = serializers.IntegerField()
+    throughput = serializers.ListField(child=serializers.DictField())
+    generated_at = serializers.DateTimeField()
@@ -1,11 +1,15 @@
-from datetime import timedelta
+import functools
+import threading
+from datetime import datetime, timedelta
 from typing import Optional
 from collections import defaultdict
 
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 
-from .models import Bed, QueueEntry
+from . import eta, metrics
+from .models import Appointment, AppointmentSlot, Bed, Payment, QueueEntry, QueueEntryArchive
 
 
 class PredictionService:
@@ -16,16 +20,22 @@ class PredictionService:
         self.min_minutes = min_minutes
 
     def predict_wait_time_minutes(self, hospital_id: int, department_id: Optional[int] = None) -> int:
-        qs = QueueEntry.objects.filter(
-            hospital_id=hospital_id,
-            status=QueueEntry.Status.DONE,
-            finished_at__isnull=False,
-        ).order_by('-finished_at')
-        if department_id:
-            qs = qs.filter(department_id=department_id)
+        recent = []
+        # Newest first: the live table, then history (archive.py) if it holds fewer than five
+        for model in (QueueEntry, QueueEntryArchive):
+            qs = model.objects.filter(
+                hospital_id=hospital_id,
+                status=QueueEntry.Status.DONE,
+                finished_at__isnull=False,
+            ).order_by('-finished_at')
+            if department_id:
+                qs = qs.filter(department_id=department_id)
+            recent += qs[:5 - len(recent)]
+            if len(recent) == 5:
+                break
 
         durations = []
-        for entry in qs[:5]:
+        for entry in recent:
             duration = entry.effective_duration
             if duration:
                 durations.append(duration.total_seconds() / 60)
@@ -40,31 +50,48 @@ class PredictionService:
         """Update expected_finish for waiting patients based on moving average."""
         predicted_minutes = self.predict_wait_time_minutes(hospital_id, department_id)
         now = timezone.now()
+        # Queue order, as eta.position ranks entries
         waiting_qs = QueueEntry.objects.filter(
-            hospital_id=hospital_id,
-            status=QueueEntry.Status.WAITING,
-        ).order_by('arrival_time')
-        if department_id:
-            waiting_qs = waiting_qs.filter(department_id=department_id)
+            **eta.queue_scope(hospital_id, department_id),
+        ).order_by('arrival_time', 'pk')
 
-        for idx, entry in enumerate(waiting_qs):
+        entries = list(waiting_qs)
+        for idx, entry in enumerate(entries):
             entry.expected_finish = now + timedelta(minutes=predicted_minutes * (idx + 1))
-            entry.save(update_fields=['expected_finish'])
+        # One UPDATE instead of a save (and a post_save broadcast) per waiting patient;
+        # expected_finish is not part of the live snapshot, so nothing to broadcast
+        QueueEntry.objects.bulk_update(entries, ['expected_finish'], batch_size=500)
 
+        from .mongo_sync import sync_many
+        sync_many('queue_entries', entries)
+        # Patients subscribed to their own entry (ws/queue/<pk>/) get the new position and ETA
+        eta.push_queue(hospital_id, entries)
 
-def live_status_snapshot(hospital_id: int) -> dict:
+
+def live_status_snapshot(hospital_id: int, department_id: Optional[int] = None) -> dict:
+    """Bed and queue counts for a hospital, or for one of its departments."""
     service = PredictionService()
-    available_beds = Bed.objects.filter(hospital_id=hospital_id, status=Bed.Status.AVAILABLE).count()
-    occupied_beds = Bed.objects.filter(hospital_id=hospital_id, status=Bed.Status.OCCUPIED).count()
-    waiting_patients = QueueEntry.objects.filter(hospital_id=hospital_id, status=QueueEntry.Status.WAITING).count()
-    in_progress = QueueEntry.objects.filter(hospital_id=hospital_id, status=QueueEntry.Status.IN_PROGRESS).count()
-    predicted_wait = service.predict_wait_time_minutes(hospital_id)
+    scope = {'hospital_id': hospital_id}
+    if department_id:
+        scope['department_id'] = department_id
+    beds = Bed.objects.filter(**scope).aggregate(
+        available=Count('pk', filter=Q(status=Bed.Status.AVAILABLE)),
+        occupied=Count('pk', filter=Q(status=Bed.Status.OCCUPIED)),
+    )
+    queue = QueueEntry.objects.filter(
+        **scope,
+        status__in=[QueueEntry.Status.WAITING, QueueEntry.Status.IN_PROGRESS],
+    ).aggregate(
+        waiting=Count('pk', filter=Q(status=QueueEntry.Status.WAITING)),
+        in_progress=Count('pk', filter=Q(status=QueueEntry.Status.IN_PROGRESS)),
+    )
+    predicted_wait = service.predict_wait_time_minutes(hospital_id, department_id)
     return {
-        'hospital_id': hospital_id,
-        'available_beds': available_beds,
-        'occupied_beds': occupied_beds,
-        'waiting_patients': waiting_patients,
-        'in_progress': in_progress,
+        **scope,
+        'available_beds': beds['available'],
+        'occupied_beds': beds['occupied'],
+        'waiting_patients': queue['waiting'],
+        'in_progress': queue['in_progress'],
         'predicted_wait_minutes': predicted_wait,
         'last_updated': timezone.now(),
     }
@@ -84,15 +111,26 @@ def dashboard_metrics(hospital_id: int) -> dict:
     queue_counts = {status: 0 for status, _ in QueueEntry.Status.choices}
     for row in QueueEntry.objects.filter(hospital_id=hospital_id).values_list('status', flat=True):
         queue_counts[row] = queue_counts.get(row, 0) + 1
+    # Finished visits moved to history (archive.py) still count
+    archived = QueueEntryArchive.objects.filter(hospital_id=hospital_id).aggregate(
+        done=Count('pk', filter=Q(status=QueueEntry.Status.DONE)),
+        cancelled=Count('pk', filter=Q(status=QueueEntry.Status.CANCELLED)),
+    )
+    for status, count in archived.items():
+        queue_counts[status] += count
 
     # Throughput buckets per hour (last 12h)
     buckets = defaultdict(int)
-    for entry in QueueEntry.objects.filter(
-        hospital_id=hospital_id,
-        status=QueueEntry.Status.DONE,
-        finished_at__gte=window_start,
-    ):
-        ts = entry.finished_at or now
+    completed = [
+        model.objects.filter(
+            hospital_id=hospital_id,
+            status=QueueEntry.Status.DONE,
+            finished_at__gte=window_start,
+        ).order_by().values_list('finished_at', flat=True)
+        for model in (QueueEntry, QueueEntryArchive)
+    ]
+    for finished_at in completed[0].union(completed[1], all=True):
+        ts = finished_at or now
         ts = ts.replace(minute=0, second=0, microsecond=0)
         buckets[ts] += 1
 
@@ -115,3 +153,86 @@ def dashboard_metrics(hospital_id: int) -> dict:
         'throughput': sorted(bucket_map.values(), key=lambda x: x['hour']),
         'generated_at': now,
     }
+
+
+# ─── Payment confirmation ───
+
+_pending_slot_syncs = threading.local()
+
+
+def _sync_confirmed_slots(slot_ids):
+    """on_commit hook: mirror every slot booked in the committed transaction at once."""
+    from .mongo_sync import sync_many
+    sync_many('appointment_slots', AppointmentSlot.objects.filter(pk__in=slot_ids))
+
+
+def _sync_slot_on_commit(slot_id):
+    """
+    Add ``slot_id`` to the current transaction's batch of slots to mirror.
+
+    A batch's hook is registered once, holding its own set of ids. A batch
+    is only added to while that hook is still pending on the connection:
+    once it has run or a rollback has discarded it, the next slot starts a
+    new batch, so ids from a rolled-back transaction never reach Mongo.
+    """
+    connection = transaction.get_connection()
+    batch = getattr(_pending_slot_syncs, 'batch', None)
+    if batch is None or not any(func is batch for _, func, _ in connection.run_on_commit):
+        batch = _pending_slot_syncs.batch = functools.partial(_sync_confirmed_slots, set())
+        transaction.on_commit(batch)
+    batch.args[0].add(slot_id)
+
+
+def confirm_payment(payment_id: int, gateway_payment_id: str, payment_method: str = '',
+                    gateway_order_id: Optional[str] = None,
+                    gateway_signature: Optional[str] = None) -> Optional[datetime]:
+    """
+    Mark a payment successful and confirm its appointment and slot atomically.
+
+    The payment row is locked, then payment, appointment and slot are written
+    with set-based UPDATEs of only the changed columns. Side effects (the
+    Mongo mirror of booked slots) run once per transaction after commit.
+    Returns the confirmation time, or None if the payment was already successful.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        try:
+            row = (
+                Payment.objects.select_for_update(of=('self',))
+                .values('status', 'appointment_id', 'appointment__appointment_slot_id', 'patient__username')
+                .get(pk=payment_id)
+            )
+        except Payment.DoesNotExist:
+            return None
+        if row['status'] == 'success':
+            return None
+        metrics.payment_transition(row['status'], 'success')
+
+        payment_fields = {
+            'status': 'success',
+            'gateway_payment_id': gateway_payment_id,
+            'payment_method': payment_method,
+            'paid_at': now,
+            'updated_at': now,
+        }
+        if gateway_order_id is not None:
+            payment_fields['gateway_order_id'] = gateway_order_id
+        if gateway_signature is not None:
+            payment_fields['gateway_signature'] = gateway_signature
+        Payment.objects.filter(pk=payment_id).update(**payment_fields)
+
+        Appointment.objects.filter(pk=row['appointment_id']).update(
+            payment_status='paid',
+            payment_id=gateway_payment_id,
+            status='confirmed',
+            confirmed_at=now,
+            updated_at=now,
+        )
+
+        slot_id = row['appointment__appointment_slot_id']
+        if slot_id:
+            AppointmentSlot.objects.filter(pk=slot_id).update(
+                is_booked=True, patient_name=row['patient__username'],
+            )
+            _sync_slot_on_commit(slot_id)
+    return now
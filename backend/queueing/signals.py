@@ -1,28 +1,91 @@
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.db import transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 
-from .models import Bed, QueueEntry
+from . import eta, metrics
+from .authentication import bump_auth_version
+from .live_groups import bump_version, department_group, encode_status, hospital_group, is_watched
+from .models import Bed, Department, Hospital, QueueEntry, User
+from .response_cache import bump_model_version
 from .services import live_status_snapshot
+from .token_blacklist import blacklist_filter
 
 channel_layer = get_channel_layer()
 
 
-def _broadcast(hospital_id: int):
+def _broadcast(hospital_id: int, *department_ids):
+    """Send fresh snapshots to the hospital's group and to each watched department's."""
     if not channel_layer:
         return
-    payload = live_status_snapshot(hospital_id)
-    async_to_sync(channel_layer.group_send)(
-        f"hospital_{hospital_id}", {'type': 'broadcast_status', 'payload': payload}
-    )
+    with metrics.BROADCAST_SECONDS.time():
+        group_send = async_to_sync(channel_layer.group_send)
+        version = bump_version(hospital_id)
+        group_send(hospital_group(hospital_id), {
+            'type': 'broadcast_status', 'version': version,
+            'text': encode_status(live_status_snapshot(hospital_id)),
+        })
+        for department_id in dict.fromkeys(department_ids):
+            if department_id and is_watched(hospital_id, department_id):
+                group_send(department_group(hospital_id, department_id), {
+                    'type': 'broadcast_status', 'version': version,
+                    'text': encode_status(live_status_snapshot(hospital_id, department_id)),
+                })
+
+
+def _departments(instance):
+    """The department an instance is in and, if it was just moved, the one it left."""
+    previous = instance.loaded_department_id
+    instance.loaded_department_id = instance.department_id
+    return (instance.department_id, previous)
 
 
 @receiver([post_save, post_delete], sender=Bed)
 def bed_updated(sender, instance, **kwargs):
-    _broadcast(instance.hospital_id)
+    _broadcast(instance.hospital_id, *_departments(instance))
 
 
 @receiver([post_save, post_delete], sender=QueueEntry)
 def queue_updated(sender, instance, **kwargs):
-    _broadcast(instance.hospital_id)
+    _broadcast(instance.hospital_id, *_departments(instance))
+
+
+@receiver(post_save, sender=QueueEntry)
+def queue_entry_left_queue(sender, instance, **kwargs):
+    # Waiting entries are pushed by update_expected_finish_times; this covers the entry's own exit
+    if instance.status != QueueEntry.Status.WAITING:
+        eta.push(instance.hospital_id, [eta.state(instance, None)])
+
+
+@receiver(post_delete, sender=QueueEntry)
+def queue_entry_removed(sender, instance, **kwargs):
+    eta.push(instance.hospital_id, [eta.state(instance, None, status=eta.REMOVED)])
+
+
+@receiver([post_save, post_delete], sender=Hospital)
+@receiver([post_save, post_delete], sender=Department)
+def reference_data_updated(sender, instance, **kwargs):
+    label = sender._meta.model_name
+    bump_model_version(label)
+    # Again after commit, in case a concurrent request cached the pre-commit rows under the new version
+    transaction.on_commit(lambda: bump_model_version(label))
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_updated(sender, instance, update_fields=None, **kwargs):
+    # Login bookkeeping does not change what authentication returns
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    user_id = instance.pk
+    bump_auth_version(user_id)
+    # Again after commit, in case a concurrent request re-cached the pre-commit row
+    transaction.on_commit(lambda: bump_auth_version(user_id))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, created, **kwargs):
+    # Visible to every worker until their filters have synced the new row
+    if created:
+        blacklist_filter.mark_blacklisted(instance.token.jti)
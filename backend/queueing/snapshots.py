@@ -0,0 +1,302 @@
+"""
+Columnar snapshots of queue and appointment history for offline analysis.
+
+``manage.py snapshot_history`` writes each dataset as one directory per
+month, holding one ``.npy`` array per column plus a ``_meta.json``::
+
+    SNAPSHOTS['DIR']/queue/2026-09/{id,hospital_id,...,finished_at}.npy
+    SNAPSHOTS['DIR']/appointments/2026-09/...
+
+Plain ``.npy`` files rather than ``.npz``, so ``np.load(mmap_mode='r')``
+maps each column straight from the page cache: opening a partition reads
+nothing, and a vectorized expression over a column touches only that
+column's pages. ``open_partition`` / ``load`` below do this.
+
+Column types:
+
+* ids: int64; a missing foreign key is -1;
+* datetimes: ``datetime64[us]`` in UTC; a missing one is NaT;
+* amounts: float64;
+* choice fields: uint8 codes into the partition's ``categories`` (the
+  model's choices, in order), e.g. ``p.where('status', 'done')``.
+
+Names, symptoms and notes are not exported.
+
+Exports are incremental. A month is re-read from the database on each run
+until SETTLE_DAYS after it ends; by then its rows have stopped changing
+(visits finished, appointments completed or cancelled), it is marked
+complete and later runs skip it. Each partition is written to a temporary
+directory and swapped in whole, so readers never see half a month.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Appointment, QueueEntry, QueueEntryArchive
+
+META_FILE = '_meta.json'
+MISSING_ID = -1
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_NAT = np.iinfo(np.int64).min
+
+
+def get_config():
+    return getattr(settings, 'SNAPSHOTS', {})
+
+
+def snapshot_dir():
+    return str(get_config().get('DIR') or os.path.join(settings.BASE_DIR, 'snapshots'))
+
+
+# ─── Export ───
+
+class Column:
+    """A snapshot column: its name, the ORM lookup it is read from, and its kind."""
+
+    KINDS = ('id', 'nullable_id', 'datetime', 'float', 'category')
+
+    def __init__(self, name, lookup, kind, categories=None):
+        assert kind in self.KINDS, kind
+        self.name = name
+        self.lookup = lookup
+        self.kind = kind
+        self.categories = list(categories or [])
+
+    def to_array(self, values):
+        if self.kind == 'id':
+            return np.array(values, dtype=np.int64)
+        if self.kind == 'nullable_id':
+            return np.array([MISSING_ID if v is None else v for v in values], dtype=np.int64)
+        if self.kind == 'float':
+            return np.array([float(v) for v in values], dtype=np.float64)
+        if self.kind == 'datetime':
+            micros = [_NAT if v is None else (v - _EPOCH) // _MICROSECOND for v in values]
+            return np.array(micros, dtype=np.int64).view('datetime64[us]')
+        codes = {value: code for code, value in enumerate(self.categories)}
+        return np.array([codes[v] for v in values], dtype=np.uint8)
+
+
+class Dataset:
+    """
+    One snapshot dataset: the models its rows come from, partitioned by month
+    of ``date_field``. Rows are keyed by their ``id`` column; when two models
+    both hold an id, the later model's row is kept.
+    """
+
+    def __init__(self, name, models, date_field, columns):
+        self.name = name
+        self.models = models
+        self.date_field = date_field
+        self.columns = columns
+        self.key = [column.name for column in columns].index('id')
+
+    def querysets(self, start, end):
+        lookups = [column.lookup for column in self.columns]
+        for model in self.models:
+            yield model.objects.filter(**{
+                f'{self.date_field}__gte': start, f'{self.date_field}__lt': end,
+            }).order_by('pk').values_list(*lookups)
+
+    def first_date(self):
+        dates = [model.objects.aggregate(first=Min(self.date_field))['first'] for model in self.models]
+        dates = [d for d in dates if d is not None]
+        return min(dates) if dates else None
+
+    def read_month(self, start, end, chunk_size=5000):
+        """The month's rows, in id order, as one numpy array per column."""
+        # The models are read one query at a time, so a queue entry archived
+        # in between is seen in both; the archive (read last) wins.
+        rows = {}
+        for queryset in self.querysets(start, end):
+            for row in queryset.iterator(chunk_size=chunk_size):
+                rows[row[self.key]] = row
+        values = list(zip(*(rows[key] for key in sorted(rows)))) or [() for _ in self.columns]
+        return {column.name: column.to_array(v) for column, v in zip(self.columns, values)}
+
+
+def _choices(field_choices):
+    return [value for value, _ in field_choices]
+
+
+DATASETS = {
+    # Live and archived entries (archive.py) alike
+    'queue': Dataset('queue', (QueueEntry, QueueEntryArchive), 'arrival_time', [
+        Column('id', 'id', 'id'),
+        Column('hospital_id', 'hospital_id', 'id'),
+        Column('department_id', 'department_id', 'nullable_id'),
+        Column('status', 'status', 'category', _choices(QueueEntry.Status.choices)),
+        Column('arrival_time', 'arrival_time', 'datetime'),
+        Column('started_at', 'started_at', 'datetime'),
+        Column('finished_at', 'finished_at', 'datetime'),
+        Column('expected_finish', 'expected_finish', 'datetime'),
+    ]),
+    'appointments': Dataset('appointments', (Appointment,), 'created_at', [
+        Column('id', 'id', 'id'),
+        Column('patient_id', 'patient_id', 'id'),
+        Column('hospital_id', 'hospital_id', 'id'),
+        Column('department_id', 'department_id', 'nullable_id'),
+        Column('status', 'status', 'category', _choices(Appointment.STATUS_CHOICES)),
+        Column('payment_status', 'payment_status', 'category', _choices(Appointment.PAYMENT_STATUS_CHOICES)),
+        Column('payment_amount', 'payment_amount', 'float'),
+        Column('slot_start', 'appointment_slot__start_time', 'datetime'),
+        Column('created_at', 'created_at', 'datetime'),
+        Column('confirmed_at', 'confirmed_at', 'datetime'),
+        Column('completed_at', 'completed_at', 'datetime'),
+    ]),
+}
+
+
+def month_bounds(month):
+    """``(start, end)`` of a ``YYYY-MM`` month, as aware UTC datetimes."""
+    start = datetime.strptime(month, '%Y-%m').replace(tzinfo=dt_timezone.utc)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def months_between(first, last):
+    """``YYYY-MM`` labels from the month of ``first`` to the month of ``last``, inclusive."""
+    month = first.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    months = []
+    while month <= last:
+        months.append(f'{month:%Y-%m}')
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def read_meta(dataset, month, root=None):
+    try:
+        with open(os.path.join(root or snapshot_dir(), dataset, month, META_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_partition(dataset, month, root=None, now=None):
+    """(Re)write one month of ``dataset``; returns its metadata."""
+    root = root or snapshot_dir()
+    now = now or timezone.now()
+    start, end = month_bounds(month)
+    arrays = dataset.read_month(start, end)
+    settle = timedelta(days=get_config().get('SETTLE_DAYS', 30))
+    meta = {
+        'dataset': dataset.name,
+        'month': month,
+        'rows': len(arrays['id']),
+        'columns': {name: str(array.dtype) for name, array in arrays.items()},
+        'categories': {c.name: c.categories for c in dataset.columns if c.kind == 'category'},
+        'written_at': now.isoformat(),
+        'complete': now >= end + settle,
+    }
+
+    target = os.path.join(root, dataset.name, month)
+    staging = f'{target}.{os.getpid()}.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f'{name}.npy'), array)
+    with open(os.path.join(staging, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    # Swap the whole directory: open memory maps of the old files stay valid until closed
+    retired = f'{target}.{os.getpid()}.old'
+    if os.path.isdir(target):
+        os.rename(target, retired)
+    os.rename(staging, target)
+    shutil.rmtree(retired, ignore_errors=True)
+    return meta
+
+
+def export(dataset, root=None, full=False, since=None, now=None):
+    """
+    Bring ``dataset``'s partitions up to date; yields the metadata of each
+    month written. Complete months are skipped unless ``full``.
+    """
+    now = now or timezone.now()
+    first = dataset.first_date()
+    if first is None:
+        return
+    for month in months_between(first, now):
+        if since and month < since:
+            continue
+        meta = read_meta(dataset.name, month, root)
+        if meta and meta['complete'] and not full:
+            continue
+        yield write_partition(dataset, month, root, now)
+
+
+# ─── Analysis API ───
+
+class Partition:
+    """One month of a dataset, each column memory-mapped on first access."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self._columns = {}
+
+    @property
+    def month(self):
+        return self.meta['month']
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            if name not in self.meta['columns']:
+                raise KeyError(name)
+            # An empty array cannot be mapped
+            mmap_mode = 'r' if len(self) else None
+            self._columns[name] = np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode=mmap_mode)
+        return self._columns[name]
+
+    def code(self, column, value):
+        """The uint8 code of a category value, e.g. ``code('status', 'done')``."""
+        return self.meta['categories'][column].index(value)
+
+    def where(self, column, value):
+        """Boolean mask of rows whose category ``column`` equals ``value``."""
+        return self[column] == self.code(column, value)
+
+
+def partitions(dataset, start=None, end=None, root=None):
+    """Partitions of ``dataset`` (a name) for ``YYYY-MM`` months in [start, end], oldest first."""
+    base = os.path.join(root or snapshot_dir(), dataset)
+    if not os.path.isdir(base):
+        return []
+    months = sorted(
+        name for name in os.listdir(base)
+        if len(name) == 7 and os.path.isfile(os.path.join(base, name, META_FILE))
+    )
+    return [
+        Partition(os.path.join(base, month)) for month in months
+        if (start is None or month >= start) and (end is None or month <= end)
+    ]
+
+
+def open_partition(dataset, month, root=None):
+    return Partition(os.path.join(root or snapshot_dir(), dataset, month))
+
+
+def load(dataset, columns=None, start=None, end=None, root=None):
+    """
+    Columns of ``dataset`` over a range of months, as ``{name: array}``.
+
+    A single month is returned as its memory maps, with no copy; several
+    months are concatenated into memory, so pass ``columns`` to read only
+    what the analysis needs.
+    """
+    parts = partitions(dataset, start, end, root)
+    if not parts:
+        return {}
+    names = columns or list(parts[0].meta['columns'])
+    if len(parts) == 1:
+        return {name: parts[0][name] for name in names}
+    return {name: np.concatenate([part[name] for part in parts]) for name in names}
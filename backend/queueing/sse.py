@@ -0,0 +1,100 @@
+"""
+Live bed/queue status as Server-Sent Events, ``GET
+/api/status/<hospital_id>/stream/`` (LiveStatusStreamView), for ward
+displays and embedded browsers that cannot keep a WebSocket up through the
+hospital's proxies and would otherwise poll LiveStatusView.
+
+A stream joins the same channel-layer groups as HospitalStatusConsumer
+(live_groups.py): the hospital's group, or with ``?departments=3,4`` those
+departments' groups. signals.py encodes each broadcast once per group and a
+stream forwards that text as the event's ``data``. ``status_events`` is an
+async generator waiting on the channel layer, so under ASGI an open stream
+costs a coroutine and a channel, not a thread.
+
+Event ids are the hospital's broadcast numbers (live_groups.bump_version).
+A snapshot is the complete state, so resuming replays nothing: a browser
+reconnecting with ``Last-Event-ID`` gets the current snapshot only if there
+was a broadcast after that id.
+
+A comment line goes out every HEARTBEAT_SECONDS so proxies keep an idle
+stream open. Django 4.2 does not notice a client that disconnects in the
+middle of a streamed response, so a stream also ends after MAX_SECONDS
+(five minutes by default), which bounds how long an abandoned stream keeps
+its channel and watcher counts. EventSource reconnects by itself, ``retry``
+ms later, with its last id, so a live client loses nothing.
+
+Served over WSGI, where a stream would hold a worker thread, a request gets
+the current snapshot and the response ends: the browser reconnects every
+``retry`` ms, which is polling at that interval.
+"""
+import asyncio
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import live_groups, metrics
+from .services import live_status_snapshot
+
+
+def get_config():
+    return getattr(settings, 'LIVE_STREAM', {})
+
+
+def event(event_id, data, kind='status'):
+    return f'id: {event_id}\nevent: {kind}\ndata: {data}\n\n'
+
+
+async def status_events(hospital_id, department_ids=(), last_event_id=None, follow=True):
+    """
+    The SSE stream of a hospital's status, or of ``department_ids``'
+    snapshots if given. With ``follow=False`` it ends after the current
+    snapshot(s).
+    """
+    config = get_config()
+    channel_layer = get_channel_layer() if follow else None
+    groups = [live_groups.department_group(hospital_id, d) for d in department_ids] or [
+        live_groups.hospital_group(hospital_id)
+    ]
+    channel = None
+    if channel_layer:
+        # Subscribe before reading the snapshot, so no broadcast falls in between
+        channel = await channel_layer.new_channel()
+        for group in groups:
+            await channel_layer.group_add(group, channel)
+        for department_id in department_ids:
+            await database_sync_to_async(live_groups.watch)(hospital_id, department_id)
+    metrics.SSE_CONNECTIONS.inc()
+    metrics.SSE_ACTIVE.inc()
+    try:
+        yield f"retry: {config.get('RETRY_MS', 3000)}\n\n"
+        version = await database_sync_to_async(live_groups.current_version)(hospital_id)
+        if last_event_id != str(version):
+            for department_id in department_ids or [None]:
+                snapshot = await database_sync_to_async(live_status_snapshot)(hospital_id, department_id)
+                yield event(version, live_groups.encode_status(snapshot))
+                metrics.SSE_EVENTS.labels('snapshot').inc()
+        if not channel_layer:
+            return
+
+        loop = asyncio.get_running_loop()
+        heartbeat = config.get('HEARTBEAT_SECONDS', 15)
+        deadline = loop.time() + config.get('MAX_SECONDS', 300)
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                message = await asyncio.wait_for(channel_layer.receive(channel), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                if deadline - loop.time() > 0:
+                    yield ': keep-alive\n\n'
+                    metrics.SSE_EVENTS.labels('heartbeat').inc()
+                continue
+            if message.get('type') == 'broadcast_status':
+                yield event(message.get('version', ''), message['text'])
+                metrics.SSE_EVENTS.labels('broadcast').inc()
+    finally:
+        metrics.SSE_ACTIVE.dec()
+        if channel_layer:
+            for group in groups:
+                await channel_layer.group_discard(group, channel)
+            for department_id in department_ids:
+                await database_sync_to_async(live_groups.unwatch)(hospital_id, department_id)
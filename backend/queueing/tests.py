@@ -1,7 +1,14 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.utils import timezone
 
-from .models import Hospital, QueueEntry
+from .models import (
+    Appointment, Department, Hospital, IdempotencyRecord, Payment, PaymentWebhookEvent, QueueEntry,
+    QueueEntryArchive, User,
+)
 from .services import PredictionService
 
 
@@ -29,3 +36,1753 @@ class PredictionServiceTests(TestCase):
 
         service = PredictionService()
         self.assertEqual(service.predict_wait_time_minutes(self.hospital.id), 8)
+
+
+class PaymentGatewayTests(TestCase):
+    """Razorpay client against the local fake gateway."""
+
+    def setUp(self):
+        from .fake_gateway import FakeGatewayServer
+        from .payment_gateway import RazorpayGateway, build_session
+
+        self.server = FakeGatewayServer().start()
+        self.addCleanup(self.server.stop)
+        self.session = build_session()
+        self.addCleanup(self.session.close)
+        self.gateway = RazorpayGateway('rzp_test', 'secret', base_url=self.server.url, session=self.session)
+
+    def test_calls_reuse_one_keep_alive_connection(self):
+        order = self.gateway.create_order(500, 'INR', 'TXN1')
+        self.gateway.fetch_order(order['id'])
+        self.gateway.fetch_order_payments(order['id'])
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_idempotent_calls_retry_but_order_creation_does_not(self):
+        from .payment_gateway import GatewayError
+
+        order = self.gateway.create_order(500, 'INR', 'TXN1')
+        self.server.fail_next(2)
+        self.assertEqual(self.gateway.fetch_order(order['id'])['id'], order['id'])
+
+        self.server.fail_next(1)
+        with self.assertRaises(GatewayError):
+            self.gateway.create_order(500, 'INR', 'TXN2')
+
+    def test_non_json_response_is_a_gateway_error(self):
+        from .payment_gateway import GatewayError
+
+        order = self.gateway.create_order(500, 'INR', 'TXN1')
+        self.server.garble_next()
+        with self.assertRaisesMessage(GatewayError, 'not JSON'):
+            self.gateway.fetch_order(order['id'])
+
+    def test_read_timeout_is_enforced(self):
+        from .payment_gateway import GatewayError
+
+        self.server.latency = 0.5
+        self.gateway.timeout = (1, 0.1)
+        with self.assertRaises(GatewayError):
+            self.gateway.create_order(500, 'INR', 'TXN1')
+
+    def test_signature_verification(self):
+        from .payment_gateway import SignatureVerificationError
+
+        signature = self.gateway.signature_for('order_1', 'pay_1')
+        result = self.gateway.verify(None, {
+            'razorpay_order_id': 'order_1', 'razorpay_payment_id': 'pay_1', 'razorpay_signature': signature,
+        })
+        self.assertEqual(result['gateway_payment_id'], 'pay_1')
+        with self.assertRaises(SignatureVerificationError):
+            self.gateway.verify(None, {
+                'razorpay_order_id': 'order_1', 'razorpay_payment_id': 'pay_2', 'razorpay_signature': signature,
+            })
+        with self.assertRaises(SignatureVerificationError):
+            self.gateway.verify(None, {
+                'razorpay_order_id': 'order_1', 'razorpay_payment_id': 'pay_1', 'razorpay_signature': 'sïgnature',
+            })
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test', RAZORPAY_KEY_SECRET='secret', RAZORPAY_WEBHOOK_SECRET='whsec')
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        from .payment_gateway import reset_gateways
+
+        reset_gateways()
+        self.addCleanup(reset_gateways)
+        self.hospital = Hospital.objects.create(name='Test Hospital')
+        self.patient = User.objects.create_user('pat', password='pw-12345678')
+        appointment = Appointment.objects.create(
+            patient=self.patient, hospital=self.hospital, payment_amount=500,
+        )
+        self.payment = Payment.objects.create(
+            appointment=appointment, patient=self.patient, amount=500,
+            payment_gateway='razorpay', transaction_id='TXN1', gateway_order_id='order_1',
+        )
+
+    def deliver(self, event_id, event_type, signature=None):
+        body = json.dumps({
+            'event': event_type,
+            'payload': {'payment': {'entity': {'id': 'pay_1', 'order_id': 'order_1', 'method': 'upi'}}},
+        }).encode()
+        signature = signature or hmac.new(b'whsec', body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            '/api/payment/webhook/razorpay/', body, content_type='application/json', secure=True,
+            HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def test_rejects_bad_signature(self):
+        for signature in ('bogus', 'sïgnature'):
+            response = self.deliver('evt_1', 'payment.captured', signature=signature)
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+
+    def test_retried_delivery_is_stored_and_applied_once(self):
+        from .payment_webhooks import process_pending_events
+
+        for _ in range(3):
+            self.assertEqual(self.deliver('evt_1', 'payment.captured').status_code, 200)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')  # nothing applied inline
+
+        self.assertEqual(process_pending_events()['processed'], 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'success')
+        self.assertEqual(self.payment.gateway_payment_id, 'pay_1')
+
+    def test_late_failure_does_not_undo_capture(self):
+        from .payment_webhooks import process_pending_events
+
+        self.deliver('evt_1', 'payment.captured')
+        self.deliver('evt_2', 'payment.failed')
+        process_pending_events()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'success')
+        self.assertFalse(PaymentWebhookEvent.objects.filter(status='received').exists())
+
+
+@override_settings(RAZORPAY_KEY_ID='rzp_test', RAZORPAY_KEY_SECRET='secret')
+class ReconcilePaymentsTests(TestCase):
+    def test_settles_payments_from_gateway_view(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        from .fake_gateway import FakeGatewayServer
+
+        hospital = Hospital.objects.create(name='Test Hospital')
+        patient = User.objects.create_user('pat', password='pw-12345678')
+        with FakeGatewayServer() as server:
+            payments = []
+            for n in range(3):
+                appointment = Appointment.objects.create(patient=patient, hospital=hospital, payment_amount=500)
+                order_id = server.handle('POST', '/v1/orders', {'amount': 50000})[1]['id']
+                payments.append(Payment.objects.create(
+                    appointment=appointment, patient=patient, amount=500, payment_gateway='razorpay',
+                    transaction_id=f'TXN{n}', gateway_order_id=order_id,
+                ))
+            Payment.objects.update(created_at=timezone.now() - timezone.timedelta(hours=1))
+            captured = server.capture(payments[0].gateway_order_id)
+            server.capture(payments[1].gateway_order_id, status='failed')
+
+            call_command(
+                'reconcile_payments', base_url=server.url, concurrency=4, page_size=2, stdout=StringIO(),
+            )
+
+        statuses = [p.status for p in Payment.objects.order_by('transaction_id')]
+        self.assertEqual(statuses, ['success', 'failed', 'pending'])
+        self.assertEqual(Payment.objects.get(transaction_id='TXN0').gateway_payment_id, captured['id'])
+        self.assertEqual(Appointment.objects.filter(payment_status='paid').count(), 1)
+
+    def test_unexpected_error_is_counted_and_the_run_goes_on(self):
+        from io import StringIO
+        from unittest import mock
+
+        from django.core.management import call_command
+
+        from .payment_gateway import RazorpayGateway
+
+        hospital = Hospital.objects.create(name='Test Hospital')
+        patient = User.objects.create_user('pat', password='pw-12345678')
+        for n in range(3):
+            appointment = Appointment.objects.create(patient=patient, hospital=hospital, payment_amount=500)
+            Payment.objects.create(appointment=appointment, patient=patient, amount=500, payment_gateway='razorpay',
+                                   transaction_id=f'TXN{n}', gateway_order_id=f'order_{n}')
+        Payment.objects.update(created_at=timezone.now() - timezone.timedelta(hours=1))
+
+        def fetch_status(gateway, payment):
+            if payment.transaction_id == 'TXN1':
+                raise KeyError('items')
+            return {'status': 'failed', 'reason': 'declined'}
+
+        out = StringIO()
+        with mock.patch.object(RazorpayGateway, 'fetch_status', fetch_status):
+            call_command('reconcile_payments', concurrency=2, page_size=2, stdout=out)
+
+        statuses = [p.status for p in Payment.objects.order_by('transaction_id')]
+        self.assertEqual(statuses, ['failed', 'pending', 'failed'])
+        self.assertIn('2 failed, 0 still pending, 1 errors', out.getvalue())
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.hospital = Hospital.objects.create(name='Test Hospital')
+        self.patient = User.objects.create_user('pat', password='pw-12345678')
+        self.api = APIClient()
+        self.api.force_authenticate(self.patient)
+
+    def book(self, key, **data):
+        payload = {'hospital_id': self.hospital.id, 'symptoms': 'cough', **data}
+        return self.api.post(
+            '/api/patient/book-appointment/', payload, format='json', secure=True, HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_stored_response(self):
+        first = self.book('key-1')
+        second = self.book('key-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_key_reuse_with_different_body_is_rejected(self):
+        self.book('key-1')
+        self.assertEqual(self.book('key-1', symptoms='fever').status_code, 422)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_duplicate_of_in_flight_request_does_not_execute(self):
+        # Simulate a concurrent first request that has claimed the key but not finished
+        self.book('key-2')
+        IdempotencyRecord.objects.filter(key='key-2').update(state='in_progress')
+        Appointment.objects.all().delete()
+        self.assertTrue(IdempotencyRecord.objects.filter(key='key-2').exists())
+        response = self.book('key-2')
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(response.has_header('Retry-After'))
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_request_abandoned_past_its_lease_can_be_retried(self):
+        # The owner's worker died mid-request: the record stays in progress
+        self.book('key-3')
+        Appointment.objects.all().delete()
+        IdempotencyRecord.objects.filter(key='key-3').update(
+            state='in_progress', started_at=timezone.now() - timezone.timedelta(seconds=61),
+        )
+        self.assertEqual(self.book('key-3').status_code, 201)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(IdempotencyRecord.objects.get(key='key-3').state, 'completed')
+
+    def test_owner_whose_lease_ran_out_leaves_the_new_claim_alone(self):
+        from rest_framework.response import Response
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from rest_framework.views import APIView
+
+        from .idempotency import idempotent
+
+        taken_over_at = timezone.now() + timezone.timedelta(seconds=61)
+
+        class SlowView(APIView):
+            fail = False
+
+            @idempotent
+            def post(self, request):
+                # Another request takes the record over while this one runs
+                IdempotencyRecord.objects.filter(key=request.headers['Idempotency-Key']).update(
+                    started_at=taken_over_at,
+                )
+                if self.fail:
+                    raise RuntimeError('boom')
+                return Response({'done': True}, status=201)
+
+        def post(key, fail=False):
+            request = APIRequestFactory().post('/slow/', {}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+            force_authenticate(request, self.patient)
+            return SlowView.as_view(fail=fail)(request)
+
+        self.assertEqual(post('key-4').status_code, 201)
+        record = IdempotencyRecord.objects.get(key='key-4')
+        self.assertEqual((record.state, record.response_body, record.started_at),
+                         ('in_progress', None, taken_over_at))
+
+        with self.assertRaises(RuntimeError):
+            post('key-5', fail=True)
+        self.assertTrue(IdempotencyRecord.objects.filter(key='key-5', started_at=taken_over_at).exists())
+
+
+class ConfirmPaymentTests(TestCase):
+    def setUp(self):
+        from .benchmarks import seed_hospital, seed_unpaid_appointments
+
+        hospital, department = seed_hospital()
+        self.patient = User.objects.create_user('pat', password='pw-12345678')
+        self.payment_id = seed_unpaid_appointments(hospital, department, self.patient, 1, 'TXN')[0]
+
+    def test_confirms_payment_appointment_and_slot_in_one_pass(self):
+        from .services import confirm_payment
+
+        # Savepoint, locked read, three targeted UPDATEs, release
+        with self.assertNumQueries(6):
+            paid_at = confirm_payment(self.payment_id, 'pay_1', 'upi')
+        payment = Payment.objects.select_related('appointment__appointment_slot').get(pk=self.payment_id)
+        self.assertEqual(payment.status, 'success')
+        self.assertEqual(payment.paid_at, paid_at)
+        self.assertEqual(payment.appointment.status, 'confirmed')
+        self.assertEqual(payment.appointment.payment_status, 'paid')
+        self.assertTrue(payment.appointment.appointment_slot.is_booked)
+        self.assertEqual(payment.appointment.appointment_slot.patient_name, 'pat')
+
+        self.assertIsNone(confirm_payment(self.payment_id, 'pay_2', 'upi'))
+        self.assertEqual(Payment.objects.get(pk=self.payment_id).gateway_payment_id, 'pay_1')
+
+    def test_slots_are_mirrored_once_per_commit_and_not_after_a_rollback(self):
+        from unittest import mock
+
+        from django.db import transaction
+
+        from .benchmarks import seed_unpaid_appointments
+        from .services import confirm_payment
+
+        hospital, department = Hospital.objects.get(), Department.objects.first()
+        rolled_back, *committed = seed_unpaid_appointments(hospital, department, self.patient, 2, 'TXNB')
+        committed.append(self.payment_id)
+        slot_of = dict(Payment.objects.values_list('pk', 'appointment__appointment_slot_id'))
+
+        with mock.patch('queueing.mongo_sync.sync_many') as sync_many:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    confirm_payment(rolled_back, 'pay_0')
+                    raise RuntimeError('rolled back')
+                for n, payment_id in enumerate(committed):
+                    confirm_payment(payment_id, f'pay_{n + 1}')
+        (collection, slots), = [c.args for c in sync_many.call_args_list]
+        self.assertEqual(collection, 'appointment_slots')
+        self.assertEqual({slot.pk for slot in slots}, {slot_of[p] for p in committed})
+
+    def test_mark_success_refreshes_instance(self):
+        payment = Payment.objects.get(pk=self.payment_id)
+        self.assertEqual(payment.appointment.status, 'pending_payment')
+        payment.mark_success('pay_1', 'upi')
+        self.assertEqual(payment.status, 'success')
+        self.assertEqual(payment.appointment.status, 'confirmed')
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIRequestFactory
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from .authentication import user_cache
+
+        user_cache.clear()
+        self.user = User.objects.create_user('pat', password='pw-12345678')
+        self.token = str(AccessToken.for_user(self.user))
+        self.factory = APIRequestFactory()
+
+    def authenticate(self):
+        from .authentication import CustomJWTAuthentication
+
+        request = self.factory.get('/api/auth/profile/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return CustomJWTAuthentication().authenticate(request)[0]
+
+    def test_repeat_requests_skip_the_user_query(self):
+        from .authentication import user_cache
+
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user_cache.stats()['hits'], 1)
+
+    def test_ttl_is_capped_without_a_shared_cache(self):
+        from .authentication import user_cache_ttl
+
+        with override_settings(AUTH_USER_CACHE={'TTL': 60}):
+            self.assertEqual(user_cache_ttl(), 1)
+            redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                 'LOCATION': 'redis://localhost:6379/0'}}
+            with override_settings(CACHES=redis):
+                self.assertEqual(user_cache_ttl(), 60)
+
+    def test_deactivation_and_role_change_invalidate(self):
+        from rest_framework_simplejwt.exceptions import InvalidToken
+
+        self.authenticate()
+        self.user.role = 'admin'
+        self.user.save(update_fields=['role'])
+        self.assertEqual(self.authenticate().role, 'admin')
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(InvalidToken):
+            self.authenticate()
+
+    def test_last_login_update_keeps_cache_warm(self):
+        self.authenticate()
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+
+class PasswordHashingTests(TestCase):
+    def test_executor_sheds_load_when_full(self):
+        import threading
+
+        from .hashing import HashingBusy, HashingExecutor
+
+        release = threading.Event()
+        executor = HashingExecutor(max_workers=1, max_pending=1, timeout=1)
+        executor.submit(release.wait)
+        executor.submit(release.wait)
+        with self.assertRaises(HashingBusy):
+            executor.submit(release.wait)
+        release.set()
+
+    def test_login_and_register_round_trip(self):
+        register = self.client.post('/api/patient/register/', {
+            'username': 'walkin', 'email': 'walkin@example.com',
+            'password': 'Str0ng-pass-123', 'password2': 'Str0ng-pass-123',
+        }, content_type='application/json', secure=True)
+        self.assertEqual(register.status_code, 201)
+
+        login = self.client.post('/api/patient/login/', {
+            'username': 'walkin', 'password': 'Str0ng-pass-123',
+        }, content_type='application/json', secure=True)
+        self.assertEqual(login.status_code, 200)
+
+        bad = self.client.post('/api/patient/login/', {
+            'username': 'walkin', 'password': 'wrong-password',
+        }, content_type='application/json', secure=True)
+        self.assertEqual(bad.status_code, 401)
+
+
+class SlidingWindowThrottleTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import AnonymousUser
+        from django.core.cache import caches
+        from django.test import RequestFactory
+
+        caches['throttle'].clear()
+        self.anonymous = AnonymousUser()
+        self.factory = RequestFactory()
+        self.view = object()
+
+    def make_request(self, user=None, ip='10.0.0.1'):
+        request = self.factory.get('/api/hospitals/', REMOTE_ADDR=ip)
+        request.user = user or self.anonymous
+        return request
+
+    def make_throttle(self, now):
+        from .throttling import SlidingWindowRateThrottle
+
+        throttle = SlidingWindowRateThrottle()
+        throttle.timer = lambda: now
+        return throttle
+
+    def test_limit_is_shared_and_slides(self):
+        # 30/minute for anonymous clients; a fresh instance per request, as in separate workers
+        start = 6000.0
+        allowed = [self.make_throttle(start).allow_request(self.make_request(), self.view) for _ in range(31)]
+        self.assertEqual(allowed.count(True), 30)
+
+        throttle = self.make_throttle(start)
+        self.assertFalse(throttle.allow_request(self.make_request(), self.view))
+        self.assertGreater(throttle.wait(), 0)
+        # Other clients are unaffected
+        self.assertTrue(self.make_throttle(start).allow_request(self.make_request(ip='10.0.0.2'), self.view))
+
+        # Halfway into the next window, half of the previous count has slid out
+        halfway = start + 90
+        throttle = self.make_throttle(halfway)
+        self.assertTrue(throttle.allow_request(self.make_request(), self.view))
+
+    def test_rejected_requests_are_not_counted(self):
+        start = 6000.0
+        for _ in range(30):
+            self.make_throttle(start).allow_request(self.make_request(), self.view)
+        # A client hammering through the limit for the rest of the window...
+        for _ in range(100):
+            self.assertFalse(self.make_throttle(start + 30).allow_request(self.make_request(), self.view))
+        # ...is back in once its allowed requests slide out, as if it had waited
+        self.assertTrue(self.make_throttle(start + 90).allow_request(self.make_request(), self.view))
+
+    def test_system_check_warns_about_per_process_cache(self):
+        from .throttling import check_throttle_cache
+
+        self.assertEqual(check_throttle_cache(None), [])
+        with override_settings(THROTTLE={'CACHE': 'default'}):
+            self.assertEqual([w.id for w in check_throttle_cache(None)], ['queueing.W001'])
+
+    def test_role_and_kiosk_tiers(self):
+        admin = User.objects.create_user('throttle-admin', password='x-pass-123', role='admin')
+        patient = User.objects.create_user('throttle-patient', password='x-pass-123')
+
+        def allowed(request, count):
+            return sum(self.make_throttle(6000.0).allow_request(request, self.view) for _ in range(count))
+
+        self.assertEqual(allowed(self.make_request(patient), 130), 120)
+        self.assertEqual(allowed(self.make_request(admin), 130), 130)
+        with override_settings(THROTTLE={'CACHE': 'throttle', 'KIOSK_IPS': ['10.9.9.9']}):
+            self.assertEqual(allowed(self.make_request(ip='10.9.9.9'), 100), 100)
+
+
+class TokenBlacklistFilterTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        from .token_blacklist import BlacklistFilter, RefreshToken
+
+        cache.clear()
+        self.user = User.objects.create_user('token-user', password='x-pass-123')
+        self.filter = BlacklistFilter(capacity=1000, sync_interval=3600, rebuild_interval=3600)
+        self.token_class = RefreshToken
+
+    def jti(self, token):
+        return token.payload['jti']
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        from .token_blacklist import BloomFilter
+
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_unlisted_tokens_skip_the_database(self):
+        from unittest import mock
+
+        from . import caches
+
+        old = self.token_class.for_user(self.user)
+        old.blacklist()
+        self.filter.rebuild()
+
+        fresh = self.token_class.for_user(self.user)
+        with mock.patch.object(caches, 'is_shared', return_value=True):
+            with self.assertNumQueries(0):
+                self.assertFalse(self.filter.is_blacklisted(self.jti(fresh)))
+            self.assertTrue(self.filter.is_blacklisted(self.jti(old)))
+
+            # Blacklisted after the build: seen through the shared cache until the next sync
+            fresh.blacklist()
+            with self.assertNumQueries(0):
+                self.assertTrue(self.filter.is_blacklisted(self.jti(fresh)))
+            self.filter.sync()
+            self.assertTrue(self.filter.is_blacklisted(self.jti(fresh)))
+
+    def test_per_process_cache_falls_back_to_the_database(self):
+        from django.core.cache import cache
+
+        from .token_blacklist import BlacklistFilter
+
+        # Two workers, each with its own filter and (LocMemCache) cache
+        worker_a = self.filter
+        worker_b = BlacklistFilter(capacity=1000, sync_interval=3600, rebuild_interval=3600)
+        worker_a.rebuild()
+        worker_b.rebuild()
+
+        token = self.token_class.for_user(self.user)
+        token.blacklist()  # rotated or logged out through worker A
+        self.assertTrue(worker_a.is_blacklisted(self.jti(token)))
+        cache.clear()  # worker B's cache never saw A's recent key
+        with self.assertNumQueries(1):
+            self.assertTrue(worker_b.is_blacklisted(self.jti(token)))
+
+    def test_rotated_and_logged_out_tokens_are_rejected(self):
+        from .token_blacklist import blacklist_filter
+
+        blacklist_filter.rebuild()
+        refresh = str(self.token_class.for_user(self.user))
+        rotated = self.client.post('/api/auth/refresh/', {'refresh': refresh},
+                                   content_type='application/json', secure=True)
+        self.assertEqual(rotated.status_code, 200)
+        reused = self.client.post('/api/auth/refresh/', {'refresh': refresh},
+                                  content_type='application/json', secure=True)
+        self.assertEqual(reused.status_code, 401)
+
+    def test_prune_tokens_deletes_expired_rows(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+        expired = self.token_class.for_user(self.user)
+        expired.blacklist()
+        live = self.token_class.for_user(self.user)
+        live.blacklist()
+        OutstandingToken.objects.filter(jti=self.jti(expired)).update(
+            expires_at=timezone.now() - timezone.timedelta(days=1),
+        )
+
+        call_command('prune_tokens', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [self.jti(live)])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], RESPONSE_CACHE={'ENABLED': False})
+class ReplicaRoutingTests(TransactionTestCase):
+    """'replica' is a separate, un-replicated test database: a replica that lags forever."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        cache.clear()
+        self.user = User.objects.create_user('replica-admin', password='x-pass-123', role='admin')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        Hospital.objects.create(name='Primary Only')
+
+    def hospital_names(self, **extra):
+        response = self.client.get('/api/hospitals/', secure=True, **extra)
+        self.assertEqual(response.status_code, 200)
+        return [h['name'] for h in response.json()]
+
+    def test_safe_reads_use_replica_until_own_write(self):
+        self.assertEqual(self.hospital_names(), [])
+        self.assertEqual(self.hospital_names(**self.auth), [])
+
+        created = self.client.post('/api/hospitals/', {'name': 'New Wing'},
+                                   content_type='application/json', secure=True, **self.auth)
+        self.assertEqual(created.status_code, 201)
+        # The writer reads from the primary; everyone else still reads the replica
+        self.assertEqual(self.hospital_names(**self.auth), ['New Wing', 'Primary Only'])
+        self.assertEqual(self.hospital_names(), [])
+
+    @override_settings(RESPONSE_CACHE={'ENABLED': True})
+    def test_response_cache_is_filled_from_primary(self):
+        self.assertEqual(self.hospital_names(), ['Primary Only'])
+        self.assertEqual(self.hospital_names(), ['Primary Only'])
+
+    def test_writes_and_background_reads_use_primary(self):
+        from .db_router import PrimaryReplicaRouter
+
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Hospital), 'default')
+        self.assertEqual(router.db_for_write(Hospital), 'default')
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the SQL the hot code paths actually run (captured while they run)
+    and fail if a query regresses to a full table scan, or to a temporary
+    sort where an index should provide the order.
+    """
+
+    def hot_paths(self):
+        from rest_framework.test import APIClient
+
+        from . import eta
+        from .benchmarks import seed_dataset
+        from .services import dashboard_metrics, live_status_snapshot
+
+        data = seed_dataset(1)
+        hospital_id, department_id = data['hospital'].pk, data['department'].pk
+        api = APIClient()
+        api.force_authenticate(data['patient'])
+
+        def get(path):
+            self.assertEqual(api.get(path, secure=True).status_code, 200, path)
+
+        # name: (call, whether every ORDER BY must come from an index)
+        return {
+            # services.py / eta.py
+            'live_status_snapshot': (lambda: [live_status_snapshot(hospital_id),
+                                              live_status_snapshot(hospital_id, department_id)], True),
+            'update_expected_finish_times': (
+                lambda: PredictionService().update_expected_finish_times(hospital_id, department_id), True),
+            'queue_position': (lambda: eta.position(data['queue_entry']), True),
+            'dashboard_metrics': (lambda: dashboard_metrics(hospital_id), False),
+            # views.py / patient_views.py / payment_views.py
+            'queue_list': (lambda: get(f'/api/queue/?hospital={hospital_id}'), False),
+            'patient_queue_status': (lambda: get(f'/api/patient/queue-status/{hospital_id}/'), False),
+            'available_slots': (
+                lambda: get(f'/api/patient/available-slots/?hospital_id={hospital_id}&department_id={department_id}'),
+                True),
+            'my_appointments': (lambda: get('/api/patient/my-appointments/'), True),
+            'payment_history': (lambda: get('/api/patient/payment/history/'), True),
+        }
+
+    def explain(self, sql):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def test_hot_queries_use_indexes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        for name, (call, indexed_order) in self.hot_paths().items():
+            with self.subTest(path=name):
+                with CaptureQueriesContext(connection) as captured:
+                    call()
+                selects = [q['sql'] for q in captured.captured_queries if q['sql'].startswith('SELECT')]
+                self.assertTrue(selects, f'{name} ran no SELECT')
+                for sql in selects:
+                    plan = self.explain(sql)
+                    for line in plan.splitlines():
+                        full_scan = line.startswith('SCAN') and 'INDEX' not in line
+                        self.assertFalse(full_scan, f'{name} scans a table:\n{sql}\n{plan}')
+                    if indexed_order:
+                        self.assertNotIn('TEMP B-TREE', plan, f'{name} sorts without an index:\n{sql}\n{plan}')
+
+
+class EndpointBudgetTests(TestCase):
+    """
+    Call every named route on a small and a larger seeded dataset and hold it
+    to its query budget (see benchmarks.ENDPOINTS). A query count that grows
+    with the data is an N+1. Latency budgets are wall-clock and machine
+    dependent, so they are only checked by ``manage.py benchmark endpoints``.
+    """
+    sizes = [1, 3]
+
+    def test_every_route_has_a_budget(self):
+        from django.urls import get_resolver
+
+        from .benchmarks import ENDPOINTS
+
+        routes = {name for name in get_resolver().reverse_dict if isinstance(name, str)}
+        self.assertEqual(routes - {e.route for e in ENDPOINTS}, set(), 'Add these routes to benchmarks.ENDPOINTS')
+
+    def test_endpoints_stay_within_budget(self):
+        from .benchmarks import ENDPOINTS, measure_endpoints
+
+        curves = measure_endpoints(self.sizes)
+        for endpoint in ENDPOINTS:
+            curve = curves[endpoint.route]
+            report = f'{endpoint.route} (size, status, queries, ms): {curve}'
+            with self.subTest(route=endpoint.route):
+                for _, status_code, queries, _ in curve:
+                    self.assertLess(status_code, 500, report)
+                    self.assertLessEqual(queries, endpoint.max_queries, report)
+                if not endpoint.scales:
+                    self.assertEqual(len({queries for _, _, queries, _ in curve}), 1, f'N+1? {report}')
+
+
+class LoadGeneratorTests(TestCase):
+    def test_seed_creates_requested_scale(self):
+        from .loadgen import seed
+
+        counts = seed(hospitals=2, departments=2, beds=3, patients=10, days=3, visits=10, slots=4)
+        self.assertEqual(counts['beds'], 2 * 2 * 3)
+        self.assertEqual(counts['queue_entries'], 2 * 2 * (3 + 1) * 10)  # history + today
+        self.assertEqual(counts['slots'], 2 * 2 * (3 + 3) * 4)  # history + today + 2 days ahead
+        self.assertEqual(counts['appointments'], counts['payments'])
+        self.assertEqual(Payment.objects.filter(status='success').count(), counts['payments'])
+        # Today's queue is live; history is in the past
+        self.assertTrue(QueueEntry.objects.filter(status=QueueEntry.Status.WAITING).exists())
+        oldest = QueueEntry.objects.order_by('arrival_time').first()
+        self.assertLess(oldest.arrival_time, timezone.now() - timezone.timedelta(days=2))
+
+    def test_workload_runs_every_operation_without_errors(self):
+        from .loadgen import DEFAULT_MIX, Workload, seed
+
+        seed(hospitals=1, departments=2, beds=2, patients=5, days=1, visits=10, slots=8)
+        workload = Workload(mix=dict.fromkeys(DEFAULT_MIX, 1)).load()
+        workload.run(120)
+        rows = {row['variant']: row for row in workload.report()}
+        self.assertEqual(set(rows), set(DEFAULT_MIX))
+        self.assertEqual({name: row['errors'] for name, row in rows.items()}, dict.fromkeys(DEFAULT_MIX, 0))
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        Hospital.objects.create(name='City Hospital')
+
+    @override_settings(PROFILING={})
+    def test_server_timing_is_off_by_default_outside_debug(self):
+        response = self.client.get('/api/hospitals/', secure=True)
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(PROFILING={'SERVER_TIMING': True})
+    def test_server_timing_reports_queries_and_render(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/hospitals/', secure=True)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        for metric in ('render;dur=', 'app;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    def test_log_record_carries_structured_timings(self):
+        with self.assertLogs('careflow.security', 'INFO') as logs:
+            self.client.get('/api/hospitals/', secure=True)
+        record = logs.records[-1]
+        self.assertEqual((record.method, record.path, record.status), ('GET', '/api/hospitals/', 200))
+        self.assertGreaterEqual(record.db_queries, 1)
+        self.assertGreater(record.duration_ms, 0)
+        self.assertIsNone(record.profile)
+
+    def test_sampled_request_writes_cprofile(self):
+        import pstats
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFILING={'SAMPLE_RATE': 1.0, 'DIR': directory}), \
+                    self.assertLogs('careflow.security', 'INFO') as logs:
+                self.client.get('/api/hospitals/', secure=True)
+            path = logs.records[-1].profile
+            self.assertTrue(path.startswith(directory) and path.endswith('.prof'))
+            functions = {name for _, _, name in pstats.Stats(path).stats}
+            self.assertIn('dispatch', functions)  # the DRF view ran under the profiler
+
+    def test_slow_request_sampler_folds_the_request_stack(self):
+        from .profiling import RequestTimings, SlowRequestSampler
+
+        sampler = SlowRequestSampler(interval=60)  # sampled by hand below
+        timings = RequestTimings()
+        sampler.watch(timings, threshold_seconds=0)
+        try:
+            sampler.sample()
+            sampler.sample()
+        finally:
+            sampler.unwatch()
+        (stack, count), = timings.stacks.items()
+        self.assertEqual(count, 2)
+        self.assertTrue(stack.endswith('profiling.py:sample'))
+        self.assertIn('tests.py:test_slow_request_sampler_folds_the_request_stack', stack)
+        self.assertEqual(sampler.active, {})
+
+
+@override_settings(METRICS={'TOKEN': 'scrape-token'})
+class MetricsTests(TestCase):
+    def scrape(self, token='scrape-token'):
+        return self.client.get('/metrics', secure=True, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_scrape_requires_the_token(self):
+        self.assertEqual(self.scrape('wrong').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', secure=True).status_code, 404)
+
+    def test_hospital_gauges_are_read_at_scrape_time(self):
+        from .models import Bed
+
+        hospital = Hospital.objects.create(name='City Hospital')
+        QueueEntry.objects.create(hospital=hospital, patient_name='A')
+        QueueEntry.objects.create(hospital=hospital, patient_name='B')
+        Bed.objects.create(hospital=hospital, label='B1', status=Bed.Status.OCCUPIED)
+
+        body = self.scrape().content.decode()
+        self.assertIn(f'careflow_queue_entries{{hospital="{hospital.pk}",status="waiting"}} 2.0', body)
+        self.assertIn(f'careflow_beds{{hospital="{hospital.pk}",status="occupied"}} 1.0', body)
+
+    def test_user_cache_stats_are_read_at_scrape_time(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from .authentication import user_cache
+
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        user = User.objects.create_user(username='cached', password='x')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+        for _ in range(2):
+            self.client.get('/api/hospitals/', secure=True, **headers)
+
+        body = self.scrape().content.decode()
+        self.assertIn('careflow_user_cache_lookups_total{result="hit"} 1.0', body)
+        self.assertIn('careflow_user_cache_lookups_total{result="miss"} 1.0', body)
+        self.assertIn('careflow_user_cache_evictions_total 0.0', body)
+        self.assertIn('careflow_user_cache_entries 1.0', body)
+        self.assertIn('careflow_user_cache_hit_ratio 0.5', body)
+
+    def test_requests_are_timed_per_view(self):
+        labels = {'view': 'hospital-list', 'method': 'GET', 'status': '200'}
+        before = self.sample('careflow_request_duration_seconds_count', **labels)
+        queries_before = self.sample('careflow_db_queries_total', view='hospital-list')
+        self.client.get('/api/hospitals/', secure=True)
+        self.assertEqual(self.sample('careflow_request_duration_seconds_count', **labels), before + 1)
+        self.assertGreater(self.sample('careflow_db_queries_total', view='hospital-list'), queries_before)
+
+    def test_payment_transitions_count_after_commit(self):
+        from .services import confirm_payment
+
+        patient = User.objects.create_user(username='payer', password='x')
+        hospital = Hospital.objects.create(name='City Hospital')
+        appointment = Appointment.objects.create(patient=patient, hospital=hospital, payment_amount=500)
+        payment = Payment.objects.create(
+            appointment=appointment, patient=patient, amount=500, transaction_id='TXNMETRICS1',
+        )
+        labels = {'from_status': 'pending', 'to_status': 'success'}
+        before = self.sample('careflow_payment_transitions_total', **labels)
+        with self.captureOnCommitCallbacks(execute=True):
+            confirm_payment(payment.pk, 'pay_1')
+            self.assertEqual(self.sample('careflow_payment_transitions_total', **labels), before)
+        self.assertEqual(self.sample('careflow_payment_transitions_total', **labels), before + 1)
+
+
+class LogPipelineTests(TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.path = f'{self.directory}/app.jsonl'
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_logger(self, handler):
+        import logging
+
+        logger = logging.getLogger(f'careflow.test.{id(handler)}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return logger
+
+    def read_lines(self, path=None):
+        with open(path or self.path) as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_records_are_written_as_json_lines_with_extra_fields(self):
+        from .log_pipeline import BoundedQueueHandler
+
+        handler = BoundedQueueHandler(path=self.path)
+        logger = self.make_logger(handler)
+        logger.info('GET %s → %s', '/api/hospitals/', 200, extra={'status': 200, 'duration_ms': 3.2})
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.exception('failed')
+        handler.flush()
+
+        first, second = self.read_lines()
+        self.assertEqual(first['msg'], 'GET /api/hospitals/ → 200')
+        self.assertEqual((first['status'], first['duration_ms'], first['level']), (200, 3.2, 'INFO'))
+        self.assertIn('ValueError: boom', second['exc'])
+        self.assertEqual(handler.stats()['written'], 2)
+
+    def block_writer(self, handler, logger):
+        """Park the writer thread inside a write; returns the event that releases it."""
+        import threading
+        from unittest import mock
+
+        from .log_pipeline import JsonLinesWriter
+
+        release, entered = threading.Event(), threading.Event()
+        original = JsonLinesWriter.write
+
+        def slow_write(writer, entries):
+            entered.set()
+            release.wait(5)
+            original(writer, entries)
+
+        patcher = mock.patch.object(JsonLinesWriter, 'write', slow_write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        logger.info('record 0')
+        self.assertTrue(entered.wait(5))
+        return release
+
+    def test_full_queue_drops_newest_without_blocking(self):
+        from .log_pipeline import BoundedQueueHandler
+
+        handler = BoundedQueueHandler(path=self.path, queue_size=2, batch_size=1)
+        logger = self.make_logger(handler)
+        release = self.block_writer(handler, logger)
+        for i in range(1, 6):
+            logger.info('record %d', i)
+        self.assertEqual(handler.stats()['dropped'], 3)
+        release.set()
+        handler.flush()
+        self.assertEqual([line['msg'] for line in self.read_lines()], ['record 0', 'record 1', 'record 2'])
+
+    def test_full_queue_can_drop_oldest(self):
+        from .log_pipeline import BoundedQueueHandler
+
+        handler = BoundedQueueHandler(path=self.path, queue_size=2, batch_size=1, drop='oldest')
+        logger = self.make_logger(handler)
+        release = self.block_writer(handler, logger)
+        for i in range(1, 6):
+            logger.info('record %d', i)
+        release.set()
+        handler.flush()
+        self.assertEqual([line['msg'] for line in self.read_lines()], ['record 0', 'record 4', 'record 5'])
+        self.assertEqual(handler.stats()['dropped'], 3)
+
+    def test_file_rotates_by_size(self):
+        import os
+
+        from .log_pipeline import BoundedQueueHandler
+
+        handler = BoundedQueueHandler(path=self.path, max_bytes=500, backup_count=2, batch_size=5)
+        logger = self.make_logger(handler)
+        for i in range(50):
+            logger.info('record %d', i)
+            handler.flush()
+        self.assertTrue(os.path.exists(f'{self.path}.1'))
+        self.assertTrue(os.path.exists(f'{self.path}.2'))
+        self.assertFalse(os.path.exists(f'{self.path}.3'))
+        self.assertLessEqual(os.path.getsize(f'{self.path}.1'), 500 + 5 * 200)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.hospital = Hospital.objects.create(name='City Hospital')
+        Department.objects.create(hospital=self.hospital, name='Cardiology')
+
+    def get(self, url, **headers):
+        return self.client.get(url, secure=True, **headers)
+
+    def test_hit_serves_cached_bytes_without_queries(self):
+        first = self.get('/api/hospitals/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('public', first['Cache-Control'])
+        with self.assertNumQueries(0):
+            second = self.get('/api/hospitals/')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.json()[0]['name'], 'City Hospital')
+
+    def test_matching_etag_gets_304(self):
+        etag = self.get('/api/patient/hospitals/')['ETag']
+        response = self.get('/api/patient/hospitals/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_save_and_delete_invalidate(self):
+        url = f'/api/patient/departments/?hospital_id={self.hospital.pk}'
+        etag = self.get(url)['ETag']
+
+        self.hospital.name = 'City General'
+        self.hospital.save()
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['hospital_name'], 'City General')
+
+        Department.objects.filter(hospital=self.hospital).delete()
+        self.assertEqual(self.get(url).json(), [])
+
+    def test_query_params_in_key(self):
+        other = Hospital.objects.create(name='Other Hospital')
+        Department.objects.create(hospital=other, name='Oncology')
+        self.assertEqual(len(self.get('/api/departments/').json()), 2)
+        filtered = self.get(f'/api/departments/?hospital={other.pk}').json()
+        self.assertEqual([d['name'] for d in filtered], ['Oncology'])
+
+
+class FastListTests(TestCase):
+    """The projection + orjson path must produce the serializer's exact bytes."""
+
+    def setUp(self):
+        from .models import AppointmentSlot, Bed
+
+        self.hospital = Hospital.objects.create(name='City Hospital')
+        department = Department.objects.create(hospital=self.hospital, name='Cardiology')
+        now = timezone.now().replace(microsecond=123456)
+        QueueEntry.objects.create(hospital=self.hospital, department=department, patient_name='Zoë "Z" \u2028',
+                                  symptoms='chest pain\n', started_at=now, expected_finish=now)
+        QueueEntry.objects.create(hospital=self.hospital, patient_name='Walk-in', status=QueueEntry.Status.DONE,
+                                  finished_at=now.replace(microsecond=0))
+        Bed.objects.create(hospital=self.hospital, department=department, label='B1', status=Bed.Status.OCCUPIED)
+        Bed.objects.create(hospital=self.hospital, label='B2')
+        for i, dept in enumerate([department, None]):
+            AppointmentSlot.objects.create(hospital=self.hospital, department=dept,
+                                           start_time=now + timezone.timedelta(hours=i + 1),
+                                           end_time=now + timezone.timedelta(hours=i + 2))
+
+    def assert_same_bytes(self, serializer_class, queryset):
+        from rest_framework.renderers import JSONRenderer
+
+        from .projections import Projection
+        from .renderers import ORJSONRenderer
+
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        actual = ORJSONRenderer().render(Projection.for_serializer(serializer_class).rows(queryset))
+        self.assertEqual(actual, expected)
+        return expected
+
+    def test_queue_bed_and_slot_lists_match_serializers(self):
+        from .models import AppointmentSlot, Bed
+        from .serializers import AppointmentSlotSerializer, BedSerializer, QueueEntrySerializer
+
+        body = self.assert_same_bytes(QueueEntrySerializer, QueueEntry.objects.select_related('hospital', 'department'))
+        self.assertIn(b'\\u2028', body)
+        self.assert_same_bytes(BedSerializer, Bed.objects.select_related('hospital', 'department'))
+        self.assert_same_bytes(AppointmentSlotSerializer, AppointmentSlot.objects.select_related('hospital', 'department'))
+
+    def test_list_endpoints_use_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/queue/?hospital={self.hospital.pk}', secure=True)
+        rows = response.json()
+        self.assertEqual([r['patient_name'] for r in rows], ['Zoë "Z" \u2028', 'Walk-in'])
+        self.assertEqual(rows[0]['department_name'], 'Cardiology')
+        self.assertNotIn('department_name', rows[1])
+
+    def test_unsupported_fields_fail_when_the_projection_is_built(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        from .projections import Projection
+        from .serializers import AppointmentSerializer
+
+        with self.assertRaises(ImproperlyConfigured):
+            Projection.for_serializer(AppointmentSerializer)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from .benchmarks import seed_dataset
+
+        cache.clear()
+        self.data = seed_dataset(2)
+        self.admin = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(self.data['admin'])}"}
+
+    def get(self, url, **extra):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, secure=True, **self.admin, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in queries.captured_queries]
+
+    def test_fields_skip_the_queries_behind_unrequested_fields(self):
+        full, full_sql = self.get('/api/admin/appointments/')
+        sparse, sparse_sql = self.get('/api/admin/appointments/?fields=id,status')
+
+        self.assertEqual(set(sparse.json()[0]), {'id', 'status'})
+        self.assertEqual([a['id'] for a in sparse.json()], [a['id'] for a in full.json()])
+        self.assertLess(len(sparse.content), len(full.content) / 5)
+        self.assertLess(len(sparse_sql), len(full_sql))
+        self.assertNotIn('JOIN', sparse_sql[-1])
+        self.assertTrue(any('queueing_payment' in sql for sql in full_sql))
+        self.assertFalse(any('queueing_payment' in sql for sql in sparse_sql))
+
+    def test_expand_nests_related_objects_in_the_same_query(self):
+        url = f"/api/queue/?hospital={self.data['hospital'].pk}&expand=hospital,department&fields=id,hospital,department"
+        response, sql = self.get(url)
+        row = response.json()[0]
+        self.assertEqual(set(row), {'id', 'hospital', 'department'})
+        self.assertEqual(row['hospital']['name'], self.data['hospital'].name)
+        self.assertEqual(row['department']['hospital_name'], self.data['hospital'].name)
+        self.assertEqual(len(sql), 1)
+
+    def test_projection_lists_honour_fields(self):
+        response, sql = self.get(f"/api/queue/?hospital={self.data['hospital'].pk}&fields=id,status,bogus")
+        self.assertEqual(set(response.json()[0]), {'id', 'status'})
+        self.assertNotIn('JOIN', sql[-1])
+
+    def test_projection_subsets_are_bounded(self):
+        from itertools import combinations
+        from unittest import mock
+
+        from .projections import Projection
+        from .serializers import QueueEntrySerializer
+
+        full = Projection.for_serializer(QueueEntrySerializer)
+        self.assertIs(Projection.for_serializer(QueueEntrySerializer, full.names | {'bogus'}), full)
+        with mock.patch.object(Projection, 'MAX_SUBSETS', 4), \
+                mock.patch.object(Projection, '_subsets', type(Projection._subsets)()):
+            for fields in list(combinations(sorted(full.names), 2))[:10]:
+                self.assertEqual(Projection.for_serializer(QueueEntrySerializer, fields).names, set(fields))
+            self.assertEqual(len(Projection._subsets), 4)
+        self.assertIs(Projection.for_serializer(QueueEntrySerializer), full)
+
+    def test_cached_responses_are_keyed_by_fieldset(self):
+        names, _ = self.get('/api/hospitals/?fields=name')
+        full, _ = self.get('/api/hospitals/')
+        self.assertEqual(set(names.json()[0]), {'name'})
+        self.assertIn('address', full.json()[0])
+
+    def test_writes_ignore_fields(self):
+        appointment = self.data['appointment']
+        response = self.client.patch(f'/api/admin/appointments/{appointment.pk}/status/?fields=id',
+                                     {'status': 'in_progress'}, content_type='application/json',
+                                     secure=True, **self.admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('patient_details', response.json()['appointment'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from .benchmarks import seed_dataset
+
+        self.data = seed_dataset(2)
+        self.admin = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(self.data['admin'])}"}
+
+    def export(self, url):
+        response = self.client.get(url, secure=True, **self.admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson_rows_follow_the_filters(self):
+        hospital = self.data['hospital']
+        _, body = self.export(f'/api/admin/export/appointments/?hospital_id={hospital.pk}&status=confirmed')
+        rows = [json.loads(line) for line in body.splitlines()]
+        expected = Appointment.objects.filter(hospital=hospital, status='confirmed').order_by('pk')
+        self.assertEqual([row['id'] for row in rows], list(expected.values_list('pk', flat=True)))
+        self.assertTrue(rows)
+        self.assertEqual(rows[0]['hospital'], hospital.name)
+
+    def test_date_range_includes_the_end_day(self):
+        entry = self.data['queue_entry']
+        day = timezone.localdate(entry.arrival_time).isoformat()
+        _, body = self.export(f'/api/admin/export/queue/?start={day}&end={day}')
+        self.assertIn(entry.pk, [json.loads(line)['id'] for line in body.splitlines()])
+        _, body = self.export(f'/api/admin/export/queue/?end={day}T00:00:00')
+        self.assertNotIn(entry.pk, [json.loads(line)['id'] for line in body.splitlines()])
+
+    def test_csv_has_a_header_and_one_line_per_row(self):
+        import csv
+        import io
+
+        response, body = self.export('/api/admin/export/payments/?output=csv')
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0][:2], ['id', 'transaction_id'])
+        self.assertEqual(len(rows) - 1, Payment.objects.count())
+
+    def test_gzip_round_trips(self):
+        import gzip
+
+        _, plain = self.export('/api/admin/export/appointments/?output=csv')
+        response, packed = self.export('/api/admin/export/appointments/?output=csv&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(packed), plain)
+
+    def test_csv_escapes_formula_cells(self):
+        import csv
+        import io
+
+        entry = self.data['queue_entry']
+        QueueEntry.objects.filter(pk=entry.pk).update(patient_name='=HYPERLINK("http://x","y")')
+        _, body = self.export(f"/api/admin/export/queue/?output=csv&hospital_id={entry.hospital_id}")
+        rows = {row[0]: row for row in csv.reader(io.StringIO(body.decode()))}
+        self.assertEqual(rows[str(entry.pk)][3], '\'=HYPERLINK("http://x","y")')
+
+    async def test_asgi_export_goes_out_batch_by_batch(self):
+        import functools
+        from unittest import mock
+
+        from asgiref.sync import sync_to_async
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from . import exports
+
+        token = await sync_to_async(AccessToken.for_user)(self.data['admin'])
+        total = await QueueEntry.objects.acount()
+        encoded = []
+        encode = exports._ndjson_batch
+        with mock.patch.object(exports, 'stream', functools.partial(exports.stream, batch_size=1)), \
+                mock.patch.object(exports, '_ndjson_batch', lambda h, rows: encoded.append(rows) or encode(h, rows)):
+            response = await self.async_client.get('/api/admin/export/queue/', secure=True,
+                                                   headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            stream = response.streaming_content
+            first = await anext(stream)
+            self.assertEqual((len(first.splitlines()), len(encoded)), (1, 1))
+            rest = [chunk async for chunk in stream]
+        self.assertGreater(total, 1)
+        self.assertEqual((len(rest) + 1, len(encoded)), (total, total))
+
+    def test_rejects_bad_requests_and_non_admins(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        self.assertEqual(self.client.get('/api/admin/export/users/', secure=True, **self.admin).status_code, 404)
+        for query in ('output=xml', 'start=yesterday', 'hospital_id=abc'):
+            response = self.client.get(f'/api/admin/export/queue/?{query}', secure=True, **self.admin)
+            self.assertEqual(response.status_code, 400, query)
+        patient = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(self.data['patient'])}"}
+        self.assertEqual(self.client.get('/api/admin/export/queue/', secure=True, **patient).status_code, 403)
+
+    def test_command_writes_the_same_export(self):
+        import os
+        import tempfile
+
+        from django.core.management import call_command
+
+        _, body = self.export('/api/admin/export/queue/?status=waiting')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'queue.ndjson')
+            call_command('export_data', 'queue', '--status', 'waiting', '--file', path, '--batch-size', '3',
+                         stderr=open(os.devnull, 'w'))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), body)
+
+
+class QueueArchiveTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='Test Hospital')
+        now = timezone.now()
+        self.old = now - timezone.timedelta(days=3)
+
+        def entry(name, status, finished_at=None):
+            return QueueEntry.objects.create(hospital=self.hospital, patient_name=name, status=status,
+                                             started_at=finished_at and finished_at - timezone.timedelta(minutes=10),
+                                             finished_at=finished_at)
+
+        # Five old completions of 10 minutes, one recent one of 4
+        self.old_done = [entry(f'old{i}', QueueEntry.Status.DONE, self.old + timezone.timedelta(minutes=i))
+                         for i in range(5)]
+        self.recent_done = entry('recent', QueueEntry.Status.DONE, now - timezone.timedelta(hours=1))
+        QueueEntry.objects.filter(pk=self.recent_done.pk).update(started_at=now - timezone.timedelta(minutes=64))
+        self.old_cancelled = entry('cancelled', QueueEntry.Status.CANCELLED)
+        QueueEntry.objects.filter(pk=self.old_cancelled.pk).update(arrival_time=self.old)
+        self.waiting = entry('waiting', QueueEntry.Status.WAITING)
+        QueueEntry.objects.filter(pk=self.waiting.pk).update(arrival_time=self.old)
+
+    def test_moves_only_old_finished_entries(self):
+        from . import archive
+
+        self.assertEqual(archive.archive_finished(batch_size=2), 6)
+        self.assertEqual(set(QueueEntry.objects.values_list('pk', flat=True)), {self.recent_done.pk, self.waiting.pk})
+        archived = QueueEntryArchive.objects.get(pk=self.old_done[0].pk)
+        self.assertEqual((archived.patient_name, archived.status, archived.finished_at),
+                         ('old0', 'done', self.old_done[0].finished_at))
+        self.assertEqual(archived.effective_duration, timezone.timedelta(minutes=10))
+        self.assertTrue(QueueEntryArchive.objects.filter(pk=self.old_cancelled.pk).exists())
+        self.assertEqual(archive.archive_finished(), 0)
+
+    def test_prediction_and_dashboard_read_history(self):
+        from unittest import mock
+
+        from . import archive
+        from .services import dashboard_metrics
+
+        before = dashboard_metrics(self.hospital.pk)
+        predicted = PredictionService().predict_wait_time_minutes(self.hospital.pk)
+        with mock.patch('queueing.signals._broadcast') as broadcast:
+            archive.archive_finished()
+        broadcast.assert_not_called()
+
+        after = dashboard_metrics(self.hospital.pk)
+        self.assertEqual(after['queue'], before['queue'])
+        self.assertEqual(sum(h['completed'] for h in after['throughput']), 1)
+        # (4 + 10 + 10 + 10 + 10) / 5: the recent entry from the live table, the rest from history
+        self.assertEqual(PredictionService().predict_wait_time_minutes(self.hospital.pk), predicted)
+        self.assertEqual(predicted, 9)
+
+    def test_command_dry_run_and_cutoff(self):
+        import io
+
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        call_command('archive_queue', '--dry-run', stdout=out)
+        self.assertIn('6 queue entries', out.getvalue())
+        self.assertEqual(QueueEntryArchive.objects.count(), 0)
+        call_command('archive_queue', '--older-than-hours', '0', stdout=out)
+        self.assertIn('Archived 7', out.getvalue())
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(__import__('shutil').rmtree, self.root, True)
+        self.hospital = Hospital.objects.create(name='Test Hospital')
+        self.department = Department.objects.create(hospital=self.hospital, name='General')
+        self.june = timezone.datetime(2026, 6, 10, 9, 0, tzinfo=timezone.utc)
+        self.september = timezone.datetime(2026, 9, 2, 9, 0, tzinfo=timezone.utc)
+        entries = [
+            QueueEntry.objects.create(hospital=self.hospital, department=self.department, patient_name='a',
+                                      status=QueueEntry.Status.DONE, started_at=self.june,
+                                      finished_at=self.june + timezone.timedelta(minutes=12)),
+            QueueEntry.objects.create(hospital=self.hospital, patient_name='b', status=QueueEntry.Status.CANCELLED),
+            QueueEntry.objects.create(hospital=self.hospital, patient_name='c'),
+        ]
+        QueueEntry.objects.filter(pk__in=[e.pk for e in entries[:2]]).update(arrival_time=self.june)
+        QueueEntry.objects.filter(pk=entries[2].pk).update(arrival_time=self.september)
+        self.entries = entries
+
+    def export(self, now, **kwargs):
+        from . import snapshots
+
+        return list(snapshots.export(snapshots.DATASETS['queue'], root=self.root, now=now, **kwargs))
+
+    def test_partitions_load_as_memory_maps(self):
+        import numpy as np
+
+        from . import archive, snapshots
+
+        # Archived entries are exported with the live ones
+        archive.archive_finished(cutoff=self.september)
+        written = self.export(now=self.september)
+        self.assertEqual([(m['month'], m['rows']) for m in written],
+                         [('2026-06', 2), ('2026-07', 0), ('2026-08', 0), ('2026-09', 1)])
+
+        june = snapshots.open_partition('queue', '2026-06', root=self.root)
+        self.assertIsInstance(june['id'], np.memmap)
+        self.assertEqual(list(june['id']), [self.entries[0].pk, self.entries[1].pk])
+        self.assertEqual(list(june['department_id']), [self.department.pk, snapshots.MISSING_ID])
+        self.assertEqual(list(june.where('status', 'done')), [True, False])
+        waits = june['finished_at'] - june['started_at']
+        self.assertEqual(waits[0], np.timedelta64(12, 'm'))
+        self.assertTrue(np.isnat(june['finished_at'][1]))
+
+        columns = snapshots.load('queue', columns=['id', 'arrival_time'], root=self.root)
+        self.assertEqual(list(columns['id']), [e.pk for e in self.entries])
+        self.assertEqual(columns['arrival_time'][2], np.datetime64('2026-09-02T09:00:00'))
+
+    def test_entry_archived_between_reads_is_exported_once(self):
+        from . import snapshots
+        from .models import QueueEntryArchive
+
+        # As if archive_queue moved the entry after the live table was read
+        entry = QueueEntry.objects.filter(pk=self.entries[2].pk).values()[0]
+        QueueEntryArchive.objects.create(**{**entry, 'status': QueueEntry.Status.DONE})
+        written = self.export(now=self.september)
+        self.assertEqual(written[-1]['rows'], 1)
+        september = snapshots.open_partition('queue', '2026-09', root=self.root)
+        self.assertEqual(list(september['id']), [self.entries[2].pk])
+        self.assertEqual(list(september.where('status', 'done')), [True])
+
+    def test_settled_months_are_not_rewritten(self):
+        with self.settings(SNAPSHOTS={'SETTLE_DAYS': 30}):
+            self.export(now=self.september)
+            QueueEntry.objects.create(hospital=self.hospital, patient_name='late')
+            QueueEntry.objects.filter(patient_name='late').update(arrival_time=self.june)
+            # June and July have settled (30 days after they ended); the later months are rewritten
+            again = self.export(now=self.september)
+            self.assertEqual([m['month'] for m in again], ['2026-08', '2026-09'])
+            self.assertEqual(self.export(now=self.september, full=True)[0]['rows'], 3)
+
+    def test_command(self):
+        import io
+
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        call_command('snapshot_history', '--dataset', 'queue', '--since', '2026-09', '--dir', self.root, stdout=out)
+        self.assertIn('queue 2026-09: 1 rows (open)', out.getvalue())
+        self.assertNotIn('2026-08', out.getvalue())
+        self.assertIn('partitions written', out.getvalue())
+
+
+class DepartmentSubscriptionTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.hospital = Hospital.objects.create(name='Test Hospital')
+        self.cardiology = Department.objects.create(hospital=self.hospital, name='Cardiology')
+        self.radiology = Department.objects.create(hospital=self.hospital, name='Radiology')
+        self.elsewhere = Department.objects.create(hospital=Hospital.objects.create(name='Other'), name='ER')
+        self.sockets = []
+
+    async def connect(self, query=''):
+        # channels.testing needs daphne; asgiref's communicator is enough for one consumer
+        from asgiref.testing import ApplicationCommunicator
+        from channels.routing import URLRouter
+
+        from .routing import websocket_urlpatterns
+
+        scope = {'type': 'websocket', 'path': f'/ws/hospitals/{self.hospital.pk}/',
+                 'query_string': query.encode(), 'headers': [], 'subprotocols': []}
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(1))['type'], 'websocket.accept')
+        self.sockets.append(communicator)
+        return communicator
+
+    async def close_all(self):
+        for communicator in self.sockets:
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(1)
+
+    async def receive(self, communicator):
+        return json.loads((await communicator.receive_output(1))['text'])
+
+    async def send(self, communicator, message):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def add_patient(self, department):
+        from asgiref.sync import sync_to_async
+
+        await sync_to_async(QueueEntry.objects.create)(hospital=self.hospital, department=department,
+                                                       patient_name='p')
+
+    async def test_department_board_only_gets_its_department(self):
+        board = await self.connect(f'departments={self.cardiology.pk}')
+        lobby = await self.connect()
+        first = await self.receive(board)
+        self.assertEqual((first['department_id'], first['waiting_patients']), (self.cardiology.pk, 0))
+        self.assertNotIn('department_id', await self.receive(lobby))
+
+        await self.add_patient(self.radiology)
+        self.assertTrue(await board.receive_nothing())
+        self.assertEqual((await self.receive(lobby))['waiting_patients'], 1)
+
+        await self.add_patient(self.cardiology)
+        update = await self.receive(board)
+        self.assertEqual((update['department_id'], update['waiting_patients']), (self.cardiology.pk, 1))
+        self.assertEqual((await self.receive(lobby))['waiting_patients'], 2)
+        await self.close_all()
+
+    async def test_moving_an_entry_updates_both_departments(self):
+        from asgiref.sync import sync_to_async
+
+        await self.add_patient(self.cardiology)
+        cardiology = await self.connect(f'departments={self.cardiology.pk}')
+        radiology = await self.connect(f'departments={self.radiology.pk}')
+        self.assertEqual((await self.receive(cardiology))['waiting_patients'], 1)
+        self.assertEqual((await self.receive(radiology))['waiting_patients'], 0)
+
+        def move():
+            entry = QueueEntry.objects.get(department=self.cardiology)
+            entry.department = self.radiology
+            entry.save()
+
+        await sync_to_async(move)()
+        update = await self.receive(cardiology)
+        self.assertEqual((update['department_id'], update['waiting_patients']), (self.cardiology.pk, 0))
+        update = await self.receive(radiology)
+        self.assertEqual((update['department_id'], update['waiting_patients']), (self.radiology.pk, 1))
+        await self.close_all()
+
+    async def test_subscribe_and_unsubscribe_messages(self):
+        from . import live_groups
+
+        client = await self.connect()
+        await self.receive(client)
+
+        await self.send(client, {'type': 'subscribe', 'department_id': self.elsewhere.pk})
+        self.assertEqual((await self.receive(client))['type'], 'error')
+        await self.send(client, {'type': 'subscribe', 'department_id': self.radiology.pk})
+        self.assertEqual((await self.receive(client))['department_id'], self.radiology.pk)
+        await self.send(client, {'type': 'unsubscribe'})
+
+        await self.add_patient(self.radiology)
+        update = await self.receive(client)
+        self.assertEqual((update['department_id'], update['waiting_patients']), (self.radiology.pk, 1))
+        self.assertTrue(await client.receive_nothing())
+
+        await self.send(client, {'type': 'unsubscribe', 'department_id': self.radiology.pk})
+        await self.add_patient(self.radiology)
+        self.assertTrue(await client.receive_nothing())
+        self.assertFalse(live_groups.is_watched(self.hospital.pk, self.radiology.pk))
+        await self.close_all()
+
+    def test_unwatched_departments_get_no_snapshot(self):
+        from unittest import mock
+
+        with mock.patch('queueing.signals.live_status_snapshot', return_value={}) as snapshot:
+            QueueEntry.objects.create(hospital=self.hospital, department=self.cardiology, patient_name='p')
+        snapshot.assert_called_once_with(self.hospital.pk)
+
+
+class QueueEntryETATests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.hospital = Hospital.objects.create(name='Test Hospital')
+        self.department = Department.objects.create(hospital=self.hospital, name='Cardiology')
+        self.entries = [
+            QueueEntry.objects.create(hospital=self.hospital, department=self.department, patient_name=f'p{i}')
+            for i in range(3)
+        ]
+        self.sockets = []
+
+    async def connect(self, pk):
+        from asgiref.testing import ApplicationCommunicator
+        from channels.routing import URLRouter
+
+        from .routing import websocket_urlpatterns
+
+        scope = {'type': 'websocket', 'path': f'/ws/queue/{pk}/',
+                 'query_string': b'', 'headers': [], 'subprotocols': []}
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.sockets.append(communicator)
+        return communicator, await communicator.receive_output(1)
+
+    async def close_all(self):
+        for communicator in self.sockets:
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(1)
+
+    async def receive(self, communicator):
+        return json.loads((await communicator.receive_output(1))['text'])
+
+    async def test_pushes_position_only_when_it_changes(self):
+        from asgiref.sync import sync_to_async
+
+        first, last = self.entries[0], self.entries[2]
+        client, accepted = await self.connect(last.pk)
+        self.assertEqual(accepted['type'], 'websocket.accept')
+        initial = await self.receive(client)
+        self.assertEqual((initial['type'], initial['status'], initial['position']), ('eta', 'waiting', 3))
+
+        def start_first():
+            first.mark_started()
+            PredictionService().update_expected_finish_times(self.hospital.pk, self.department.pk)
+
+        await sync_to_async(start_first)()
+        update = await self.receive(client)
+        self.assertEqual((update['entry_id'], update['position']), (last.pk, 2))
+        self.assertIsNotNone(update['expected_finish'])
+
+        # Recomputing an unchanged queue pushes nothing
+        await sync_to_async(PredictionService().update_expected_finish_times)(self.hospital.pk, self.department.pk)
+        self.assertTrue(await client.receive_nothing())
+
+        await sync_to_async(last.mark_started)()
+        self.assertEqual(((await self.receive(client))['status'], last.pk), ('in_progress', last.pk))
+        await self.close_all()
+
+        from . import live_groups
+        self.assertEqual(live_groups.watched_entries(self.hospital.pk, [last.pk]), set())
+
+    async def test_unknown_entry_is_rejected(self):
+        _, message = await self.connect(10 ** 6)
+        self.assertEqual(message['type'], 'websocket.close')
+
+    def test_unwatched_entries_cost_no_channel_send(self):
+        from unittest import mock
+
+        from channels.layers import get_channel_layer
+
+        with mock.patch.object(get_channel_layer(), 'group_send') as group_send:
+            self.entries[0].mark_started()
+            PredictionService().update_expected_finish_times(self.hospital.pk, self.department.pk)
+        groups = [call.args[0] for call in group_send.call_args_list]
+        self.assertEqual([g for g in groups if g.startswith('queue_entry_')], [])
+
+    def test_position_in_patient_queue_view(self):
+        self.entries[0].mark_started()
+        response = self.client.get(f'/api/patient/queue/{self.entries[2].pk}/', secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['position'], 2)
+        response = self.client.get(f'/api/patient/queue/{self.entries[0].pk}/', secure=True)
+        self.assertIsNone(response.json()['position'])
+
+
+@override_settings(LIVE_STREAM={'HEARTBEAT_SECONDS': 0.05, 'MAX_SECONDS': 0.5, 'RETRY_MS': 3000})
+class LiveStatusStreamTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.hospital = Hospital.objects.create(name='Test Hospital')
+        self.cardiology = Department.objects.create(hospital=self.hospital, name='Cardiology')
+        self.radiology = Department.objects.create(hospital=self.hospital, name='Radiology')
+
+    async def open(self, query='', last_event_id=None):
+        headers = {'Last-Event-ID': last_event_id} if last_event_id else None
+        response = await self.async_client.get(
+            f'/api/status/{self.hospital.pk}/stream/{query}', secure=True, headers=headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertEqual(await self.next(stream), 'retry: 3000\n\n')
+        return stream
+
+    async def next(self, stream):
+        import asyncio
+
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        return chunk.decode()
+
+    async def close(self, stream):
+        # Read to the end (MAX_SECONDS), so the stream unsubscribes
+        return [chunk.decode() async for chunk in stream]
+
+    def parse(self, chunk):
+        fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+        return fields['id'], fields['event'], json.loads(fields['data'])
+
+    async def add_patient(self, department):
+        from asgiref.sync import sync_to_async
+
+        await sync_to_async(QueueEntry.objects.create)(hospital=self.hospital, department=department,
+                                                       patient_name='p')
+
+    async def test_snapshot_then_broadcasts_with_increasing_ids(self):
+        stream = await self.open()
+        first_id, kind, snapshot = self.parse(await self.next(stream))
+        self.assertEqual((kind, snapshot['type'], snapshot['waiting_patients']), ('status', 'status', 0))
+
+        await self.add_patient(self.cardiology)
+        chunk = await self.next(stream)
+        while chunk.startswith(':'):  # heartbeats in between
+            chunk = await self.next(stream)
+        update_id, _, update = self.parse(chunk)
+        self.assertEqual(update['waiting_patients'], 1)
+        self.assertGreater(int(update_id), int(first_id))
+        await self.close(stream)
+
+    async def test_resume_sends_snapshot_only_if_something_changed(self):
+        await self.add_patient(self.cardiology)
+        stream = await self.open()
+        last_id, _, _ = self.parse(await self.next(stream))
+        await self.close(stream)
+
+        stream = await self.open(last_event_id=last_id)
+        self.assertEqual(await self.next(stream), ': keep-alive\n\n')
+        await self.close(stream)
+
+        await self.add_patient(self.cardiology)
+        stream = await self.open(last_event_id=last_id)
+        self.assertEqual(self.parse(await self.next(stream))[2]['waiting_patients'], 2)
+        await self.close(stream)
+
+    async def test_department_stream(self):
+        from . import live_groups
+
+        stream = await self.open(f'?departments={self.cardiology.pk}')
+        self.assertEqual(self.parse(await self.next(stream))[2]['department_id'], self.cardiology.pk)
+        self.assertTrue(live_groups.is_watched(self.hospital.pk, self.cardiology.pk))
+
+        await self.add_patient(self.radiology)
+        self.assertEqual(await self.next(stream), ': keep-alive\n\n')
+        await self.add_patient(self.cardiology)
+        chunk = await self.next(stream)
+        while chunk.startswith(':'):
+            chunk = await self.next(stream)
+        self.assertEqual(self.parse(chunk)[2]['waiting_patients'], 1)
+        await self.close(stream)
+        self.assertFalse(live_groups.is_watched(self.hospital.pk, self.cardiology.pk))
+
+    @override_settings(LIVE_STREAM={'HEARTBEAT_SECONDS': 0.05, 'MAX_SECONDS': 0.12, 'RETRY_MS': 3000})
+    async def test_stream_ends_after_max_seconds(self):
+        stream = await self.open()
+        chunks = await self.close(stream)
+        self.assertEqual(self.parse(chunks[0])[1], 'status')
+        self.assertEqual(chunks[1:], [': keep-alive\n\n', ': keep-alive\n\n'])
+
+    def test_wsgi_gets_one_snapshot_and_bad_requests_are_rejected(self):
+        response = self.client.get(f'/api/status/{self.hospital.pk}/stream/', secure=True)
+        self.assertEqual(response.status_code, 200)
+        retry, chunk = response.content.decode().split('\n\n', 1)
+        self.assertEqual((retry, self.parse(chunk)[2]['waiting_patients']), ('retry: 3000', 0))
+
+        other = Department.objects.create(hospital=Hospital.objects.create(name='Other'), name='ER')
+        for path, status_code in [
+            (f'/api/status/{self.hospital.pk}/stream/?departments=x', 400),
+            (f'/api/status/{self.hospital.pk}/stream/?departments={other.pk}', 400),
+            ('/api/status/999999/stream/', 404),
+        ]:
+            self.assertEqual(self.client.get(path, secure=True).status_code, status_code, path)
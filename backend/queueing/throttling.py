@@ -0,0 +1,140 @@
+"""
+Shared sliding-window rate limiting.
+
+DRF's built-in throttles keep a list of request timestamps per client in the
+default cache: every check reads and rewrites the whole list, and with a
+per-process cache each worker enforces its own copy of the limit.
+
+SlidingWindowRateThrottle keeps two integer counters per client (the current
+and the previous fixed window) in the ``THROTTLE['CACHE']`` alias, so all
+workers share one limit: Redis whenever REDIS_URL is set, otherwise a
+file-based cache shared by the workers of the host (its increments are not
+atomic, so concurrent requests can occasionally undercount). A per-process
+cache would multiply the limit by the number of workers; the system check
+below warns about one. The request count over the last window is estimated
+by weighting the previous window by how much of it still overlaps:
+
+    estimate = previous * (1 - elapsed / window) + current
+
+Each check is one increment plus one read. Only allowed requests count: a
+rejected one is decremented again, so a client that keeps retrying gets in
+as soon as its earlier requests slide out of the window.
+
+The rate is picked per client tier: ``kiosk`` for requests from
+THROTTLE['KIOSK_IPS'], the user's role (``admin`` / ``patient``) when
+authenticated, ``anon`` otherwise. A view's ``throttle_scope`` overrides the
+tier, e.g. to keep login endpoints on the anonymous rate.
+"""
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from . import caches as shared_caches
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'120/minute' → (120, 60); None → (None, None)."""
+    if rate is None:
+        return None, None
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class SlidingWindowRateThrottle(BaseThrottle):
+    cache_prefix = 'throttle'
+    timer = time.time
+
+    def __init__(self):
+        config = getattr(settings, 'THROTTLE', {})
+        self.cache = caches[config.get('CACHE', 'default')]
+        self.kiosk_ips = set(config.get('KIOSK_IPS', ()))
+        self.rates = api_settings.DEFAULT_THROTTLE_RATES
+        self.wait_seconds = None
+
+    def get_tier(self, request):
+        if self.get_ident(request) in self.kiosk_ips:
+            return 'kiosk'
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            role = getattr(user, 'role', None)
+            return role if role in self.rates else 'user'
+        return 'anon'
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope in self.rates:
+            return scope
+        return self.get_tier(request)
+
+    def get_cache_key(self, request, scope):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and scope != 'kiosk':
+            ident = f'u{user.pk}'
+        else:
+            ident = self.get_ident(request)
+        return f'{self.cache_prefix}:{scope}:{ident}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        num_requests, duration = parse_rate(self.rates.get(scope))
+        if num_requests is None:
+            return True
+
+        now = self.timer()
+        window = int(now // duration)
+        elapsed = (now % duration) / duration
+        base = self.get_cache_key(request, scope)
+        current_key = f'{base}:{window}'
+
+        # The key must outlive the next window, where it serves as "previous"
+        if self.cache.add(current_key, 1, timeout=2 * duration):
+            current = 1
+        else:
+            try:
+                current = self.cache.incr(current_key)
+            except ValueError:  # expired between add and incr
+                self.cache.set(current_key, 1, timeout=2 * duration)
+                current = 1
+        previous = self.cache.get(f'{base}:{window - 1}', 0)
+
+        if previous * (1 - elapsed) + current <= num_requests:
+            return True
+        # Not counted: retries must not extend the lockout
+        try:
+            self.cache.decr(current_key)
+        except ValueError:
+            pass
+        self.wait_seconds = self._wait(num_requests, duration, elapsed, previous, current)
+        return False
+
+    @staticmethod
+    def _wait(num_requests, duration, elapsed, previous, current):
+        """Seconds until the estimate drops back under the limit."""
+        if current < num_requests and previous:
+            # Still in this window, once enough of the previous one has slid out
+            fraction = 1 - (num_requests - current) / previous
+            return max(0.0, (fraction - elapsed) * duration)
+        # Next window: this window's count becomes the weighted "previous"
+        fraction = max(0.0, 1 - num_requests / current)
+        return (1 - elapsed + fraction) * duration
+
+    def wait(self):
+        return self.wait_seconds
+
+
+@checks.register(checks.Tags.caches)
+def check_throttle_cache(app_configs, **kwargs):
+    alias = getattr(settings, 'THROTTLE', {}).get('CACHE', 'default')
+    if shared_caches.is_shared(alias):
+        return []
+    return [checks.Warning(
+        f"Rate-limit cache '{alias}' is private to each process, so every worker enforces its own limit.",
+        hint='Set REDIS_URL, or point THROTTLE["CACHE"] at a cache shared by all workers.',
+        id='queueing.W001',
+    )]
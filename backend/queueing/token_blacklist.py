@@ -0,0 +1,200 @@
+"""
+Bloom-filter-fronted refresh-token blacklist checks.
+
+simplejwt checks every refresh token against its blacklist tables with a
+join query, and with ROTATE_REFRESH_TOKENS + BLACKLIST_AFTER_ROTATION those
+tables gain a row on every refresh. Here each worker keeps a Bloom filter of
+blacklisted JTIs instead:
+
+* JTI not in the filter and not blacklisted in the last few minutes → not
+  blacklisted, no DB query. This is the common case.
+* JTI in the filter → confirmed with the exact DB query (real hit or a
+  rare false positive).
+
+The filter is kept current by an incremental load of new blacklist rows
+(by primary key) every TOKEN_BLACKLIST_FILTER['SYNC_SECONDS'], and rebuilt
+from scratch in a background thread every REBUILD_SECONDS so pruned tokens
+drop out and the filter is resized as the table grows. Tokens blacklisted
+since the last sync are covered by a short-lived key in the shared cache,
+set when the blacklist row is saved (see signals.py).
+
+That key only covers other workers if the cache is shared (Redis). With a
+per-process cache a token rotated or logged out in one worker would pass in
+another until its next sync, so there a filter miss is also checked in the
+database: the filter then only saves queries with REDIS_URL set.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView as BaseTokenRefreshView
+
+from . import caches as shared_caches
+
+logger = logging.getLogger(__name__)
+
+# A blacklist row is only skipped past once it is this old, so rows from
+# transactions that commit out of primary-key order are never missed
+COMMIT_MARGIN = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on BLAKE2b)."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def _recent_key(jti):
+    return f'careflow:blacklisted_jti:{jti}'
+
+
+class BlacklistFilter:
+    """Per-worker Bloom filter of blacklisted JTIs; see the module docstring."""
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001, sync_interval=60, rebuild_interval=3600):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._bloom = None
+        self._watermark = 0
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    @property
+    def recent_ttl(self):
+        """How long a fresh blacklist entry must be visible through the cache."""
+        return 2 * self.sync_interval + int(COMMIT_MARGIN.total_seconds())
+
+    def mark_blacklisted(self, jti):
+        cache.set(_recent_key(jti), 1, timeout=self.recent_ttl)
+
+    def _load(self, bloom, rows, watermark):
+        """Add ``(id, jti, blacklisted_at)`` rows; return the new watermark."""
+        cutoff = timezone.now() - COMMIT_MARGIN
+        advancing = True
+        for pk, jti, blacklisted_at in rows:
+            bloom.add(jti)
+            if advancing and blacklisted_at < cutoff:
+                watermark = pk
+            else:
+                advancing = False
+        return watermark
+
+    def rebuild(self):
+        """Build a new filter from every unexpired blacklisted token and swap it in."""
+        started = time.monotonic()
+        live = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        bloom = BloomFilter(max(self.capacity, 2 * live.count()), self.error_rate)
+        rows = live.order_by('id').values_list('id', 'token__jti', 'blacklisted_at').iterator(chunk_size=10000)
+        watermark = self._load(bloom, rows, 0)
+        with self._lock:
+            self._bloom, self._watermark = bloom, watermark
+            self._synced_at = self._built_at = started
+
+    def sync(self):
+        """Add blacklist rows created since the last load."""
+        with self._lock:
+            bloom, watermark = self._bloom, self._watermark
+            self._synced_at = time.monotonic()
+        rows = BlacklistedToken.objects.filter(id__gt=watermark).order_by('id').values_list(
+            'id', 'token__jti', 'blacklisted_at',
+        )
+        watermark = self._load(bloom, rows, watermark)
+        with self._lock:
+            if self._bloom is bloom:
+                self._watermark = max(self._watermark, watermark)
+            if bloom.count > bloom.capacity:
+                self._built_at = 0.0  # overfull: rebuild at the next check
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Token blacklist filter rebuild failed')
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def _current(self):
+        now = time.monotonic()
+        with self._lock:
+            bloom = self._bloom
+            rebuild = not self._rebuilding and now - self._built_at >= self.rebuild_interval
+            if rebuild:
+                self._rebuilding = True
+            sync = bloom is not None and now - self._synced_at >= self.sync_interval
+            if sync:
+                self._synced_at = now  # one sync per interval, not one per waiting thread
+        if rebuild:
+            threading.Thread(target=self._rebuild_in_background, daemon=True, name='blacklist-filter').start()
+        if sync:
+            self.sync()
+        return bloom
+
+    def is_blacklisted(self, jti):
+        bloom = self._current()
+        if bloom is not None and jti not in bloom and shared_caches.is_shared():
+            return cache.get(_recent_key(jti)) is not None
+        # Not built yet, a possible hit, or other workers' recent entries unseen: ask the database
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+_filter_settings = getattr(settings, 'TOKEN_BLACKLIST_FILTER', {})
+blacklist_filter = BlacklistFilter(
+    capacity=_filter_settings.get('CAPACITY', 1_000_000),
+    error_rate=_filter_settings.get('ERROR_RATE', 0.001),
+    sync_interval=_filter_settings.get('SYNC_SECONDS', 60),
+    rebuild_interval=_filter_settings.get('REBUILD_SECONDS', 3600),
+)
+
+
+class RefreshToken(BaseRefreshToken):
+    """Refresh token whose blacklist check goes through ``blacklist_filter``."""
+
+    def check_blacklist(self):
+        if blacklist_filter.is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+class TokenRefreshView(BaseTokenRefreshView):
+    serializer_class = TokenRefreshSerializer
@@ -7,6 +7,7 @@ from .views import (
     DepartmentViewSet,
     HospitalViewSet,
     LiveStatusView,
+    LiveStatusStreamView,
     QueueEntryViewSet,
     DashboardView,
     PatientQueueView,
@@ -22,6 +23,7 @@ router.register(r'appointments', AppointmentSlotViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('status/<int:hospital_id>/', LiveStatusView.as_view(), name='live-status'),
+    path('status/<int:hospital_id>/stream/', LiveStatusStreamView.as_view(), name='live-status-stream'),
     path('dashboard/<int:hospital_id>/', DashboardView.as_view(), name='dashboard'),
     path('patient/queue/<int:pk>/', PatientQueueView.as_view(), name='patient-queue'),
 ]
@@ -1,9 +1,13 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework import viewsets, status as http_status
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import eta, live_groups, sse
 from .models import AppointmentSlot, Bed, Department, Hospital, QueueEntry
 from .serializers import (
     AppointmentSlotSerializer,
@@ -13,7 +17,11 @@ from .serializers import (
     LiveStatusSerializer,
     QueueEntrySerializer,
     DashboardSerializer,
+    requested_names,
 )
+from .projections import Projection
+from .renderers import ORJSONRenderer
+from .response_cache import versioned_cache
 from .services import PredictionService, live_status_snapshot, dashboard_metrics
 
 
@@ -26,13 +34,44 @@ class ReadOnlyOrAuthenticatedMixin:
         return [IsAuthenticated()]
 
 
+class EagerLoadingMixin:
+    """Eager-load only what the request's ?fields= / ?expand= select (SparseFieldsetMixin)."""
+
+    def get_queryset(self):
+        return self.get_serializer_class().setup_eager_loading(super().get_queryset(), self.request)
+
+
+class FastListMixin(EagerLoadingMixin):
+    """
+    List through a values() projection of the serializer (see projections.py),
+    rendered by orjson. ?fields= narrows the projection; ?expand= takes the
+    regular serializer path.
+    """
+    renderer_classes = [ORJSONRenderer]
+
+    def list(self, request, *args, **kwargs):
+        if requested_names(request, 'expand'):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        projection = Projection.for_serializer(self.get_serializer_class(), requested_names(request, 'fields'))
+        return Response(projection.rows(queryset))
+
+
 class HospitalViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
     queryset = Hospital.objects.all().order_by('name')
     serializer_class = HospitalSerializer
 
+    @versioned_cache(('hospital',))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @versioned_cache(('hospital',))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class DepartmentViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
-    queryset = Department.objects.select_related('hospital').all()
+
+class DepartmentViewSet(EagerLoadingMixin, ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
+    queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
 
     def get_queryset(self):
@@ -42,9 +81,17 @@ class DepartmentViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
             qs = qs.filter(hospital_id=hospital_id)
         return qs
 
+    @versioned_cache(('hospital', 'department'), query_params=('hospital',))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @versioned_cache(('hospital', 'department'))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class BedViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
-    queryset = Bed.objects.select_related('hospital', 'department').all()
+
+class BedViewSet(FastListMixin, ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
+    queryset = Bed.objects.all()
     serializer_class = BedSerializer
 
     def get_queryset(self):
@@ -55,8 +102,8 @@ class BedViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
         return qs
 
 
-class QueueEntryViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
-    queryset = QueueEntry.objects.select_related('hospital', 'department').all()
+class QueueEntryViewSet(FastListMixin, ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
+    queryset = QueueEntry.objects.all()
     serializer_class = QueueEntrySerializer
 
     def get_queryset(self):
@@ -77,6 +124,18 @@ class QueueEntryViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
         PredictionService().update_expected_finish_times(entry.hospital_id, entry.department_id)
         return entry
 
+    def perform_update(self, serializer):
+        before = (serializer.instance.hospital_id, serializer.instance.department_id)
+        entry = serializer.save()
+        # A status or department change reorders the queue(s): recompute ETAs (and push them, eta.py)
+        for hospital_id, department_id in {before, (entry.hospital_id, entry.department_id)}:
+            PredictionService().update_expected_finish_times(hospital_id, department_id)
+
+    def perform_destroy(self, instance):
+        hospital_id, department_id = instance.hospital_id, instance.department_id
+        instance.delete()
+        PredictionService().update_expected_finish_times(hospital_id, department_id)
+
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
         entry = self.get_object()
@@ -92,8 +151,8 @@ class QueueEntryViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
         return Response(self.get_serializer(entry).data)
 
 
-class AppointmentSlotViewSet(ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
-    queryset = AppointmentSlot.objects.select_related('hospital', 'department').all()
+class AppointmentSlotViewSet(FastListMixin, ReadOnlyOrAuthenticatedMixin, viewsets.ModelViewSet):
+    queryset = AppointmentSlot.objects.all()
     serializer_class = AppointmentSlotSerializer
 
     def get_queryset(self):
@@ -122,6 +181,45 @@ class LiveStatusView(APIView):
         return Response(LiveStatusSerializer(data).data)
 
 
+class LiveStatusStreamView(View):
+    """
+    LiveStatusView pushed as Server-Sent Events (sse.py); public like it.
+    ``?departments=3,4`` streams those departments' snapshots instead.
+    """
+
+    async def get(self, request, hospital_id: int):
+        department_ids = set()
+        if 'departments' in request.GET:
+            department_ids = live_groups.department_ids(request.GET['departments'].split(','))
+            if not department_ids:
+                return JsonResponse({'detail': 'departments must be comma-separated integers'}, status=400)
+            if len(department_ids) > live_groups.MAX_DEPARTMENTS:
+                return JsonResponse(
+                    {'detail': f'At most {live_groups.MAX_DEPARTMENTS} departments per stream'}, status=400,
+                )
+        if not await Hospital.objects.filter(pk=hospital_id).aexists():
+            return JsonResponse({'detail': 'Not found'}, status=404)
+        if department_ids:
+            found = Department.objects.filter(hospital_id=hospital_id, pk__in=department_ids)
+            missing = department_ids - {pk async for pk in found.values_list('pk', flat=True)}
+            if missing:
+                return JsonResponse(
+                    {'detail': f"No department {', '.join(map(str, sorted(missing)))} in this hospital"}, status=400,
+                )
+
+        # Under WSGI a stream would hold a worker: send the snapshot and let the browser reconnect
+        follow = isinstance(request, ASGIRequest)
+        events = sse.status_events(hospital_id, sorted(department_ids), request.headers.get('Last-Event-ID'), follow)
+        if follow:
+            response = StreamingHttpResponse(events, content_type='text/event-stream')
+        else:
+            response = HttpResponse(''.join([chunk async for chunk in events]), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # nginx and similar proxies would otherwise buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class DashboardView(APIView):
     """Admin-friendly metrics for charts/visualizations."""
     permission_classes = [AllowAny]
@@ -132,12 +230,15 @@ class DashboardView(APIView):
 
 
 class PatientQueueView(APIView):
-    """Let a patient check their queue status and ETA by queue id."""
+    """
+    Let a patient check their queue status, position and ETA by queue id.
+    ws/queue/<pk>/ pushes the same position and ETA as they change.
+    """
     permission_classes = [AllowAny]
 
     def get(self, request, pk: int):
         try:
-            entry = QueueEntry.objects.get(pk=pk)
+            entry = QueueEntry.objects.select_related('hospital', 'department').get(pk=pk)
         except QueueEntry.DoesNotExist:
             return Response({'detail': 'Not found'}, status=http_status.HTTP_404_NOT_FOUND)
-        return Response(QueueEntrySerializer(entry).data)
+        return Response({**QueueEntrySerializer(entry).data, 'position': eta.position(entry)})